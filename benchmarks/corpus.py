@@ -0,0 +1,145 @@
+"""
+解析器基准语料：合成的中文电子发票（PDF/OFD，多种版式）与发票通知邮件HTML正文，附期望字段。
+
+语料按种子确定性生成；也可用 --corpus DIR 追加脱敏后的真实样本，
+DIR/manifest.json 格式与 dump_corpus 写出的相同：
+    [{"name": "a.pdf", "kind": "pdf", "expected": {"date": "20250105", ...}}, ...]
+"""
+
+import json
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from synthetic import SERVICES, make_invoice_ofd, make_invoice_pdf
+
+# 在 synthetic.SERVICES 之外补充的服务名称，覆盖分类规则中的其他关键词
+EXTRA_SERVICES = [
+    ("*经纪代理服务*火车票代订费", "飞机火车发票"),
+    ("*餐饮服务*外卖", "餐饮发票"),
+    ("*住宿服务*酒店住宿费", "住宿发票"),
+    ("*现代服务*网约车服务费", "打车发票"),
+    ("*办公用品*打印纸", "其他发票"),
+]
+
+KINDS = ("pdf", "ofd", "html")
+
+
+@dataclass
+class CorpusItem:
+    name: str
+    kind: str           # pdf / ofd / html
+    data: bytes
+    expected: dict      # 发票：date/amount/service/category/invoice_number[/invoice_code/seller_tax_id]；HTML：urls
+
+
+def _tax_id(rng: random.Random) -> str:
+    return "91" + "".join(rng.choice("0123456789ABCDEFGHJKLMNPQRTUWXY") for _ in range(16))
+
+
+def _invoice_lines(rng: random.Random, seq: int, layout: str) -> tuple[list[str], dict]:
+    """按版式生成发票文本行与期望字段"""
+    service, category = rng.choice(SERVICES + EXTRA_SERVICES)
+    day = datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 364))
+    cents = rng.randint(100, 5_000_000)
+    amount = f"{cents / 100:.2f}"
+    buyer, seller = _tax_id(rng), _tax_id(rng)
+    expected = {
+        "date": day.strftime("%Y%m%d"),
+        "amount": amount,
+        "service": service.split("*")[-1],
+        "category": category,
+        "seller_tax_id": seller,
+    }
+
+    if layout == "legacy":
+        # 增值税电子普通发票：发票代码 + 8位号码，日期用横线分隔，金额带千分位
+        number, code = f"{10000000 + seq:08d}", f"0310012{seq:05d}"
+        expected.update(invoice_number=number, invoice_code=code)
+        lines = [
+            "增值税电子普通发票",
+            f"发票代码:{code}",
+            f"发票号码:{number}",
+            f"开票日期:{day.strftime('%Y-%m-%d')}",
+            f"购买方 纳税人识别号:{buyer}",
+            f"{service}  1  {amount}",
+            f"价税合计（大写）略  （小写）￥{cents / 100:,.2f}",
+            f"销售方 纳税人识别号:{seller}",
+        ]
+    else:
+        # 全电发票：20位号码，无发票代码；compact 版式日期不补零、金额行无货币符号
+        number = f"{25000000000000000000 + seq}"
+        expected.update(invoice_number=number, invoice_code="")
+        date_text = f"{day.year}年{day.month}月{day.day}日" if layout == "compact" else day.strftime("%Y年%m月%d日")
+        total = f"价税合计 {amount}" if layout == "compact" else f"价税合计（大写）略  （小写）¥{amount}"
+        lines = [
+            "电子发票（普通发票）",
+            f"发票号码：{number}",
+            f"开票日期：{date_text}",
+            f"购买方信息 统一社会信用代码/纳税人识别号：{buyer}",
+            f"销售方信息 统一社会信用代码/纳税人识别号：{seller}",
+            f"{service}  1  {amount}",
+            total,
+        ]
+    return lines, expected
+
+
+def _html_body(rng: random.Random, seq: int) -> tuple[str, list[str]]:
+    """发票通知邮件HTML正文：有效下载链接 + 平台首页、Logo图片、XML格式等应被过滤的链接"""
+    number = f"{25000000000000000000 + seq}"
+    candidates = [
+        f"https://fp.baiwang.com/download/{number}.pdf",
+        f"https://nnfp.nuonuocs.cn/invoice/{number}?Wjgs=PDF",
+        f"https://www.fapiao.com.cn/dl/{number}.ofd",
+        f"https://dppt.chinatax.gov.cn/kpfw/fpjfzz/v1/exportDzfpwjEwm?Wjgs=PDF&Fphm={number}",
+        f"https://vpiaotong.com/file/{number}?Wjgs=OFD",
+        f"https://static.example.com/invoice/{number}.pdf",
+    ]
+    urls = rng.sample(candidates, rng.randint(1, 2))
+    noise = [
+        '<img src="https://www.baiwang.com/static/logo.png">',
+        '<a href="https://www.nuonuo.com/">诺诺网首页</a>',
+        f'<a href="https://dppt.chinatax.gov.cn/kpfw/fpjfzz/v1/exportDzfpwjEwm?Fphm={number}&Wjgs=XML">XML</a>',
+        '<a href="https://bmjc.nuonuo.com/scan?code=abc">扫码查验</a>',
+    ]
+    links = "".join(f'<p>请点击 <a href="{u}">下载发票</a></p>' for u in urls)
+    filler = "<p>尊敬的客户：您好！您的电子发票已开具，请妥善保管。</p>" * rng.randint(1, 20)
+    body = (
+        '<html><head><meta charset="utf-8"><style>p{margin:0}</style></head><body>'
+        f"{filler}{rng.choice(noise)}{links}{rng.choice(noise)}</body></html>"
+    )
+    return body, urls
+
+
+def build_corpus(per_kind: int = 30, seed: int = 7) -> list[CorpusItem]:
+    """每种类型 per_kind 个样本，发票在 standard/compact/legacy 三种版式间轮换"""
+    rng = random.Random(seed)
+    layouts = ("standard", "compact", "legacy")
+    items: list[CorpusItem] = []
+    for kind, make in (("pdf", make_invoice_pdf), ("ofd", make_invoice_ofd)):
+        for i in range(per_kind):
+            layout = layouts[i % len(layouts)]
+            lines, expected = _invoice_lines(rng, len(items), layout)
+            items.append(CorpusItem(f"{kind}_{layout}_{i:03d}.{kind}", kind, make(lines), expected))
+    for i in range(per_kind):
+        body, urls = _html_body(rng, i)
+        items.append(CorpusItem(f"mail_{i:03d}.html", "html", body.encode("utf-8"), {"urls": urls}))
+    return items
+
+
+def load_corpus_dir(directory: Path) -> list[CorpusItem]:
+    manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    return [
+        CorpusItem(entry["name"], entry["kind"], (directory / entry["name"]).read_bytes(), entry["expected"])
+        for entry in manifest
+    ]
+
+
+def dump_corpus(items: list[CorpusItem], directory: Path):
+    """写出语料文件与 manifest.json（可作为添加真实样本的模板）"""
+    directory.mkdir(parents=True, exist_ok=True)
+    for item in items:
+        (directory / item.name).write_bytes(item.data)
+    manifest = [{"name": item.name, "kind": item.kind, "expected": item.expected} for item in items]
+    (directory / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
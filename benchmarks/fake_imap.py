@@ -0,0 +1,326 @@
+"""进程内IMAP服务替身：明文TCP，实现 IMAPClient 用到的命令子集"""
+
+import base64
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email import message_from_bytes, policy
+from email.message import Message
+from urllib.parse import quote
+
+from synthetic import SyntheticMessage
+
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|\([^)]*\)|\S+')
+
+
+# 不计入限流的命令（登录/登出）
+_UNMETERED = {b"CAPABILITY", b"LOGIN", b"LOGOUT", b"NOOP"}
+
+# 按名称为 LIST 附加 SPECIAL-USE 属性（RFC 6154）
+_SPECIAL_USE = {"trash": "\\Trash", "junk": "\\Junk", "drafts": "\\Drafts", "sent": "\\Sent"}
+
+
+def _encode_mutf7(name: str) -> str:
+    """文件夹名 → 修改版UTF-7（RFC 3501 5.1.3），独立于客户端的实现"""
+    def encode(m: re.Match) -> str:
+        if m.group(0) == "&":
+            return "&-"
+        data = base64.b64encode(m.group(0).encode("utf-16-be")).decode("ascii")
+        return "&" + data.rstrip("=").replace("/", ",") + "-"
+
+    return re.sub(r"&|[^\x20-\x7e]+", encode, name)
+
+
+def _decode_mutf7(name: str) -> str:
+    def decode(m: re.Match) -> str:
+        if not m.group(1):
+            return "&"
+        data = m.group(1).replace(",", "/")
+        return base64.b64decode(data + "=" * (-len(data) % 4)).decode("utf-16-be")
+
+    return re.sub(r"&([^-]*)-", decode, name)
+
+
+def _unquote(token: bytes) -> str:
+    if token.startswith(b'"') and token.endswith(b'"'):
+        token = re.sub(rb"\\(.)", rb"\1", token[1:-1])
+    return token.decode("utf-8", errors="replace")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "FakeIMAPServer"
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.selected: str | None = None
+        self._send(b"* OK FakeIMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tokens = _TOKEN.findall(line.rstrip(b"\r\n"))
+            if len(tokens) < 2:
+                continue
+            tag, command, args = tokens[0], tokens[1].upper(), tokens[2:]
+            if command == b"UID" and args:
+                command, args = b"UID " + args[0].upper(), args[1:]
+            self.server.record(command.decode())
+            if command not in _UNMETERED and not self.server.admit():
+                if self.server.throttle_mode == "drop":
+                    return  # 不回复直接断开，模拟QQ邮箱的静默断连
+                self._send(tag + b" NO [UNAVAILABLE] Too many commands, try again later")
+                continue
+            handler = getattr(self, "cmd_" + command.decode().replace(" ", "_"), None)
+            if handler is None:
+                self._send(tag + b" BAD unsupported command")
+                continue
+            if handler(tag, args) is False:
+                return
+
+    def _mailbox_arg(self, args) -> str:
+        """命令中的文件夹名：去引号并解码修改版UTF-7"""
+        return _decode_mutf7(_unquote(args[0])) if args else ""
+
+    def _send(self, data: bytes):
+        self.wfile.write(data + b"\r\n")
+
+    def cmd_CAPABILITY(self, tag, args):
+        self._send(b"* CAPABILITY IMAP4rev1 SPECIAL-USE")
+        self._send(tag + b" OK CAPABILITY completed")
+
+    def cmd_NOOP(self, tag, args):
+        self._send(tag + b" OK NOOP completed")
+
+    def cmd_LOGIN(self, tag, args):
+        self._send(tag + b" OK LOGIN completed")
+
+    def cmd_LOGOUT(self, tag, args):
+        self._send(b"* BYE logging out")
+        self._send(tag + b" OK LOGOUT completed")
+        return False
+
+    def cmd_LIST(self, tag, args):
+        for name in self.server.mailbox:
+            flags = " ".join(filter(None, ["\\HasNoChildren", _SPECIAL_USE.get(name.rsplit("/", 1)[-1].lower())]))
+            quoted = _encode_mutf7(name).replace("\\", "\\\\").replace('"', '\\"')
+            self._send(f'* LIST ({flags}) "/" "{quoted}"'.encode())
+        self._send(tag + b" OK LIST completed")
+
+    def cmd_STATUS(self, tag, args):
+        raw = _unquote(args[0]) if args else ""
+        messages = self.server.mailbox.get(self._mailbox_arg(args))
+        if messages is None:
+            self._send(tag + b" NO no such mailbox")
+            return
+        uidnext = (messages[-1].uid + 1) if messages else 1
+        quoted = raw.replace("\\", "\\\\").replace('"', '\\"')
+        self._send(f'* STATUS "{quoted}" (MESSAGES {len(messages)} UIDNEXT {uidnext} UIDVALIDITY 1)'.encode())
+        self._send(tag + b" OK STATUS completed")
+
+    def cmd_EXAMINE(self, tag, args):
+        name = self._mailbox_arg(args)
+        messages = self.server.mailbox.get(name)
+        if messages is None:
+            self.selected = None
+            self._send(tag + b" NO no such mailbox")
+            return
+        self.selected = name
+        uidnext = (messages[-1].uid + 1) if messages else 1
+        self._send(b"* %d EXISTS" % len(messages))
+        self._send(b"* OK [UIDVALIDITY 1] UIDs valid")
+        self._send(b"* OK [UIDNEXT %d] predicted next UID" % uidnext)
+        self._send(tag + b" OK [READ-ONLY] EXAMINE completed")
+
+    cmd_SELECT = cmd_EXAMINE
+
+    def cmd_UID_SEARCH(self, tag, args):
+        messages = self._selected_messages()
+        criteria = b" ".join(args).strip(b"()")
+        since = re.search(rb'SINCE\s+"?(\d{1,2}-\w{3}-\d{4})"?', criteria, re.IGNORECASE)
+        if since:
+            since_date = datetime.strptime(since.group(1).decode(), "%d-%b-%Y").date()
+            messages = [m for m in messages if m.internal_date.date() >= since_date]
+        self._send(b"* SEARCH " + b" ".join(str(m.uid).encode() for m in messages))
+        self._send(tag + b" OK SEARCH completed")
+
+    def cmd_UID_FETCH(self, tag, args):
+        wanted = _uid_matcher(args[0].decode() if args else "")
+        items = b" ".join(args[1:]).upper()
+        for seq, msg in enumerate(self._selected_messages(), 1):
+            if not wanted(msg.uid):
+                continue
+            if re.search(rb"\bRFC822\b(?![.])", items):
+                self.server.bytes_sent += len(msg.raw)
+                self.wfile.write(b"* %d FETCH (UID %d RFC822 {%d}\r\n" % (seq, msg.uid, len(msg.raw)))
+                self.wfile.write(msg.raw)
+                self._send(b")")
+            else:
+                self._send_items(seq, msg, items)
+        self._send(tag + b" OK FETCH completed")
+
+    def _send_items(self, seq: int, msg: SyntheticMessage, items: bytes):
+        """RFC822.SIZE / BODYSTRUCTURE / BODY.PEEK[HEADER.FIELDS (...)] / BODY.PEEK[section]"""
+        parsed = message_from_bytes(msg.raw, policy=policy.compat32)
+        out = b"* %d FETCH (UID %d" % (seq, msg.uid)
+        if b"RFC822.SIZE" in items:
+            out += b" RFC822.SIZE %d" % len(msg.raw)
+        if b"BODYSTRUCTURE" in items:
+            out += b" BODYSTRUCTURE " + _bodystructure(parsed)
+        for spec in re.findall(rb"BODY(?:\.PEEK)?\[([^\]]*)\]", items):
+            if spec.startswith(b"HEADER.FIELDS"):
+                names = re.findall(rb"[\w-]+", spec[len(b"HEADER.FIELDS"):])
+                payload = b"".join(
+                    f"{name.decode()}: {parsed[name.decode()]}\r\n".encode()
+                    for name in names if parsed[name.decode()] is not None
+                ) + b"\r\n"
+            else:
+                part = _sections(parsed).get(spec.decode())
+                payload = _raw_payload(part) if part is not None else b""
+            self.server.bytes_sent += len(payload)
+            self.wfile.write(out + b" BODY[%s] {%d}\r\n" % (spec, len(payload)))
+            self.wfile.write(payload)
+            out = b""
+        self._send(out + b")")
+
+    def _selected_messages(self) -> list[SyntheticMessage]:
+        return self.server.mailbox.get(self.selected or "", [])
+
+
+def _uid_matcher(spec: str):
+    """解析UID集合（如 1,3:5,7:*），返回判定函数"""
+    ranges: list[tuple[int, int]] = []
+    for piece in spec.split(","):
+        if ":" in piece:
+            lo, hi = piece.split(":", 1)
+            ranges.append((int(lo), 2**32 if hi == "*" else int(hi)))
+        elif piece.isdigit():
+            ranges.append((int(piece), int(piece)))
+    return lambda uid: any(lo <= uid <= hi for lo, hi in ranges)
+
+
+def _quote(value: str | None) -> bytes:
+    if value is None:
+        return b"NIL"
+    if value.isascii():
+        return b'"' + value.replace("\\", "\\\\").replace('"', '\\"').encode() + b'"'
+    data = value.encode("utf-8")
+    return b"{%d}\r\n" % len(data) + data
+
+
+def _params(pairs: list[tuple[str, str | tuple]]) -> bytes:
+    if not pairs:
+        return b"NIL"
+    items = []
+    for key, value in pairs:
+        if isinstance(value, tuple):  # RFC 2231 编码的参数按原样（key*）返回
+            charset, language, value = value  # 标准库已按latin-1还原百分号编码
+            encoded = quote(value.encode("latin-1"), safe="")
+            key, value = f"{key}*", f"{charset or ''}'{language or ''}'{encoded}"
+        items.append(_quote(key) + b" " + _quote(value))
+    return b"(" + b" ".join(items) + b")"
+
+
+def _bodystructure(part: Message) -> bytes:
+    """由标准库解析结果生成BODYSTRUCTURE（含扩展数据中的 Content-Disposition）"""
+    if part.is_multipart() and part.get_content_maintype() == "multipart":
+        children = b"".join(_bodystructure(child) for child in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype()) + b" NIL NIL NIL NIL)"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    params = [(k, v) for k, v in (part.get_params() or [])[1:]]
+    encoding = part.get("Content-Transfer-Encoding", "7bit")
+    body = _raw_payload(part)
+    fields = [_quote(maintype), _quote(subtype), _params(params), b"NIL", b"NIL",
+              _quote(encoding), b"%d" % len(body)]
+    if maintype == "message" and subtype == "rfc822":
+        inner = part.get_payload()[0]
+        fields += [b"NIL", _bodystructure(inner), b"%d" % body.count(b"\n")]
+    elif maintype == "text":
+        fields.append(b"%d" % body.count(b"\n"))
+    disposition = part.get("Content-Disposition")
+    if disposition:
+        dtype = disposition.split(";", 1)[0].strip()
+        dparams = (part.get_params(header="content-disposition") or [])[1:]
+        fields += [b"NIL", b"(" + _quote(dtype) + b" " + _params(dparams) + b")"]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _sections(msg: Message) -> dict[str, Message]:
+    """IMAP部分编号 → 叶子部分（与 BODYSTRUCTURE 的编号方式一致）"""
+    result: dict[str, Message] = {}
+
+    def walk(part: Message, section: str):
+        if part.get_content_maintype() == "multipart":
+            for index, child in enumerate(part.get_payload(), 1):
+                walk(child, f"{section}.{index}" if section else str(index))
+        elif part.get_content_type() == "message/rfc822":
+            inner = part.get_payload()[0]
+            walk(inner, section if inner.get_content_maintype() == "multipart" else f"{section}.1")
+        else:
+            result[section or "1"] = part
+
+    walk(msg, "")
+    return result
+
+
+def _raw_payload(part: Message) -> bytes:
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        return b"".join(_raw_payload(p) for p in payload)
+    return payload.encode("utf-8", errors="surrogateescape") if isinstance(payload, str) else payload
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """在后台线程中运行的IMAP替身，mailbox 为 {folder: [SyntheticMessage]}"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: dict[str, list[SyntheticMessage]], host: str = "127.0.0.1", port: int = 0,
+                 throttle_rate: float | None = None, throttle_mode: str = "no"):
+        """
+        throttle_rate: 每秒允许的命令数（令牌桶，容量为1秒的量），超出时按 throttle_mode 处理：
+        "no" 回复 NO [UNAVAILABLE]，"drop" 直接断开连接。None 为不限流。
+        """
+        super().__init__((host, port), _Handler)
+        self.mailbox = mailbox
+        self.commands: dict[str, int] = {}
+        self.bytes_sent = 0
+        self.throttle_rate = throttle_rate
+        self.throttle_mode = throttle_mode
+        self.throttled = 0
+        self._tokens = throttle_rate or 0.0
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, command: str):
+        with self._lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+
+    def admit(self) -> bool:
+        if not self.throttle_rate:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.throttle_rate, self._tokens + (now - self._refilled) * self.throttle_rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.throttled += 1
+            return False
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,91 @@
+"""本地发票平台替身：以HTTP代理方式接管 baiwang/nuonuo/fapiao.com.cn 等域名的请求"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from synthetic import InvoiceSpec, render_invoice
+
+_INVOICE_ID = re.compile(r"(\d{20})")
+# 预览页（需要浏览器点击下载）：各平台的 /v/、/view/、/preview/、/scan/、/h5/ 页面，
+# 以及缺少 Wjgs 参数的税局导出接口
+_PREVIEW = re.compile(r"/(?:v|view|preview|scan|h5)/|/exportDzfpwjEwm\?(?![^#]*\bwjgs=)", re.IGNORECASE)
+_PREVIEW_PAGE = "<html><body><p>电子发票</p><button>下载</button></body></html>".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakePlatformServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # 经代理转发时请求行为绝对URL，直连时为路径
+        url = self.path if self.path.startswith("http") else f"http://{self.headers.get('Host', '')}{self.path}"
+        parts = urlsplit(url)
+        self.server.record(parts.hostname or "")
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+
+        match = _INVOICE_ID.search(parts.path + "?" + parts.query)
+        spec = self.server.invoices.get(match.group(1)) if match else None
+        if spec is None:
+            self._reply(404, "text/plain", b"not found")
+            return
+
+        if _PREVIEW.search(parts.path + "?" + parts.query):
+            self.server.previews += 1
+            self._reply(200, "text/html; charset=utf-8", _PREVIEW_PAGE)
+            return
+
+        target = (parts.path + "?" + parts.query).lower()
+        fmt = "ofd" if ".ofd" in target or "wjgs=ofd" in target or "type=ofd" in target else "pdf"
+        body = render_invoice(spec, fmt)
+        content_type = "application/ofd" if fmt == "ofd" else "application/pdf"
+        self.server.bytes_sent += len(body)
+        self._reply(200, content_type, body)
+
+    def _reply(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakePlatformServer(ThreadingHTTPServer):
+    """
+    按URL中的20位发票号返回对应PDF/OFD，预览页URL返回HTML；作为 HTTP_PROXY 使用即可覆盖任意平台域名
+    """
+
+    daemon_threads = True
+
+    def __init__(self, invoices: dict[str, InvoiceSpec], latency_s: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.invoices = invoices
+        self.latency_s = latency_s
+        self.requests_by_host: dict[str, int] = {}
+        self.bytes_sent = 0
+        self.previews = 0  # 返回预览页（而非文件）的请求数
+        self._lock = threading.Lock()
+
+    @property
+    def proxy_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def record(self, host: str):
+        with self._lock:
+            self.requests_by_host[host] = self.requests_by_host.get(host, 0) + 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,160 @@
+"""
+解析器微基准与回归检查：parse_pdf_bytes / parse_ofd_bytes / classify_invoice / extract_invoice_urls。
+
+逐文件记录延迟（多次重复取最小值，同 timeit）与吞吐，并与语料的期望字段比对；
+准确率低于基线、或基线含吞吐且吞吐下降超过容差时返回非零。
+默认基线为仓库中的 benchmarks/parser_baseline.json，只记录各类型的准确率（吞吐因机器而异）；
+解析规则或语料变化使准确率合理变动后，用 --update-baseline 重新生成并随改动一起提交。
+
+用法（仓库根目录，完全离线）：
+    python benchmarks/parser_benchmark.py                               # 与仓库基线比较准确率
+    python benchmarks/parser_benchmark.py --output parser_bench.json
+    python benchmarks/parser_benchmark.py --baseline parser_bench.json  # 本机基线：准确率 + 吞吐
+    python benchmarks/parser_benchmark.py --update-baseline
+    python benchmarks/parser_benchmark.py --corpus ~/invoice-samples   # 追加脱敏的真实样本
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from corpus import KINDS, CorpusItem, build_corpus, dump_corpus, load_corpus_dir
+
+BASELINE_PATH = Path(__file__).with_name("parser_baseline.json")
+INVOICE_FIELDS = ("date", "amount", "service", "category", "invoice_number", "invoice_code", "seller_tax_id")
+
+
+def _run_item(item: CorpusItem, repeat: int) -> tuple[float, dict]:
+    """返回 (最小延迟秒, 实际字段)；最小值受调度与GC干扰最小，适合比较"""
+    from invoice_collector.classifier import classify_invoice
+    from invoice_collector.ofd_parser import parse_ofd_bytes
+    from invoice_collector.pdf_parser import parse_pdf_bytes
+    from invoice_collector.web_handler import extract_invoice_urls
+
+    samples, actual = [], {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if item.kind == "html":
+            actual = {"urls": extract_invoice_urls(item.data.decode("utf-8", errors="replace"))}
+        else:
+            fields = (parse_ofd_bytes if item.kind == "ofd" else parse_pdf_bytes)(item.data)
+            actual = {name: getattr(fields, name) for name in INVOICE_FIELDS if name != "category"}
+            actual["category"] = classify_invoice(fields.service, fields.raw_text)
+        samples.append(time.perf_counter() - start)
+    return min(samples), actual
+
+
+def _mismatches(expected: dict, actual: dict) -> list[str]:
+    """期望中出现的字段逐一比对，返回不一致的字段名；URL列表不计顺序"""
+    def normalized(value):
+        return sorted(value) if isinstance(value, list) else value
+
+    return [name for name, value in expected.items() if normalized(actual.get(name)) != normalized(value)]
+
+
+def run(items: list[CorpusItem], repeat: int) -> dict:
+    report: dict = {"kinds": {}, "failures": []}
+    for kind in KINDS:
+        subset = [item for item in items if item.kind == kind]
+        if not subset:
+            continue
+        _run_item(subset[0], 1)  # 预热：首次调用的导入与字体加载不计入
+        latencies, correct, field_errors = [], 0, {}
+        for item in subset:
+            latency, actual = _run_item(item, repeat)
+            latencies.append(latency)
+            wrong = _mismatches(item.expected, actual)
+            if wrong:
+                for name in wrong:
+                    field_errors[name] = field_errors.get(name, 0) + 1
+                report["failures"].append({
+                    "name": item.name,
+                    "fields": {name: {"expected": item.expected[name], "actual": actual.get(name)} for name in wrong},
+                })
+            else:
+                correct += 1
+        ordered = sorted(latencies)
+        total = sum(latencies)
+        report["kinds"][kind] = {
+            "files": len(subset),
+            "accuracy": round(correct / len(subset), 4),
+            "field_errors": field_errors,
+            "files_per_s": round(len(subset) / total, 2) if total else 0.0,
+            "mb_per_s": round(sum(len(i.data) for i in subset) / 1024 / 1024 / total, 3) if total else 0.0,
+            "mean_ms": round(1000 * total / len(subset), 3),
+            "p50_ms": round(1000 * ordered[len(ordered) // 2], 3),
+            "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            "max_ms": round(1000 * ordered[-1], 3),
+        }
+    return report
+
+
+def _check_regression(report: dict, baseline_path: Path, tolerance: float) -> list[str]:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    problems = []
+    for kind, base in baseline.get("kinds", {}).items():
+        current = report["kinds"].get(kind)
+        if current is None:
+            continue
+        if current["accuracy"] < base["accuracy"]:
+            problems.append(f"{kind} 准确率下降: {current['accuracy']:.2%} < {base['accuracy']:.2%}")
+        if base.get("files_per_s") and current["files_per_s"] < base["files_per_s"] * (1 - tolerance):
+            problems.append(f"{kind} 吞吐下降: {current['files_per_s']:.1f} < {base['files_per_s']:.1f} 个/秒")
+    return problems
+
+
+@click.command()
+@click.option("--per-kind", default=30, show_default=True, help="每种类型（PDF/OFD/HTML）的合成样本数")
+@click.option("--repeat", default=5, show_default=True, help="每个文件重复解析次数，取最小延迟")
+@click.option("--seed", default=7, show_default=True)
+@click.option("--corpus", "corpus_dirs", multiple=True, type=click.Path(exists=True, file_okay=False, path_type=Path),
+              help="追加语料目录（含 manifest.json），可多次指定")
+@click.option("--dump-corpus", "dump_dir", type=click.Path(file_okay=False, path_type=Path), default=None,
+              help="把合成语料与 manifest.json 写到该目录后退出")
+@click.option("--output", "output_path", type=click.Path(path_type=Path), default=None, help="写入JSON报告")
+@click.option("--baseline", "baseline_path", type=click.Path(dir_okay=False, path_type=Path), default=BASELINE_PATH,
+              show_default=True, help="与基线JSON比较，准确率下降或吞吐退化超过容差时返回非零")
+@click.option("--update-baseline", is_flag=True, default=False,
+              help="把本次各类型的准确率写入仓库基线（不含吞吐）后退出")
+@click.option("--tolerance", default=0.5, show_default=True,
+              help="吞吐基线容差（比例）；OFD/HTML单个文件在亚毫秒级，进程间波动较大")
+def main(per_kind, repeat, seed, corpus_dirs, dump_dir, output_path, baseline_path, update_baseline, tolerance):
+    """解析器微基准"""
+    items = build_corpus(per_kind, seed)
+    if dump_dir:
+        dump_corpus(items, dump_dir)
+        click.echo(f"已写出 {len(items)} 个样本到 {dump_dir}")
+        return
+    for directory in corpus_dirs:
+        items.extend(load_corpus_dir(directory))
+
+    # 隔离 ~/invoice-collector 下的提取器历史，每次从相同的初始顺序开始
+    os.environ["HOME"] = tempfile.mkdtemp(prefix="invoice-parser-bench-")
+    report = run(items, repeat)
+
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+    if output_path:
+        output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if update_baseline:
+        baseline = {"kinds": {kind: {"files": r["files"], "accuracy": r["accuracy"]} for kind, r in report["kinds"].items()}}
+        BASELINE_PATH.write_text(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        click.echo(f"已更新基线 {BASELINE_PATH}")
+        return
+
+    if not baseline_path.exists():
+        click.echo(f"基线 {baseline_path} 不存在，可用 --update-baseline 生成", err=True)
+        sys.exit(1)
+    problems = _check_regression(report, baseline_path, tolerance)
+    for p in problems:
+        click.echo(f"REGRESSION: {p}", err=True)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+端到端基准：合成邮箱 + 本地IMAP替身 + 本地平台服务，完整运行 run_pipeline。
+
+用法（仓库根目录，完全离线）：
+    python benchmarks/run_benchmark.py --folders 5 --messages 1000
+    python benchmarks/run_benchmark.py --output bench.json --baseline benchmarks/baseline.json
+"""
+
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from functools import wraps
+from pathlib import Path
+
+import click
+import yaml
+
+from fake_imap import FakeIMAPServer
+from fake_platform import FakePlatformServer
+from synthetic import generate_mailbox
+
+
+class StageTimer:
+    """按阶段累计调用次数与耗时（包装模块级函数/方法，不修改被测代码）"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    def wrap(self, owner, attr: str, stage: str):
+        original = getattr(owner, attr)
+
+        @wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+        setattr(owner, attr, timed)
+
+    def report(self) -> dict[str, dict]:
+        result = {}
+        for stage, values in self.samples.items():
+            ordered = sorted(values)
+            result[stage] = {
+                "count": len(values),
+                "total_s": round(sum(values), 4),
+                "mean_ms": round(1000 * sum(values) / len(values), 3),
+                "p50_ms": round(1000 * ordered[len(ordered) // 2], 3),
+                "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max_ms": round(1000 * ordered[-1], 3),
+            }
+        return result
+
+
+def _instrument(timer: StageTimer):
+    from invoice_collector import pipeline
+    from invoice_collector.email_client import IMAPClient
+
+    timer.wrap(IMAPClient, "search_invoice_uids", "imap_search")
+    timer.wrap(IMAPClient, "fetch_messages", "imap_fetch")
+    timer.wrap(pipeline, "extract_invoice_attachments", "attachments")
+    timer.wrap(pipeline, "extract_urls_from_message", "url_extract")
+    timer.wrap(pipeline, "fetch_invoice_direct", "url_download")
+    timer.wrap(pipeline, "fetch_invoice_with_browser", "url_browser")
+    timer.wrap(pipeline, "classify_invoice", "classify")
+    timer.wrap(pipeline, "save_invoice_file", "save")
+
+
+def _sum_counts(dicts) -> dict[str, int]:
+    total: dict[str, int] = {}
+    for d in dicts:
+        for k, v in d.items():
+            total[k] = total.get(k, 0) + v
+    return total
+
+
+def _check_regression(report: dict, baseline_path: Path, tolerance: float) -> list[str]:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    problems = []
+    base_rate = baseline.get("messages_per_s", 0)
+    if base_rate and report["messages_per_s"] < base_rate * (1 - tolerance):
+        problems.append(f"吞吐下降: {report['messages_per_s']:.1f} < {base_rate:.1f} msg/s")
+    base_rss = baseline.get("peak_rss_mb", 0)
+    if base_rss and report["peak_rss_mb"] > base_rss * (1 + tolerance):
+        problems.append(f"内存上升: {report['peak_rss_mb']:.1f} > {base_rss:.1f} MB")
+    if report["files_saved"] < baseline.get("files_saved", 0):
+        problems.append(f"保存文件减少: {report['files_saved']} < {baseline['files_saved']}")
+    return problems
+
+
+@click.command()
+@click.option("--folders", default=3, show_default=True, help="文件夹数量")
+@click.option("--messages", default=300, show_default=True, help="邮件总数")
+@click.option("--invoice-ratio", default=0.6, show_default=True, help="发票邮件占比")
+@click.option("--url-ratio", default=0.3, show_default=True, help="发票邮件中仅含链接的占比")
+@click.option("--ofd-ratio", default=0.2, show_default=True, help="OFD格式占比")
+@click.option("--http-latency-ms", default=0, show_default=True, help="平台服务模拟延迟")
+@click.option("--accounts", default=1, show_default=True, help="账户数（每个账户独立的IMAP替身与邮箱）")
+@click.option("--parse-workers", default=0, show_default=True, help="解析进程数（concurrency.parse_workers）")
+@click.option("--imap-throttle", default=0.0, show_default=True,
+              help="IMAP替身每秒允许的命令数，超出即限流（0为不限）")
+@click.option("--imap-throttle-mode", type=click.Choice(["no", "drop"]), default="no", show_default=True,
+              help="限流方式：回复 NO [UNAVAILABLE] 或直接断开连接")
+@click.option("--seed", default=42, show_default=True)
+@click.option("--output", "output_path", type=click.Path(path_type=Path), default=None, help="写入JSON报告")
+@click.option("--baseline", "baseline_path", type=click.Path(exists=True, path_type=Path), default=None,
+              help="与基线JSON比较，退化超过容差时返回非零")
+@click.option("--tolerance", default=0.3, show_default=True, help="基线容差（比例）")
+def main(folders, messages, invoice_ratio, url_ratio, ofd_ratio, http_latency_ms, accounts,
+         parse_workers, imap_throttle, imap_throttle_mode, seed, output_path, baseline_path, tolerance):
+    """离线端到端基准"""
+    workdir = Path(tempfile.mkdtemp(prefix="invoice-bench-"))
+    # 隔离 ~/invoice-collector 下的 state.json 与错误日志
+    os.environ["HOME"] = str(workdir)
+
+    mailboxes, url_invoices = [], {}
+    for i in range(accounts):
+        mailbox, invoices = generate_mailbox(folders, messages, invoice_ratio, url_ratio, ofd_ratio, seed + i)
+        mailboxes.append(mailbox)
+        url_invoices.update(invoices)
+    expected_files = sum(len(m.expected) for mb in mailboxes for msgs in mb.values() for m in msgs)
+    total_messages = messages * accounts
+
+    with ExitStack() as stack:
+        imaps = [stack.enter_context(FakeIMAPServer(
+            mb, throttle_rate=imap_throttle or None, throttle_mode=imap_throttle_mode)) for mb in mailboxes]
+        web = stack.enter_context(FakePlatformServer(url_invoices, http_latency_ms / 1000))
+        os.environ["HTTP_PROXY"] = os.environ["http_proxy"] = web.proxy_url
+        config_path = workdir / "config.yaml"
+        config_path.write_text(yaml.safe_dump({
+            "accounts": [
+                {"provider": "custom", "host": "127.0.0.1", "port": imap.port, "ssl": False,
+                 "username": f"bench{i}@example.com", "password": "bench"}
+                for i, imap in enumerate(imaps)
+            ],
+            "filters": {"lookback_days": 30},
+            "output": {"base_dir": str(workdir / "archive")},
+            "playwright": {"headless": True, "timeout_ms": 5000},
+            "concurrency": {"parse_workers": parse_workers},
+        }), encoding="utf-8")
+
+        from invoice_collector import pipeline
+        from invoice_collector.metrics import METRICS
+        pipeline.console.quiet = True
+        timer = StageTimer()
+        _instrument(timer)
+
+        start = time.perf_counter()
+        stats = pipeline.run_pipeline(config_path=config_path)
+        elapsed = time.perf_counter() - start
+
+    report = {
+        "messages": total_messages,
+        "accounts": accounts,
+        "folders": folders,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(total_messages / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "files_expected": expected_files,
+        "files_saved": stats["files_saved"],
+        "failed": stats["failed"],
+        "imap_commands": _sum_counts(imap.commands for imap in imaps),
+        "imap_bytes": sum(imap.bytes_sent for imap in imaps),
+        "imap_throttled": sum(imap.throttled for imap in imaps),
+        "http_requests": web.requests_by_host,
+        "http_bytes": web.bytes_sent,
+        "stages": timer.report(),
+        "builtin_stages": {k: {f: v[f] for f in ("count", "sum_s", "mean_ms", "p95_le_ms", "max_ms")}
+                           for k, v in METRICS.to_dict()["stages"].items()},
+        "counters": METRICS.to_dict()["counters"],
+    }
+
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+    if output_path:
+        output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if baseline_path:
+        problems = _check_regression(report, baseline_path, tolerance)
+        for p in problems:
+            click.echo(f"REGRESSION: {p}", err=True)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
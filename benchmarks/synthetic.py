@@ -0,0 +1,191 @@
+"""合成邮箱生成：发票PDF/OFD、发票链接邮件与噪声邮件"""
+
+import random
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+from io import BytesIO
+
+SERVICES = [
+    ("*住宿服务*住宿费", "住宿发票"),
+    ("*餐饮服务*餐费", "餐饮发票"),
+    ("*运输服务*客运服务费", "打车发票"),
+    ("*航空运输服务*机票", "飞机火车发票"),
+    ("*信息技术服务*软件服务费", "其他发票"),
+]
+
+# 邮件正文中的平台链接模板，{host}/{id} 由生成器填充；均走本地平台服务
+URL_TEMPLATES = [
+    ("pdf", "http://fp.baiwang.com/download/{id}.pdf"),
+    ("pdf", "http://nnfp.nuonuocs.cn/invoice/{id}?Wjgs=PDF"),
+    ("ofd", "http://www.fapiao.com.cn/dl/{id}.ofd"),
+    ("pdf", "http://dppt.chinatax.gov.cn/kpfw/fpjfzz/v1/exportDzfpwjEwm?Fphm={id}&Wjgs=PDF"),
+    ("ofd", "http://vpiaotong.com/file/{id}?Wjgs=OFD"),
+]
+
+# 税局导出接口缺少 Wjgs 参数的预览页链接：本地平台服务对其返回HTML，需经 web_handler 的直链规则改写后才能直接下载
+PREVIEW_URL_TEMPLATES = [
+    ("pdf", "http://dppt.chinatax.gov.cn/kpfw/fpjfzz/v1/exportDzfpwjEwm?Fphm={id}&Jym=8A3F"),
+]
+
+
+@dataclass
+class InvoiceSpec:
+    invoice_id: str
+    date: str           # YYYYMMDD
+    amount: str         # "88.50"
+    service: str        # 带税目前缀，如 *餐饮服务*餐费
+    category: str
+
+    def text_lines(self) -> list[str]:
+        y, m, d = self.date[:4], self.date[4:6], self.date[6:]
+        return [
+            "电子发票（普通发票）",
+            f"发票号码：{self.invoice_id}",
+            f"开票日期：{y}年{m}月{d}日",
+            f"{self.service}  1  {self.amount}",
+            f"价税合计（大写）略  （小写）¥{self.amount}",
+        ]
+
+
+@dataclass
+class SyntheticMessage:
+    uid: int
+    internal_date: datetime
+    raw: bytes
+    is_invoice: bool
+    expected: list[InvoiceSpec] = field(default_factory=list)
+
+
+def make_invoice_pdf(lines: list[str]) -> bytes:
+    """生成带中文文本层的最小PDF（STSong-Light + UniGB-UCS2-H，无需嵌入字体）"""
+    ops = ["BT", "/F1 12 Tf", "16 TL", "50 780 Td"]
+    for line in lines:
+        ops.append(f"<{line.encode('utf-16-be').hex().upper()}> Tj T*")
+    ops.append("ET")
+    content = "\n".join(ops).encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light "
+        b"/Encoding /UniGB-UCS2-H /DescendantFonts [6 0 R] >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> "
+        b"/FontDescriptor 7 0 R /DW 1000 >>",
+        b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 "
+        b"/FontBBox [0 -200 1000 900] /ItalicAngle 0 /Ascent 880 /Descent -120 "
+        b"/CapHeight 880 /StemV 93 >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_invoice_ofd(lines: list[str]) -> bytes:
+    """生成最小OFD（ZIP + OFD.xml + 页面TextCode）"""
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(
+            "OFD.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ofd:OFD xmlns:ofd="http://www.ofdspec.org/2016" Version="1.1">'
+            "<ofd:DocBody><ofd:DocRoot>Doc_0/Document.xml</ofd:DocRoot></ofd:DocBody></ofd:OFD>",
+        )
+        body = "".join(
+            f'<ofd:TextObject ID="{i}"><ofd:TextCode X="0" Y="{i * 5}">{line}</ofd:TextCode></ofd:TextObject>'
+            for i, line in enumerate(lines, 1)
+        )
+        zf.writestr(
+            "Doc_0/Pages/Page_0/Content.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ofd:Page xmlns:ofd="http://www.ofdspec.org/2016"><ofd:Content><ofd:Layer>'
+            f"{body}</ofd:Layer></ofd:Content></ofd:Page>",
+        )
+    return buf.getvalue()
+
+
+def random_invoice(rng: random.Random, seq: int, now: datetime) -> InvoiceSpec:
+    service, category = rng.choice(SERVICES)
+    date = (now - timedelta(days=rng.randint(0, 25))).strftime("%Y%m%d")
+    amount = f"{rng.randint(100, 500000) / 100:.2f}"
+    return InvoiceSpec(f"{25000000000000000000 + seq}", date, amount, service, category)
+
+
+def render_invoice(spec: InvoiceSpec, fmt: str) -> bytes:
+    lines = spec.text_lines()
+    return make_invoice_ofd(lines) if fmt == "ofd" else make_invoice_pdf(lines)
+
+
+def generate_mailbox(
+    folders: int = 3,
+    messages: int = 300,
+    invoice_ratio: float = 0.6,
+    url_ratio: float = 0.3,
+    ofd_ratio: float = 0.2,
+    seed: int = 42,
+) -> tuple[dict[str, list[SyntheticMessage]], dict[str, InvoiceSpec]]:
+    """
+    生成合成邮箱。返回 (mailbox, url_invoices)：
+    mailbox 为 {folder: [SyntheticMessage, ...]}，共 messages 封邮件均匀分布到 folders 个文件夹；
+    url_invoices 为 {invoice_id: InvoiceSpec}，供本地平台服务按ID返回文件。
+    invoice_ratio: 发票邮件占比；url_ratio: 发票邮件中仅含链接的占比；ofd_ratio: 附件/链接为OFD的占比。
+    """
+    rng = random.Random(seed)
+    now = datetime.now().astimezone()
+    folder_names = ["INBOX"] + [f"Archive/{i}" for i in range(1, folders)]
+    mailbox: dict[str, list[SyntheticMessage]] = {name: [] for name in folder_names}
+    url_invoices: dict[str, InvoiceSpec] = {}
+
+    for seq in range(messages):
+        folder = folder_names[seq % len(folder_names)]
+        uid = len(mailbox[folder]) + 1
+        sent = now - timedelta(days=rng.randint(0, 20), minutes=rng.randint(0, 1440))
+        msg = EmailMessage()
+        msg["From"] = "invoice@example.com"
+        msg["To"] = "me@example.com"
+        msg["Date"] = format_datetime(sent)
+        msg["Message-ID"] = f"<bench-{seq}@example.com>"
+
+        if rng.random() >= invoice_ratio:
+            msg["Subject"] = rng.choice(["周报", "会议通知", "Newsletter", "账单提醒"])
+            msg.set_content("这是一封普通邮件。\n" * rng.randint(5, 50))
+            if rng.random() < 0.3:
+                msg.add_attachment(
+                    rng.randbytes(rng.randint(10_000, 200_000)),
+                    maintype="application", subtype="octet-stream", filename="data.bin",
+                )
+            mailbox[folder].append(SyntheticMessage(uid, sent, msg.as_bytes(), False))
+            continue
+
+        spec = random_invoice(rng, seq, now)
+        msg["Subject"] = f"您收到一张电子发票 [{spec.invoice_id}]"
+        fmt = "ofd" if rng.random() < ofd_ratio else "pdf"
+        if rng.random() < url_ratio:
+            candidates = [t for f, t in URL_TEMPLATES + PREVIEW_URL_TEMPLATES if f == fmt]
+            url = rng.choice(candidates).format(id=spec.invoice_id)
+            url_invoices[spec.invoice_id] = spec
+            msg.set_content(f"尊敬的客户，您的电子发票已开具，请点击下载：\n{url}\n")
+            msg.add_alternative(f'<p>请点击 <a href="{url}">下载发票</a></p>', subtype="html")
+        else:
+            msg.set_content("尊敬的客户，您的电子发票已开具，详见附件。\n")
+            subtype = "ofd" if fmt == "ofd" else "pdf"
+            msg.add_attachment(
+                render_invoice(spec, fmt),
+                maintype="application", subtype=subtype, filename=f"{spec.invoice_id}.{fmt}",
+            )
+        mailbox[folder].append(SyntheticMessage(uid, sent, msg.as_bytes(), True, [spec]))
+
+    return mailbox, url_invoices
@@ -1,75 +1,167 @@
-"""发票附件提取模块（PDF优先，OFD备选）"""
+"""发票附件提取模块（PDF优先，OFD备选；全电XML数据文件用于免解析填充字段）"""
 
-import email
-import quopri
-import base64
+import logging
+import re
+from email.header import decode_header
+from pathlib import PurePath
 
+from .bundle_handler import UNSUPPORTED_SUFFIXES, BundleLimits, extract_bundle, is_bundle, sniff_format
+from .metrics import METRICS
+from .mime_parser import MimePart, as_parsed
+from .pdf_parser import InvoiceFields
+from .xml_parser import parse_xml_bytes
 
-def extract_invoice_attachments(msg: email.message.Message) -> list[tuple[str, bytes, str]]:
+logger = logging.getLogger(__name__)
+
+# 判断类型时解码的字节数：开头1KB（PDF头可在前1024字节内），ZIP再看末尾的中央目录
+SNIFF_HEAD_BYTES = 1024
+SNIFF_TAIL_BYTES = 64 * 1024
+# 不会是发票文件的部分，不做内容判断
+_NON_BINARY_MAINTYPES = ("text", "image", "audio", "video", "multipart", "message")
+
+
+def extract_invoice_attachments(
+    msg,
+    bundle_limits: BundleLimits | None = None,
+    xml_files: list[tuple[str, bytes]] | None = None,
+) -> list[tuple[str, bytes, str]]:
     """
     遍历MIME树，提取发票附件。PDF优先：若有PDF则只返回PDF列表；无PDF时返回OFD列表。
+    ZIP压缩包中的PDF/OFD同样参与（见 bundle_handler，bundle_limits 为解包上限）。
+    xml_files 不为 None 时，同时把全电XML数据文件（含压缩包内的）追加到该列表，见 pair_xml_fields。
+    msg 可为 ParsedMessage 或 email.message.Message。
+    PDF/OFD按内容判断（见 sniff_part）：文件名或类型不规范的发票也能识别，标为PDF但内容不是的部分被跳过；
+    只有确认是发票的部分才完整解码，其他二进制部分只解码开头（及末尾）几KB。
     返回 [(filename, file_bytes, fmt), ...]，fmt 为 "pdf" 或 "ofd"。
     """
     pdfs: list[tuple[str, bytes, str]] = []
     ofds: list[tuple[str, bytes, str]] = []
+    xmls: list[tuple[str, bytes]] = xml_files if xml_files is not None else []
 
-    for part in msg.walk():
-        content_type = part.get_content_type()
-        content_disposition = part.get("Content-Disposition", "")
+    for part in as_parsed(msg).parts:
         filename = _get_filename(part)
+        kind = classify_attachment(part.content_type, filename, part.get("Content-Disposition", ""))
+        if kind is None and (part.headers.get_content_maintype() in _NON_BINARY_MAINTYPES or not part.size):
+            continue
 
-        # PDF检测
-        is_pdf_type = (
-            content_type == "application/pdf"
-            or content_type == "application/octet-stream"
-            or ".pdf" in content_disposition.lower()
-        )
-        if is_pdf_type and (
-            filename.lower().endswith(".pdf") or content_type == "application/pdf"
-        ):
-            payload = _get_payload(part)
-            if payload:
-                pdfs.append((filename or "attachment.pdf", payload, "pdf"))
+        # 压缩包：解包后按类型并入PDF/OFD列表
+        if kind == "bundle":
+            payload = part.decode()
+            for name, data, fmt in extract_bundle(payload, filename or "attachment.zip", bundle_limits):
+                if fmt == "xml":
+                    xmls.append((name, data))
+                else:
+                    (pdfs if fmt == "pdf" else ofds).append((name, data, fmt))
+            continue
+        if kind == "unsupported":
+            logger.warning(f"暂不支持的压缩格式，跳过: {filename}")
+            continue
+        if kind == "xml":
+            if xml_files is not None:
+                xmls.append((filename, part.decode()))
             continue
 
-        # OFD检测
-        is_ofd_type = content_type in ("application/ofd", "application/octet-stream")
-        if is_ofd_type and filename.lower().endswith(".ofd"):
-            payload = _get_payload(part)
-            if payload:
-                ofds.append((filename or "attachment.ofd", payload, "ofd"))
+        sniffed = sniff_part(part)
+        if sniffed not in ("pdf", "ofd"):
+            if kind is not None:
+                METRICS.inc("attachments_sniff_rejected_total")
+                logger.info(f"附件内容不是{kind.upper()}，跳过: {filename}")
+            continue
+        if sniffed != kind:
+            METRICS.inc("attachments_sniff_recovered_total")
+            logger.debug(f"按内容识别为{sniffed.upper()}: {filename or part.content_type}")
+        payload = part.decode()
+        (pdfs if sniffed == "pdf" else ofds).append((filename or f"attachment.{sniffed}", payload, sniffed))
 
     # PDF优先：有PDF则忽略OFD
     return pdfs if pdfs else ofds
 
 
-def extract_pdf_attachments(msg: email.message.Message) -> list[tuple[str, bytes]]:
+def sniff_part(part: MimePart) -> str | None:
+    """
+    只解码正文开头判断格式（"pdf"/"ofd"/"zip"/None）；ZIP且首个成员不是 OFD.xml 时再解码末尾查中央目录。
+    """
+    METRICS.inc("attachments_sniffed_total")
+    head = part.decode_head(SNIFF_HEAD_BYTES)
+    fmt = sniff_format(head)
+    if fmt == "zip":
+        fmt = sniff_format(head, part.decode_tail(SNIFF_TAIL_BYTES))
+    return fmt
+
+
+def classify_attachment(content_type: str, filename: str, content_disposition: str = "") -> str | None:
+    """
+    只凭部分头信息判断附件类别，不需要正文：
+    "bundle"（压缩包）、"unsupported"（RAR/7z）、"pdf"、"ofd"、"xml"（全电数据文件候选），其他返回 None。
+    """
+    if is_bundle(filename, content_type):
+        return "bundle"
+    name = filename.lower()
+    if name.endswith(UNSUPPORTED_SUFFIXES):
+        return "unsupported"
+
+    # PDF检测
+    is_pdf_type = (
+        content_type == "application/pdf"
+        or content_type == "application/octet-stream"
+        or ".pdf" in content_disposition.lower()
+    )
+    if is_pdf_type and (name.endswith(".pdf") or content_type == "application/pdf"):
+        return "pdf"
+
+    # OFD检测
+    if content_type in ("application/ofd", "application/octet-stream") and name.endswith(".ofd"):
+        return "ofd"
+
+    # XML数据文件：按文件名判断，是否为发票数据在解析时确认
+    if name.endswith(".xml"):
+        return "xml"
+    return None
+
+
+_NUMBER_IN_NAME = re.compile(r"(?<!\d)(\d{20}|\d{8})(?!\d)")
+
+
+def pair_xml_fields(
+    attachments: list[tuple[str, bytes, str]], xml_files: list[tuple[str, bytes]]
+) -> list[InvoiceFields | None]:
+    """
+    为每个发票附件找到对应的全电XML数据文件并解析，返回与 attachments 一一对应的字段，
+    找不到对应XML的为 None（仍需解析PDF/OFD）。
+    对应关系：文件名主干相同 > 文件名中的发票号码与XML一致 > 邮件中只有一张发票与一个XML。
+    """
+    result: list[InvoiceFields | None] = [None] * len(attachments)
+    if not attachments or not xml_files:
+        return result
+    parsed = [(name, parse_xml_bytes(data)) for name, data in xml_files]
+    candidates = [(PurePath(name).stem.lower(), fields) for name, fields in parsed if fields is not None]
+    if not candidates:
+        return result
+
+    used: set[int] = set()
+    for i, (name, _, _) in enumerate(attachments):
+        stem = PurePath(name).stem.lower()
+        numbers = set(_NUMBER_IN_NAME.findall(name))
+        for j, (xml_stem, fields) in enumerate(candidates):
+            if j not in used and (xml_stem == stem or fields.invoice_number in numbers):
+                result[i] = fields
+                used.add(j)
+                break
+    if len(attachments) == 1 and len(candidates) == 1 and result[0] is None:
+        result[0] = candidates[0][1]
+    return result
+
+
+def extract_pdf_attachments(msg) -> list[tuple[str, bytes]]:
     """兼容旧接口，只返回PDF附件"""
     attachments = extract_invoice_attachments(msg)
     return [(name, data) for name, data, fmt in attachments if fmt == "pdf"]
 
 
-def _get_payload(part: email.message.Message) -> bytes | None:
-    """提取附件内容字节"""
-    payload = part.get_payload(decode=True)
-    if payload is not None:
-        return payload
-    # 手动处理编码
-    raw = part.get_payload()
-    encoding = part.get("Content-Transfer-Encoding", "").lower()
-    if encoding == "base64":
-        return base64.b64decode(raw)
-    elif encoding == "quoted-printable":
-        return quopri.decodestring(raw.encode())
-    else:
-        return raw.encode() if isinstance(raw, str) else raw
-
-
-def _get_filename(part: email.message.Message) -> str:
+def _get_filename(part: MimePart) -> str:
     """提取并解码附件文件名"""
     filename = part.get_filename("")
     if filename:
-        from email.header import decode_header
         decoded_parts = decode_header(filename)
         result = ""
         for raw, charset in decoded_parts:
@@ -0,0 +1,225 @@
+"""IMAP FETCH 响应与 BODYSTRUCTURE 解析：不下载正文即可得到各叶子部分的类型、编码、大小与文件名"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable
+from email.header import decode_header
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+
+from .mime_parser import ParsedMessage
+
+
+@dataclass
+class PartInfo:
+    """BODYSTRUCTURE 中的一个叶子部分"""
+    section: str           # IMAP部分编号，如 "1"、"2.1"
+    content_type: str
+    encoding: str
+    size: int              # 编码后字节数
+    charset: str = ""
+    filename: str = ""
+    disposition: str = ""  # 重建的 Content-Disposition，如 'attachment; filename="a.pdf"'
+
+    @property
+    def decoded_size(self) -> int:
+        """解码后的大致字节数"""
+        return self.size * 3 // 4 if self.encoding == "base64" else self.size
+
+
+@dataclass
+class MessageStructure:
+    """一封邮件的结构摘要；read_text 按需取回并解码指定的文本部分"""
+    key: str
+    subject: str
+    size: int
+    parts: list[PartInfo]
+    read_text: Callable[[list[PartInfo]], list[str]]
+
+
+def structure_from_parsed(key: str, subject: str, msg: ParsedMessage) -> MessageStructure:
+    """已在本地解析的邮件（本地导出源）：直接由叶子部分头信息得到结构，部分编号为遍历序号"""
+    leaves = {str(i): part for i, part in enumerate(msg.parts, 1)}
+    parts = []
+    for section, part in leaves.items():
+        filename = _filename({"filename": part.get_filename("")})
+        parts.append(PartInfo(
+            section=section,
+            content_type=part.content_type,
+            encoding=part.encoding or "7bit",
+            size=part.size,
+            charset=part.headers.get_content_charset() or "",
+            filename=filename,
+            disposition=part.get("Content-Disposition", ""),
+        ))
+    return MessageStructure(
+        key=key, subject=subject, size=len(msg.raw), parts=parts,
+        read_text=lambda wanted: [leaves[p.section].get_text() for p in wanted],
+    )
+
+
+# 原子可带方括号段（BODY[HEADER.FIELDS (SUBJECT)]），方括号内允许空格与括号
+_TOKEN = re.compile(
+    rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}\s*$|([^\s()"\[\]]*\[[^\]]*\][^\s()"]*|[^\s()"]+))'
+)
+
+
+class _Literal(bytes):
+    """{n} 字面量内容"""
+
+
+def _tokens(data: list):
+    """把 imaplib 返回的 [bytes | (bytes, literal)] 展开为词法单元流"""
+    for item in data:
+        if item is None:
+            continue
+        text, literal = item if isinstance(item, tuple) else (item, None)
+        pos = 0
+        while pos < len(text):
+            m = _TOKEN.match(text, pos)
+            if not m or m.end() == pos:
+                break
+            pos = m.end()
+            if m.group(1):
+                yield "("
+            elif m.group(2):
+                yield ")"
+            elif m.group(3) is not None:
+                yield re.sub(rb"\\(.)", rb"\1", m.group(3)).decode("utf-8", errors="replace")
+            elif m.group(4) is not None:
+                continue  # 字面量长度标记，内容在元组第二项
+            else:
+                atom = m.group(5).decode("utf-8", errors="replace")
+                yield None if atom.upper() == "NIL" else atom
+        if literal is not None:
+            yield _Literal(literal)
+
+
+def _build(tokens) -> list:
+    """把词法单元流组装为嵌套列表"""
+    stack: list[list] = [[]]
+    for tok in tokens:
+        if tok == "(" and not isinstance(tok, _Literal):
+            stack.append([])
+        elif tok == ")" and not isinstance(tok, _Literal):
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(tok)
+    while len(stack) > 1:  # 响应被截断时尽量保留已解析部分
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def parse_response_items(data: list) -> list:
+    """把 imaplib 返回的响应数据（含字面量元组）解析为嵌套列表：括号为list，NIL为None，字面量为bytes"""
+    return _build(_tokens(data))
+
+
+def parse_fetch_response(data: list) -> list[dict]:
+    """
+    解析 imaplib 的 UID FETCH 返回值，每封邮件一个字典：
+    键为大写的数据项名（UID、RFC822.SIZE、BODYSTRUCTURE、BODY[...]），字面量为bytes。
+    """
+    results = []
+    for node in parse_response_items(data):
+        if not isinstance(node, list):
+            continue  # 序号
+        item = {}
+        for key, value in zip(node[::2], node[1::2]):
+            if isinstance(key, str):
+                item[key.upper()] = value
+        results.append(item)
+    return results
+
+
+def parse_bodystructure(node: list) -> list[PartInfo]:
+    """展开BODYSTRUCTURE为叶子部分列表（与 mime_parser 相同：message/rfc822 递归展开）"""
+    parts: list[PartInfo] = []
+    if node and isinstance(node[0], list):
+        _walk(node, "", parts)
+    else:
+        _walk(node, "1", parts)
+    return parts
+
+
+def _walk(node: list, section: str, out: list[PartInfo]):
+    if node and isinstance(node[0], list):
+        # 多部分：子部分在前，遇到 subtype 字符串为止，其后是扩展数据
+        for index, child in enumerate(node, start=1):
+            if not isinstance(child, list):
+                break
+            _walk(child, f"{section}.{index}" if section else str(index), out)
+        return
+    if len(node) < 7:
+        return
+
+    content_type = f"{node[0] or 'text'}/{node[1] or 'plain'}".lower()
+    params = _pairs(node[2])
+    encoding = str(node[5] or "7bit").lower()
+    try:
+        size = int(node[6] or 0)
+    except (TypeError, ValueError):
+        size = 0
+
+    if content_type == "message/rfc822" and len(node) > 8 and isinstance(node[8], list):
+        inner = node[8]
+        _walk(inner, section if inner and isinstance(inner[0], list) else f"{section}.1", out)
+        return
+
+    # 扩展字段起点：基本类型7，text/* 多一个行数
+    ext = 8 if content_type.startswith("text/") else 7
+    disposition_type, disposition_params = "", {}
+    if len(node) > ext + 1 and isinstance(node[ext + 1], list) and node[ext + 1]:
+        disposition_type = str(node[ext + 1][0] or "").lower()
+        disposition_params = _pairs(node[ext + 1][1] if len(node[ext + 1]) > 1 else None)
+
+    filename = _filename(disposition_params) or _filename(params, key="name")
+    disposition = disposition_type
+    if filename:
+        disposition = f'{disposition_type or "attachment"}; filename="{filename}"'
+    out.append(PartInfo(
+        section=section,
+        content_type=content_type,
+        encoding=encoding,
+        size=size,
+        charset=params.get("charset", ""),
+        filename=filename,
+        disposition=disposition,
+    ))
+
+
+def _pairs(node) -> dict[str, str]:
+    if not isinstance(node, list):
+        return {}
+    result = {}
+    for key, value in zip(node[::2], node[1::2]):
+        if isinstance(key, str) and value is not None:
+            value = value.decode("utf-8", errors="replace") if isinstance(value, bytes) else str(value)
+            result[key.lower()] = value
+    return result
+
+
+def _filename(params: dict[str, str], key: str = "filename") -> str:
+    """支持 RFC 2231（filename*=UTF-8''...）与 RFC 2047（=?GBK?B?...?=）编码的文件名"""
+    value = params.get(key)
+    if value is None and f"{key}*" in params:
+        charset, _, encoded = decode_rfc2231(params[f"{key}*"])
+        try:
+            value = unquote(encoded, encoding=charset or "utf-8", errors="replace")
+        except LookupError:
+            value = unquote(encoded, errors="replace")
+    if not value:
+        return ""
+    decoded = []
+    for raw, charset in decode_header(value):
+        if isinstance(raw, bytes):
+            try:
+                decoded.append(raw.decode(charset or "utf-8", errors="replace"))
+            except LookupError:
+                decoded.append(raw.decode("gbk", errors="replace"))
+        else:
+            decoded.append(raw)
+    return "".join(decoded)
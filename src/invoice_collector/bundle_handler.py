@@ -0,0 +1,149 @@
+"""打包附件（ZIP）解包：按中央目录逐个流式读取成员，按魔数筛选其中的PDF/OFD发票"""
+
+import logging
+import re
+import zipfile
+from dataclasses import dataclass
+from io import BytesIO
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed", "application/x-zip")
+# 非ZIP的压缩格式：标准库无法解包，只记录日志
+UNSUPPORTED_SUFFIXES = (".rar", ".7z")
+
+_PDF_MAGIC = b"%PDF"
+_ZIP_MAGIC = b"PK\x03\x04"
+_XML_HEADS = (b"<?xm", b"\xef\xbb\xbf<")  # 全电发票XML数据文件（可带UTF-8 BOM）
+_OFD_ROOT = re.compile(rb"(?<!/)OFD\.xml", re.IGNORECASE)
+_UTF8_NAME_FLAG = 0x800
+_ENCRYPTED_FLAG = 0x1
+
+
+@dataclass
+class BundleLimits:
+    """单个压缩包的解包上限，防止超大包或zip炸弹耗尽内存"""
+    max_members: int = 500                    # 处理的成员数上限
+    max_member_bytes: int = 20 * 1024 * 1024  # 单个成员解压后大小上限
+    max_total_bytes: int = 200 * 1024 * 1024  # 整个包（含嵌套）解压后总大小上限
+    max_ratio: int = 100                      # 单个成员压缩比上限
+    max_depth: int = 2                        # 压缩包嵌套层数
+
+    @classmethod
+    def from_config(cls, bundles_cfg: dict) -> "BundleLimits":
+        return cls(
+            max_members=bundles_cfg["max_members"],
+            max_member_bytes=int(bundles_cfg["max_member_mb"] * 1024 * 1024),
+            max_total_bytes=int(bundles_cfg["max_total_mb"] * 1024 * 1024),
+            max_ratio=bundles_cfg["max_ratio"],
+        )
+
+
+def is_bundle(filename: str, content_type: str) -> bool:
+    name = filename.lower()
+    if name.endswith(".ofd"):
+        return False  # OFD本身也是ZIP
+    return name.endswith(".zip") or content_type in BUNDLE_CONTENT_TYPES
+
+
+def is_ofd_package(data: bytes) -> bool:
+    """ZIP根目录含 OFD.xml 即为OFD文件"""
+    try:
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            return any(name.lower() == "ofd.xml" for name in zf.namelist())
+    except (zipfile.BadZipFile, ValueError):
+        return False
+
+
+def sniff_format(head: bytes, tail: bytes = b"") -> str | None:
+    """
+    按文件开头（及末尾）字节判断格式，返回 "pdf"、"ofd"、"zip"（非OFD的ZIP）或 None。
+    PDF头允许出现在前1024字节内；OFD看第一个成员名或 tail（含中央目录时）中是否有根目录的 OFD.xml。
+    """
+    if _PDF_MAGIC in head[:1024]:
+        return "pdf"
+    if not head.startswith(_ZIP_MAGIC):
+        return None
+    name_length = int.from_bytes(head[26:28], "little")
+    if _OFD_ROOT.match(head[30:30 + name_length]) or _OFD_ROOT.search(tail):
+        return "ofd"
+    return "zip"
+
+
+def extract_bundle(
+    data: bytes,
+    bundle_name: str,
+    limits: BundleLimits | None = None,
+    _depth: int = 1,
+    _budget: list[int] | None = None,
+) -> list[tuple[str, bytes, str]]:
+    """
+    解包ZIP，返回其中的发票 [(member_name, file_bytes, fmt), ...]，fmt 为 pdf/ofd/xml
+    （xml 为与发票同包下发的全电数据文件）。
+    只读取中央目录与每个成员的前4字节判断类型，非发票成员不解压；
+    超过上限的成员跳过，嵌套的ZIP（非OFD）在 max_depth 内递归处理。
+    """
+    limits = limits or BundleLimits()
+    budget = _budget if _budget is not None else [limits.max_total_bytes]
+    results: list[tuple[str, bytes, str]] = []
+    try:
+        zf = zipfile.ZipFile(BytesIO(data))
+    except (zipfile.BadZipFile, ValueError) as e:
+        logger.warning(f"压缩包无法读取 ({bundle_name}): {e}")
+        return results
+
+    with zf:
+        infos = [i for i in zf.infolist() if not i.is_dir()]
+        if len(infos) > limits.max_members:
+            logger.warning(f"压缩包成员过多 ({bundle_name}): {len(infos)}，只处理前 {limits.max_members} 个")
+            infos = infos[: limits.max_members]
+
+        for info in infos:
+            member = _member_name(info)
+            if info.flag_bits & _ENCRYPTED_FLAG:
+                logger.warning(f"跳过加密成员 {bundle_name}/{member}")
+                continue
+            if info.file_size > min(limits.max_member_bytes, budget[0]):
+                logger.warning(f"跳过超限成员 {bundle_name}/{member} ({info.file_size} 字节)")
+                continue
+            if info.compress_size and info.file_size / info.compress_size > limits.max_ratio:
+                logger.warning(f"跳过压缩比异常的成员 {bundle_name}/{member}")
+                continue
+            try:
+                with zf.open(info) as f:
+                    head = f.read(4)
+                    is_xml = head in _XML_HEADS and member.lower().endswith(".xml")
+                    if head not in (_PDF_MAGIC, _ZIP_MAGIC) and not is_xml:
+                        continue
+                    payload = head + f.read(info.file_size - len(head))
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError, OSError, EOFError) as e:
+                logger.warning(f"成员解压失败 {bundle_name}/{member}: {e}")
+                continue
+            budget[0] -= len(payload)
+
+            if head == _PDF_MAGIC:
+                results.append((member, payload, "pdf"))
+            elif is_xml:
+                results.append((member, payload, "xml"))
+            elif is_ofd_package(payload):
+                results.append((member, payload, "ofd"))
+            elif _depth < limits.max_depth:
+                results.extend(extract_bundle(payload, f"{bundle_name}/{member}", limits, _depth + 1, budget))
+
+    if _depth == 1:
+        METRICS.inc("bundles_opened_total")
+        METRICS.inc("bundle_invoices_total", sum(1 for _, _, fmt in results if fmt != "xml"))
+    return results
+
+
+def _member_name(info: zipfile.ZipInfo) -> str:
+    """未设置UTF-8标志的文件名按GBK还原（国内Windows打包工具的常见情况）"""
+    name = info.filename
+    if not info.flag_bits & _UTF8_NAME_FLAG:
+        try:
+            name = name.encode("cp437").decode("gbk")
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return name.rsplit("/", 1)[-1]
@@ -0,0 +1,201 @@
+"""已归档发票目录（SQLite）：按日期/月份/类型/哈希索引，支持即时汇总与查重"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .pdf_parser import InvoiceFields
+
+DEFAULT_CATALOG_PATH = Path("~/invoice-collector/catalog.db").expanduser()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id           INTEGER PRIMARY KEY,
+    path         TEXT NOT NULL UNIQUE,
+    date         TEXT NOT NULL DEFAULT '',      -- YYYYMMDD
+    month        TEXT NOT NULL DEFAULT '',      -- YYYY-MM，无日期为空串
+    amount_cents INTEGER,                       -- 价税合计（分），未识别为NULL
+    category     TEXT NOT NULL,
+    service      TEXT NOT NULL DEFAULT '',
+    invoice_number TEXT NOT NULL DEFAULT '',    -- 发票号码，未识别为空串
+    invoice_code TEXT NOT NULL DEFAULT '',      -- 发票代码（全电发票为空）
+    seller_tax_id TEXT NOT NULL DEFAULT '',     -- 销售方纳税人识别号
+    sha256       TEXT NOT NULL,
+    source_uid   TEXT NOT NULL DEFAULT '',
+    saved_at     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_month_category ON invoices (month, category, amount_cents);
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (date);
+CREATE INDEX IF NOT EXISTS idx_invoices_sha256 ON invoices (sha256);
+CREATE INDEX IF NOT EXISTS idx_invoices_source_uid ON invoices (source_uid);
+"""
+
+# 旧版目录库缺少的列：启动时补齐（ALTER TABLE ADD COLUMN）
+_ADDED_COLUMNS = {
+    "invoice_number": "TEXT NOT NULL DEFAULT ''",
+    "invoice_code": "TEXT NOT NULL DEFAULT ''",
+    "seller_tax_id": "TEXT NOT NULL DEFAULT ''",
+}
+_INDEXES_AFTER_MIGRATION = """
+CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices (invoice_number);
+"""
+
+# 归档文件名：YYYYMMDD_金额_类型[_N].ext
+_FILENAME_PATTERN = re.compile(r"^(\d{8}|UNKNOWN)_([\d.]+)_(.+?)(?:_\d+)?\.(pdf|ofd)$", re.IGNORECASE)
+
+
+def file_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _to_cents(amount: str) -> int | None:
+    try:
+        return round(float(amount) * 100) if amount else None
+    except ValueError:
+        return None
+
+
+def _month_of(date: str) -> str:
+    return f"{date[:4]}-{date[4:6]}" if len(date) >= 6 and date[:6].isdigit() else ""
+
+
+class InvoiceCatalog:
+    """线程安全（单连接 + 锁），WAL 模式下读写互不阻塞"""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or DEFAULT_CATALOG_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(invoices)")}
+            for column, decl in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE invoices ADD COLUMN {column} {decl}")
+            self._conn.executescript(_INDEXES_AFTER_MIGRATION)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(
+        self,
+        path: Path,
+        fields: InvoiceFields,
+        category: str,
+        sha256: str,
+        source_uid: str = "",
+    ):
+        """登记一张已保存的发票；同一路径重复登记时覆盖"""
+        date = fields.date if fields.parse_ok else ""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO invoices (path, date, month, amount_cents, category, service,
+                                      invoice_number, invoice_code, seller_tax_id,
+                                      sha256, source_uid, saved_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    date=excluded.date, month=excluded.month, amount_cents=excluded.amount_cents,
+                    category=excluded.category, service=excluded.service,
+                    invoice_number=CASE WHEN excluded.invoice_number != '' THEN excluded.invoice_number
+                                        ELSE invoices.invoice_number END,
+                    invoice_code=CASE WHEN excluded.invoice_code != '' THEN excluded.invoice_code
+                                      ELSE invoices.invoice_code END,
+                    seller_tax_id=CASE WHEN excluded.seller_tax_id != '' THEN excluded.seller_tax_id
+                                       ELSE invoices.seller_tax_id END,
+                    sha256=excluded.sha256,
+                    source_uid=CASE WHEN excluded.source_uid != '' THEN excluded.source_uid
+                                    ELSE invoices.source_uid END
+                """,
+                (
+                    str(path), date, _month_of(date), _to_cents(fields.amount), category,
+                    fields.service, fields.invoice_number, fields.invoice_code, fields.seller_tax_id,
+                    sha256, source_uid, datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+
+    def relocate(self, old_path: Path, new_path: Path, fields: InvoiceFields, category: str, sha256: str):
+        """重新归档后更新路径与字段（保留来源UID）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE invoices SET path = ? WHERE path = ? AND ? NOT IN (SELECT path FROM invoices)",
+                (str(new_path), str(old_path), str(new_path)),
+            )
+        self.record(new_path, fields, category, sha256)
+
+    def find_by_hash(self, sha256: str) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM invoices WHERE sha256 = ? ORDER BY saved_at", (sha256,)
+            ).fetchall()
+
+    def find_by_number(self, invoice_number: str, invoice_code: str = "") -> sqlite3.Row | None:
+        """
+        按发票号码查找已归档的发票（最早登记的一条）。
+        8位号码（增值税电子普通发票）只在同一发票代码内唯一，必须同时给出发票代码；20位全电号码单独即可确定。
+        """
+        if not invoice_number:
+            return None
+        if len(invoice_number) != 20:
+            if not invoice_code:
+                return None
+            with self._lock:
+                return self._conn.execute(
+                    "SELECT * FROM invoices WHERE invoice_number = ? AND invoice_code = ? ORDER BY saved_at LIMIT 1",
+                    (invoice_number, invoice_code),
+                ).fetchone()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM invoices WHERE invoice_number = ? ORDER BY saved_at LIMIT 1", (invoice_number,)
+            ).fetchone()
+
+    def summary(
+        self, month: str | None = None, year: str | None = None, category: str | None = None
+    ) -> list[sqlite3.Row]:
+        """按 月份×类型 汇总张数与金额，可按月份（YYYY-MM）、年份、类型过滤"""
+        clauses, params = [], []
+        if month:
+            clauses.append("month = ?")
+            params.append(month)
+        elif year:
+            clauses.append("month >= ? AND month <= ?")
+            params.extend([f"{year}-01", f"{year}-12"])
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._conn.execute(
+                f"""
+                SELECT month, category, COUNT(*) AS count,
+                       COALESCE(SUM(amount_cents), 0) AS amount_cents
+                FROM invoices {where}
+                GROUP BY month, category
+                ORDER BY month, category
+                """,
+                params,
+            ).fetchall()
+
+    def rebuild_from_archive(self, base_dir: Path) -> int:
+        """从归档目录的文件名重建目录（不解析文件内容，只计算哈希），返回登记数量"""
+        count = 0
+        for file in sorted(base_dir.rglob("*")):
+            m = _FILENAME_PATTERN.match(file.name)
+            if not file.is_file() or not (m or file.suffix.lower() in (".pdf", ".ofd")):
+                continue
+            if m:
+                date = "" if m.group(1) == "UNKNOWN" else m.group(1)
+                fields = InvoiceFields(date=date, amount=m.group(2), parse_ok=True)
+                category = m.group(3)
+            else:
+                fields, category = InvoiceFields(), "未归类"
+            self.record(file, fields, category, file_sha256(file.read_bytes()))
+            count += 1
+        return count
@@ -6,6 +6,8 @@ from pathlib import Path
 
 import yaml
 
+from .imap_folders import DEFAULT_SKIP_SPECIAL_USE
+
 DEFAULT_CONFIG_PATH = Path("~/invoice-collector/config.yaml").expanduser()
 
 IMAP_PRESETS = {
@@ -15,6 +17,9 @@ IMAP_PRESETS = {
     "outlook": {"host": "outlook.office365.com", "port": 993},
 }
 
+# 本地邮件导出来源（见 mail_sources.py），需填写 path 而非 host/port
+LOCAL_PROVIDERS = ("mbox", "maildir", "eml")
+
 ENV_VAR_PATTERN = re.compile(r"^\$\{([^}]+)\}$")
 
 
@@ -30,8 +35,11 @@ def _resolve_env(value: str) -> str:
     return value
 
 
-def load_config(config_path: Path | None = None) -> dict:
-    """加载并验证配置文件"""
+def load_config(config_path: Path | None = None, require_accounts: bool = True) -> dict:
+    """
+    加载并验证配置文件。
+    require_accounts: 为 False 时允许不配置邮箱（服务模式，账户由各作业提供）
+    """
     path = config_path or DEFAULT_CONFIG_PATH
     if not path.exists():
         raise FileNotFoundError(
@@ -40,26 +48,39 @@ def load_config(config_path: Path | None = None) -> dict:
         )
 
     with open(path, encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-
-    # 解析邮箱密码中的环境变量
-    email = cfg.setdefault("email", {})
-    if "password" in email:
-        email["password"] = _resolve_env(email["password"])
-
-    # 补全IMAP host/port
-    provider = email.get("provider", "custom").lower()
-    if provider in IMAP_PRESETS:
-        email.setdefault("host", IMAP_PRESETS[provider]["host"])
-        email.setdefault("port", IMAP_PRESETS[provider]["port"])
-    elif provider == "custom":
-        if not email.get("host") or not email.get("port"):
-            raise ValueError("provider: custom 时必须填写 host 和 port")
+        cfg = yaml.safe_load(f) or {}
+    return normalize_config(cfg, require_accounts=require_accounts)
+
+
+def normalize_config(cfg: dict, require_accounts: bool = True, resolve_env: bool = True) -> dict:
+    """
+    校验账户并补全默认值（原地修改并返回 cfg）。
+    resolve_env: 是否把 ${ENV_VAR} 形式的密码替换为环境变量；来自外部请求的配置不应读取本机环境变量
+    """
+    # 多账户：accounts 列表；单账户写法 email 视为只有一个账户
+    accounts = cfg.get("accounts") or (
+        [cfg.setdefault("email", {})] if require_accounts or cfg.get("email") else []
+    )
+    if not isinstance(accounts, list):
+        raise ValueError("accounts 必须是列表")
+    names: set[str] = set()
+    for account in accounts:
+        if not isinstance(account, dict):
+            raise ValueError("accounts 的每一项必须是映射")
+        _normalize_account(account, resolve_env)
+        if account["name"] in names:
+            raise ValueError(f"账户名称重复: {account['name']}")
+        names.add(account["name"])
+    cfg["accounts"] = accounts
+    cfg["email"] = accounts[0] if accounts else {}
 
     # 补全默认值
     filters = cfg.setdefault("filters", {})
     filters.setdefault("subject_keywords", ["发票", "fapiao", "Invoice", "电子发票", "receipt", "invoice"])
     filters.setdefault("lookback_days", 30)
+    filters.setdefault("include_folders", [])     # 只扫描匹配的文件夹（通配符，匹配解码后的名称），空表示全部
+    filters.setdefault("exclude_folders", [])     # 不扫描匹配的文件夹
+    filters.setdefault("skip_special_use", list(DEFAULT_SKIP_SPECIAL_USE))  # 不扫描的特殊用途文件夹
 
     output = cfg.setdefault("output", {})
     output.setdefault("base_dir", "~/Downloads/发票归档")
@@ -67,5 +88,63 @@ def load_config(config_path: Path | None = None) -> dict:
     playwright = cfg.setdefault("playwright", {})
     playwright.setdefault("headless", True)
     playwright.setdefault("timeout_ms", 30000)
+    playwright.setdefault("ready_timeout_ms", 10000)   # 等待下载按钮出现（或直接触发下载）的上限
+    playwright.setdefault("block_resources", ["image", "media", "font", "stylesheet"])  # 不加载的资源类型
+    playwright.setdefault("block_trackers", True)      # 拦截统计/埋点域名
+
+    concurrency = cfg.setdefault("concurrency", {})
+    concurrency.setdefault("accounts", 4)        # 同时处理的账户数
+    concurrency.setdefault("parse_workers", 0)   # 并行解析进程数，0 表示不并行
+    concurrency.setdefault("browsers", 2)        # 同时运行的Chromium实例上限
+    concurrency.setdefault("http_connections", 10)
+
+    parsing = cfg.setdefault("parsing", {})
+    parsing.setdefault("isolate", True)          # 在受监督的子进程中解析，单个文件无法拖垮整次运行
+    parsing.setdefault("timeout_seconds", 60)    # 单个文件解析时间上限，超过则终止子进程、按未归类保存
+    parsing.setdefault("max_memory_mb", 1024)    # 解析子进程内存上限
+
+    bundles = cfg.setdefault("bundles", {})
+    bundles.setdefault("max_members", 500)     # 单个ZIP附件最多处理的文件数
+    bundles.setdefault("max_member_mb", 20)    # 单个文件解压后大小上限
+    bundles.setdefault("max_total_mb", 200)    # 单个ZIP解压后总大小上限
+    bundles.setdefault("max_ratio", 100)       # 压缩比上限（防zip炸弹）
+
+    imap = cfg.setdefault("imap", {})
+    imap.setdefault("max_batch", 20)          # 一条 UID FETCH 最多取回的邮件数（限流时自动减小）
+    imap.setdefault("max_reconnects", 5)      # 单条命令因限流/断连最多重试次数，超过则该账户本次失败
+    imap.setdefault("status_precheck", True)  # 先用 STATUS 检查，跳过空文件夹与上次扫描后无变化的文件夹
+
+    retry = cfg.setdefault("retry", {})
+    retry.setdefault("max_attempts", 5)       # 含首次处理在内的最多尝试次数，之后放弃
+    retry.setdefault("backoff_minutes", 30)   # 首次重试间隔，之后每次翻倍（最长1天）
+
+    service = cfg.setdefault("service", {})
+    service.setdefault("host", "127.0.0.1")   # 只监听本机；作业请求含邮箱授权码
+    service.setdefault("port", 8765)
+    service.setdefault("workers", 2)          # 同时运行的作业数（同一命名空间的作业依次运行）
+    service.setdefault("data_dir", "~/invoice-collector/service")  # 作业队列、各命名空间的状态与归档
+    service.setdefault("token", "")           # 非空时请求需带 Authorization: Bearer <token>
 
     return cfg
+
+
+def _normalize_account(email: dict, resolve_env: bool = True):
+    """解析密码环境变量、补全IMAP host/port与账户名称"""
+    provider = email.get("provider", "custom").lower()
+    if provider in LOCAL_PROVIDERS:
+        if not email.get("path"):
+            raise ValueError(f"provider: {provider} 时必须填写 path")
+        email.setdefault("name", str(email["path"]))
+        return
+
+    if "password" in email and resolve_env:
+        email["password"] = _resolve_env(email["password"])
+
+    if provider in IMAP_PRESETS:
+        email.setdefault("host", IMAP_PRESETS[provider]["host"])
+        email.setdefault("port", IMAP_PRESETS[provider]["port"])
+    elif provider == "custom":
+        if not email.get("host") or not email.get("port"):
+            raise ValueError("provider: custom 时必须填写 host 和 port")
+
+    email.setdefault("name", email.get("username", "default"))
@@ -1,11 +1,92 @@
 """IMAP邮件客户端：连接、搜索、获取邮件"""
 
 import imaplib
-import email
+import logging
+import re
+import ssl
+import time
 from email.header import decode_header
+from email.parser import BytesHeaderParser
 from datetime import datetime, timedelta
 from typing import Generator
 
+from .bodystructure import MessageStructure, PartInfo, parse_bodystructure, parse_fetch_response
+from .imap_folders import (
+    DEFAULT_SKIP_SPECIAL_USE, FolderStatusCache, Mailbox, parse_list_response, parse_status_response,
+    quote_mailbox, select_mailboxes,
+)
+from .metrics import METRICS, timed
+from .mime_parser import ParsedMessage, decode_body, parse_message_bytes
+
+logger = logging.getLogger(__name__)
+
+# 取结构时每条 UID FETCH 命令包含的邮件数
+STRUCTURE_BATCH = 200
+
+# 服务器以 NO/BAD 表示限流时的常见提示（RFC 5530 响应码及QQ/163等的中英文文案）
+_THROTTLE_HINTS = re.compile(
+    r"THROTTL|\[UNAVAILABLE\]|\[LIMIT\]|\[INUSE\]|too many|rate limit|try again later|server busy|频繁|稍后",
+    re.IGNORECASE,
+)
+# 连续限流时的等待时间（秒）：1, 2, 4 ... 最长 MAX_COOLDOWN
+MAX_COOLDOWN = 30.0
+
+
+class IMAPThrottled(RuntimeError):
+    """服务器持续限流或断开，重连次数用尽"""
+
+
+class RateController:
+    """
+    AIMD 请求速率与批量控制（每个连接一个）。
+    未遇到限流时不限速；一旦被限流（NO+限流提示、连接被断开），请求速率降为近期实际速率的一半、
+    批量减半；之后每次成功请求按时间线性恢复速率（每秒约 RATE_INCREASE 次/秒），批量逐次加一，
+    使吞吐在服务商的限额附近来回，而不是反复撞墙。
+    """
+
+    RATE_INCREASE = 0.5   # 每秒成功请求后速率上限的增量（次/秒）
+    MIN_RATE = 0.2        # 速率下限（次/秒）
+
+    def __init__(self, max_batch: int = 20):
+        self.max_batch = max(1, max_batch)
+        self.batch = min(4, self.max_batch)
+        self.rate: float | None = None      # 请求速率上限（次/秒），None 为不限
+        self._observed: float | None = None  # 近期实际请求速率（指数滑动平均）
+        self._last = 0.0
+        self._strikes = 0                    # 连续限流次数
+
+    def wait(self):
+        """请求前调用：按当前速率上限等待"""
+        now = time.monotonic()
+        if self.rate is not None and self._last:
+            delay = self._last + 1 / self.rate - now
+            if delay > 0:
+                time.sleep(delay)
+                now = time.monotonic()
+        if self._last:
+            instant = 1 / max(now - self._last, 1e-3)
+            self._observed = instant if self._observed is None else self._observed + 0.2 * (instant - self._observed)
+        self._last = now
+
+    def on_success(self):
+        self._strikes = 0
+        self.batch = min(self.max_batch, self.batch + 1)
+        if self.rate is not None:
+            self.rate += self.RATE_INCREASE / self.rate
+
+    def on_throttle(self) -> float:
+        """记录一次限流，返回重试前应等待的秒数"""
+        self._strikes += 1
+        base = self.rate or self._observed or 10.0
+        self.rate = max(self.MIN_RATE, base / 2)
+        self.batch = max(1, self.batch // 2)
+        METRICS.inc("imap_throttled_total")
+        return min(MAX_COOLDOWN, 2.0 ** (self._strikes - 1))
+
+
+def is_throttle_response(text: str) -> bool:
+    return bool(_THROTTLE_HINTS.search(text))
+
 
 def _decode_str(raw: bytes | str, charset: str | None) -> str:
     if isinstance(raw, str):
@@ -23,35 +104,119 @@ def decode_subject(subject_raw: str) -> str:
 
 
 class IMAPClient:
-    def __init__(self, cfg: dict):
-        self.host = cfg["email"]["host"]
-        self.port = cfg["email"]["port"]
-        self.username = cfg["email"]["username"]
-        self.password = cfg["email"]["password"]
+    description = "IMAP"
+
+    def __init__(self, cfg: dict, account: dict | None = None, key_prefix: str = "",
+                 folder_cache: FolderStatusCache | None = None):
+        """
+        account: 账户配置（默认 cfg["email"]）；每个账户各自持有一个IMAP连接。
+        key_prefix: 写入state.json的ID前缀，多账户时用于区分同名文件夹/UID。
+        folder_cache: STATUS 预检缓存，多账户并发时应共用同一实例（默认 ~/invoice-collector/folders.json）。
+        """
+        account = account or cfg["email"]
+        self.host = account["host"]
+        self.port = account["port"]
+        self.username = account["username"]
+        self.password = account["password"]
+        self.use_ssl = account.get("ssl", True)
+        self.key_prefix = key_prefix
         self.keywords = cfg["filters"]["subject_keywords"]
         self.lookback_days = cfg["filters"]["lookback_days"]
-        self._conn: imaplib.IMAP4_SSL | None = None
+        self.include_folders = cfg["filters"].get("include_folders") or []
+        self.exclude_folders = cfg["filters"].get("exclude_folders") or []
+        self.skip_special_use = cfg["filters"].get("skip_special_use", DEFAULT_SKIP_SPECIAL_USE)
+        imap_cfg = cfg.get("imap", {})
+        self.max_reconnects = imap_cfg.get("max_reconnects", 5)
+        self.rate = RateController(imap_cfg.get("max_batch", 20))
+        self.folder_cache = None
+        if imap_cfg.get("status_precheck", True):
+            self.folder_cache = folder_cache or FolderStatusCache()
+        self._conn: imaplib.IMAP4 | None = None
+        self._selected: str | None = None
+        # 本次扫描各文件夹的 STATUS，扫描完整结束后由 commit_scan 写入缓存；取信失败的文件夹不写
+        self._scanned: dict[str, dict] = {}
+        self._incomplete: set[str] = set()
+
+    @property
+    def _account_key(self) -> str:
+        return f"{self.username}@{self.host}:{self.port}"
+
+    @property
+    def _filters_digest(self) -> str:
+        return "|".join(sorted(kw.lower() for kw in self.keywords))
 
     def connect(self):
-        self._conn = imaplib.IMAP4_SSL(self.host, self.port)
+        if self.use_ssl:
+            self._conn = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            self._conn = imaplib.IMAP4(self.host, self.port)
+        self._selected = None
         try:
             self._conn.login(self.username, self.password)
         except imaplib.IMAP4.error as e:
             raise RuntimeError(f"IMAP认证失败: {e}") from e
 
-    def _list_all_folders(self) -> list[str]:
-        """列出所有可访问的邮件文件夹"""
-        _, folders = self._conn.list()
-        result = []
-        for item in folders:
-            if not isinstance(item, bytes):
+    def _request(self, folder: str | None, command):
+        """
+        执行一条IMAP命令：command(conn) 返回 (typ, data)。folder 不为 None 时先（按需）选中该文件夹。
+        连接被断开或服务器提示限流时，经 RateController 降速、等待并透明重连后重试，
+        重连 max_reconnects 次仍失败则抛出 IMAPThrottled；其他 NO/BAD 抛出 imaplib.IMAP4.error。
+        """
+        for attempt in range(self.max_reconnects + 1):
+            self.rate.wait()
+            try:
+                if self._conn is None:
+                    self.connect()
+                if folder is not None and folder != self._selected:
+                    typ, data = self._conn.select(quote_mailbox(folder), readonly=True)
+                    if typ != "OK":
+                        raise imaplib.IMAP4.error(f"SELECT {folder}: {_response_text(data)}")
+                    self._selected = folder
+                typ, data = command(self._conn)
+                if typ != "OK":
+                    raise imaplib.IMAP4.error(_response_text(data))
+            except (imaplib.IMAP4.abort, OSError, ssl.SSLError, EOFError) as e:
+                # 连接被服务器断开（QQ/163 限流的常见表现）：重连
+                cooldown = self.rate.on_throttle()
+                logger.warning(f"IMAP连接中断（{e}），{cooldown:.0f} 秒后重连（第 {attempt + 1} 次）")
+                time.sleep(cooldown)
+                self.disconnect()  # 下一轮循环重新连接
+                METRICS.inc("imap_reconnects_total")
                 continue
-            folder_str = item.decode("utf-8", errors="replace")
-            parts = folder_str.split('" ')
-            if len(parts) >= 2:
-                fname = parts[-1].strip().strip('"')
-                result.append(fname)
-        return result
+            except imaplib.IMAP4.error as e:
+                if not is_throttle_response(str(e)):
+                    raise
+                cooldown = self.rate.on_throttle()
+                logger.warning(f"IMAP服务器限流（{e}），{cooldown:.0f} 秒后重试")
+                time.sleep(cooldown)
+                continue
+            self.rate.on_success()
+            return data
+        raise IMAPThrottled(f"IMAP服务器持续限流或断开，已重试 {self.max_reconnects} 次")
+
+    def _list_all_folders(self) -> list[Mailbox]:
+        """列出所有邮件文件夹（含属性与解码后的名称）"""
+        return parse_list_response(self._request(None, lambda conn: conn.list()) or [])
+
+    def _list_folders(self) -> list[Mailbox]:
+        """按 include/exclude 规则与 SPECIAL-USE 属性筛选出要扫描的文件夹"""
+        mailboxes = self._list_all_folders()
+        selected = select_mailboxes(mailboxes, self.include_folders, self.exclude_folders, self.skip_special_use)
+        skipped = len(mailboxes) - len(selected)
+        if skipped:
+            logger.info(f"跳过 {skipped} 个文件夹（不可选中、特殊用途或被排除）")
+        return selected
+
+    def _folder_status(self, folder: str) -> dict[str, int]:
+        """STATUS 预检：不 SELECT 即可得到邮件数与 UIDNEXT；服务器不支持时返回空字典"""
+        try:
+            data = self._request(None, lambda conn: conn.status(
+                quote_mailbox(folder), "(MESSAGES UIDNEXT UIDVALIDITY)"
+            ))
+        except imaplib.IMAP4.error as e:
+            logger.debug(f"STATUS {folder} 失败: {e}")
+            return {}
+        return parse_status_response(data or [])
 
     def disconnect(self):
         if self._conn:
@@ -60,7 +225,9 @@ class IMAPClient:
             except Exception:
                 pass
             self._conn = None
+        self._selected = None
 
+    @timed("imap_search")
     def search_invoice_uids(self, since: datetime | None = None) -> list[tuple[str, str]]:
         """
         搜索所有文件夹中的邮件，返回 [(folder, uid), ...] 列表。
@@ -71,56 +238,193 @@ class IMAPClient:
 
         since_str = since.strftime("%d-%b-%Y")
         criteria = f'(SINCE "{since_str}")'
+        since_day = since.strftime("%Y-%m-%d")
 
         results: list[tuple[str, str]] = []
-        folders = self._list_all_folders()
+        self._scanned, self._incomplete = {}, set()
 
-        for folder in folders:
+        for mailbox in self._list_folders():
+            folder = mailbox.name
+            status = self._folder_status(folder) if self.folder_cache is not None else {}
+            if status.get("MESSAGES") == 0 or (status and self.folder_cache.unchanged(
+                self._account_key, folder, status, since_day, self._filters_digest
+            )):
+                # 空文件夹，或上次完整扫描后没有新邮件：不 SELECT/SEARCH
+                logger.debug(f"文件夹 {mailbox.display} 无变化，跳过")
+                METRICS.inc("imap_folders_skipped_total")
+                continue
             try:
-                ret, _ = self._conn.select(folder, readonly=True)
-                if ret != "OK":
-                    continue
-                _, data = self._conn.uid("search", None, criteria)
-                if data and data[0]:
-                    for uid in data[0].decode().split():
-                        results.append((folder, uid))
-            except Exception:
+                data = self._request(folder, lambda conn: conn.uid("search", None, criteria))
+            except imaplib.IMAP4.error as e:
+                # 不可选中的文件夹（\\Noselect）等：跳过；限流/断开已在 _request 中重试
+                logger.debug(f"跳过文件夹 {folder}: {e}")
                 continue
+            if data and data[0]:
+                for uid in data[0].decode().split():
+                    results.append((folder, uid))
+            if status:
+                self._scanned[folder] = {**status, "since": since_day, "filters": self._filters_digest}
 
         return results
 
-    def fetch_message(self, folder: str, uid: str) -> email.message.Message | None:
-        """切换到指定文件夹并获取单封邮件"""
+    def commit_scan(self):
+        """
+        本次扫描到的邮件都已处理并写入状态后调用：记录各文件夹的 STATUS，
+        下次运行时未变化的文件夹直接跳过。中途停止（时长用尽、出错）时不调用，下次照常扫描。
+        """
+        if self.folder_cache is not None:
+            scanned = {f: s for f, s in self._scanned.items() if f not in self._incomplete}
+            self.folder_cache.update(self._account_key, scanned)
+        self._scanned = {}
+
+    @timed("imap_fetch")
+    def fetch_message(self, folder: str, uid: str) -> ParsedMessage | None:
+        """切换到指定文件夹并获取单封邮件（单次遍历解析，正文按需解码）；邮件已不存在时返回None"""
+        return self.fetch_messages(folder, [uid]).get(uid)
+
+    @timed("imap_fetch_batch")
+    def fetch_messages(self, folder: str, uids: list[str]) -> dict[str, ParsedMessage]:
+        """一条 UID FETCH 命令取回多封邮件，返回 {uid: message}；已被删除的邮件不在结果中"""
         try:
-            self._conn.select(folder, readonly=True)
-            _, data = self._conn.uid("fetch", uid, "(RFC822)")
-            if not data or not data[0]:
-                return None
-            raw = data[0][1]
-            return email.message_from_bytes(raw)
-        except Exception:
+            data = self._request(folder, lambda conn: conn.uid("fetch", ",".join(uids), "(UID RFC822)"))
+        except imaplib.IMAP4.error as e:
+            logger.warning(f"获取邮件失败 ({folder} {uids[0]}…): {e}")
+            self._incomplete.add(folder)
+            return {}
+        result = {}
+        for item in parse_fetch_response(data or []):
+            raw = item.get("RFC822")
+            if "UID" not in item or not isinstance(raw, bytes):
+                continue
+            METRICS.inc("imap_messages_fetched_total")
+            METRICS.inc("imap_bytes_total", len(raw))
+            result[item["UID"]] = parse_message_bytes(bytes(raw))
+        return result
+
+    @timed("imap_structure")
+    def fetch_structures(self, folder: str, uids: list[str]) -> list[tuple[str, int, str, list[PartInfo]]]:
+        """
+        只取回邮件结构，不下载正文：返回 [(uid, 邮件字节数, 主题, 叶子部分列表), ...]。
+        按 STRUCTURE_BATCH 分批，一条命令取回一批邮件的 RFC822.SIZE、BODYSTRUCTURE 与主题头。
+        """
+        results = []
+        for start in range(0, len(uids), STRUCTURE_BATCH):
+            batch = ",".join(uids[start:start + STRUCTURE_BATCH])
+            data = self._request(folder, lambda conn: conn.uid(
+                "fetch", batch, "(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT)])"
+            ))
+            for item in parse_fetch_response(data or []):
+                if "UID" not in item or not isinstance(item.get("BODYSTRUCTURE"), list):
+                    continue
+                header = next((v for k, v in item.items() if k.startswith("BODY[HEADER")), b"")
+                if isinstance(header, str):
+                    header = header.encode("utf-8")
+                subject = decode_subject(BytesHeaderParser().parsebytes(header or b"").get("Subject", ""))
+                try:
+                    size = int(item.get("RFC822.SIZE") or 0)
+                except ValueError:
+                    size = 0
+                results.append((item["UID"], size, subject, parse_bodystructure(item["BODYSTRUCTURE"])))
+        return results
+
+    @timed("imap_fetch_sections")
+    def fetch_sections(self, folder: str, uid: str, sections: list[str]) -> dict[str, bytes]:
+        """取回单封邮件的指定部分（未解码的原始正文），不设置 \\Seen 标志"""
+        items = " ".join(f"BODY.PEEK[{section}]" for section in sections)
+        data = self._request(folder, lambda conn: conn.uid("fetch", uid, f"({items})"))
+        parsed = parse_fetch_response(data or [])
+        item = parsed[0] if parsed else {}
+        result = {}
+        for section in sections:
+            value = item.get(f"BODY[{section}]") or b""
+            result[section] = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+            METRICS.inc("imap_bytes_total", len(result[section]))
+        return result
+
+    def locate(self, key: str) -> str:
+        """重试定位信息："folder::uid"（去掉 key_prefix）"""
+        return key[len(self.key_prefix):]
+
+    def fetch_located(self, locator: str) -> tuple[ParsedMessage, str] | None:
+        """按 locate() 的结果直接取回单封邮件，返回 (message, subject)，不扫描文件夹"""
+        folder, _, uid = locator.rpartition("::")
+        msg = self.fetch_message(folder, uid)
+        if msg is None:
             return None
+        return msg, decode_subject(msg.get("Subject", ""))
 
     def iter_invoice_messages(
         self, since: datetime | None = None, known_uids: set[str] | None = None
-    ) -> Generator[tuple[str, email.message.Message, str], None, None]:
+    ) -> Generator[tuple[str, ParsedMessage, str], None, None]:
         """
         迭代发票邮件，返回 (folder_uid, message, subject) 三元组。
-        folder_uid 格式: "folder::uid"，作为全局唯一ID写入state.json。
+        folder_uid 格式: "folder::uid"（带 key_prefix 前缀），作为全局唯一ID写入state.json。
         known_uids: 已处理的ID集合，跳过。
         """
-        entries = self.search_invoice_uids(since)
         known = known_uids or set()
+        pending: dict[str, list[str]] = {}
+        for folder, uid in self.search_invoice_uids(since):
+            if f"{self.key_prefix}{folder}::{uid}" not in known:
+                pending.setdefault(folder, []).append(uid)
 
-        for folder, uid in entries:
-            key = f"{folder}::{uid}"
-            if key in known:
-                continue
-            msg = self.fetch_message(folder, uid)
-            if msg is None:
+        # 按 RateController 当前批量一次取回多封，限流时批量随之减小
+        for folder, uids in pending.items():
+            start = 0
+            while start < len(uids):
+                batch = uids[start:start + self.rate.batch]
+                start += len(batch)
+                messages = self.fetch_messages(folder, batch)
+                for uid in batch:
+                    msg = messages.get(uid)
+                    if msg is None:
+                        continue
+                    subject = decode_subject(msg.get("Subject", ""))
+                    if self._wanted(subject):
+                        yield f"{self.key_prefix}{folder}::{uid}", msg, subject
+
+    def iter_invoice_structures(
+        self, since: datetime | None = None, known_uids: set[str] | None = None
+    ) -> Generator[MessageStructure, None, None]:
+        """
+        与 iter_invoice_messages 相同的筛选，但只取回 BODYSTRUCTURE 与主题，不下载正文；
+        文本部分由 read_text 按需单独取回。
+        """
+        known = known_uids or set()
+        by_folder: dict[str, list[str]] = {}
+        for folder, uid in self.search_invoice_uids(since):
+            if f"{self.key_prefix}{folder}::{uid}" not in known:
+                by_folder.setdefault(folder, []).append(uid)
+
+        for folder, uids in by_folder.items():
+            try:
+                structures = self.fetch_structures(folder, uids)
+            except (imaplib.IMAP4.error, OSError) as e:
+                logger.warning(f"获取邮件结构失败 ({folder}): {e}")
                 continue
+            for uid, size, subject, parts in structures:
+                if self._wanted(subject):
+                    yield MessageStructure(
+                        key=f"{self.key_prefix}{folder}::{uid}", subject=subject, size=size, parts=parts,
+                        read_text=lambda wanted, folder=folder, uid=uid: self._read_text(folder, uid, wanted),
+                    )
+
+    def _read_text(self, folder: str, uid: str, parts: list[PartInfo]) -> list[str]:
+        raw = self.fetch_sections(folder, uid, [p.section for p in parts])
+        texts = []
+        for part in parts:
+            payload = decode_body(raw.get(part.section, b""), part.encoding)
+            try:
+                texts.append(payload.decode(part.charset or "utf-8", errors="replace"))
+            except LookupError:
+                texts.append(payload.decode("gbk", errors="replace"))
+        return texts
+
+    def _wanted(self, subject: str) -> bool:
+        """本地过滤：主题包含关键词"""
+        return any(kw.lower() in subject.lower() for kw in self.keywords)
+
 
-            subject = decode_subject(msg.get("Subject", ""))
-            # 本地过滤：主题包含关键词
-            if any(kw.lower() in subject.lower() for kw in self.keywords):
-                yield key, msg, subject
+def _response_text(data) -> str:
+    parts = data if isinstance(data, list) else [data]
+    return " ".join(p.decode("utf-8", errors="replace") if isinstance(p, bytes) else str(p)
+                    for p in parts if p is not None)
@@ -0,0 +1,199 @@
+"""PDF文字提取器的选择历史：按生成工具指纹记录各提取器的成功率与耗时，选择预计最快成功的顺序"""
+
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅保留进程内互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = Path("~/invoice-collector/extractor_stats.json").expanduser()
+
+# 每个提取器在同一指纹下至少试用的次数，之后按历史选择
+MIN_TRIALS = 3
+# 单个提取器的记录超过该次数时整体减半，让历史随生成工具升级逐渐更新
+MAX_HISTORY = 200
+
+# PDF文档信息字典中的字符串：字面量 (...) 或十六进制 <...>
+_INFO_FIELDS = {
+    name: re.compile(rb"/" + name.encode() + rb"\s*(\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)")
+    for name in ("Producer", "Creator", "Author")
+}
+_VERSION = re.compile(r"[\d.]+")
+
+
+def _decode_pdf_string(token: bytes) -> str:
+    if token.startswith(b"<"):
+        try:
+            raw = bytes.fromhex(token[1:-1].decode("ascii"))
+        except ValueError:
+            return ""
+    else:
+        raw = re.sub(rb"\\(.)", rb"\1", token[1:-1])
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+    return raw.decode("latin-1")
+
+
+def pdf_fingerprint(pdf_bytes: bytes) -> str:
+    """
+    由文档信息字典的 Producer / Creator / Author 组成指纹（去掉版本号）。
+    Author 通常是开票平台或销售方，用于区分同一生成工具下的不同开票方。
+    信息字典位于压缩对象流中时取不到，指纹为空串（按默认顺序处理）。
+    """
+    parts = []
+    for pattern in _INFO_FIELDS.values():
+        m = pattern.search(pdf_bytes)
+        value = _decode_pdf_string(m.group(1)) if m else ""
+        parts.append(_VERSION.sub("", value).strip().lower()[:40])
+    return "|".join(parts) if any(parts) else ""
+
+
+class ExtractorHistory:
+    """
+    每个指纹下各提取器的 [尝试次数, 成功次数, 累计耗时秒]。
+    解析可能发生在多个子进程中：各进程只累积增量，定期（及运行结束时）
+    在文件锁内与磁盘记录合并写回。
+    """
+
+    def __init__(self, path: Path | None = None, flush_every: int = 25):
+        self.path = path or DEFAULT_HISTORY_PATH
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, list]] | None = None
+        self._pending: dict[str, dict[str, list]] = {}
+        self._pending_count = 0
+        self._pid = os.getpid()
+
+    def order(self, fingerprint: str, names: tuple[str, ...]) -> list[str]:
+        """返回本指纹下的提取器尝试顺序；names 为默认顺序"""
+        with self._lock:
+            stats = self._loaded().get(fingerprint, {})
+        trials = {n: stats.get(n, [0, 0, 0.0])[0] for n in names}
+        untried = [n for n in names if trials[n] < MIN_TRIALS]
+        if untried:
+            # 试用期：尝试次数最少的排在最前（并列时保持默认顺序）
+            first = min(untried, key=lambda n: trials[n])
+            return [first] + [n for n in names if n != first]
+        return list(min(itertools.permutations(names), key=lambda o: _expected_cost(o, stats)))
+
+    def mean_seconds(self) -> float | None:
+        """所有指纹与提取器的平均单次提取耗时；没有历史时返回 None"""
+        with self._lock:
+            entries = [e for by_name in self._loaded().values() for e in by_name.values()]
+        attempts = sum(e[0] for e in entries)
+        return sum(e[2] for e in entries) / attempts if attempts else None
+
+    def record(self, fingerprint: str, name: str, ok: bool, seconds: float):
+        with self._lock:
+            self._reset_if_forked()
+            for target in (self._loaded(), self._pending):
+                entry = target.setdefault(fingerprint, {}).setdefault(name, [0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += int(ok)
+                entry[2] += seconds
+            _decay(self._stats)
+            self._pending_count += 1
+            should_flush = self._pending_count >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """把本进程的增量合并写回磁盘，并载入其他进程的最新记录"""
+        with self._lock:
+            self._reset_if_forked()
+            if not self._pending:
+                return
+            try:
+                with self._file_lock():
+                    merged = self._read_disk()
+                    for fingerprint, by_name in self._pending.items():
+                        for name, (attempts, successes, seconds) in by_name.items():
+                            entry = merged.setdefault(fingerprint, {}).setdefault(name, [0, 0, 0.0])
+                            entry[0] += attempts
+                            entry[1] += successes
+                            entry[2] += seconds
+                    _decay(merged)
+                    tmp = self.path.with_suffix(".json.tmp")
+                    tmp.write_text(json.dumps(merged, ensure_ascii=False), encoding="utf-8")
+                    tmp.replace(self.path)
+            except OSError as e:
+                logger.warning(f"写入提取器历史失败: {e}")
+                return
+            self._stats = merged
+            self._pending.clear()
+            self._pending_count = 0
+
+    def _loaded(self) -> dict:
+        if self._stats is None:
+            self._stats = self._read_disk()
+        return self._stats
+
+    def _read_disk(self) -> dict:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _reset_if_forked(self):
+        """fork出的子进程不继承父进程未写回的增量，避免重复计数"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._pending.clear()
+            self._pending_count = 0
+
+    @contextmanager
+    def _file_lock(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_suffix(".json.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _expected_cost(order: tuple[str, ...], stats: dict) -> float:
+    """按顺序尝试直到成功的期望耗时（成功率做拉普拉斯平滑）"""
+    total, reach = 0.0, 1.0
+    for name in order:
+        attempts, successes, seconds = stats.get(name, [0, 0, 0.0])
+        mean = seconds / attempts if attempts else 0.0
+        total += reach * mean
+        reach *= 1 - (successes + 1) / (attempts + 2)
+    return total
+
+
+def _decay(stats: dict):
+    for by_name in stats.values():
+        for entry in by_name.values():
+            if entry[0] > MAX_HISTORY:
+                entry[0] //= 2
+                entry[1] //= 2
+                entry[2] /= 2
+
+
+EXTRACTOR_HISTORY = ExtractorHistory()
+
+
+def flush_at_exit():
+    """
+    进程池子进程的 initializer：退出时写回未满 flush_every 的增量。
+    multiprocessing 子进程退出时不执行 atexit，只执行带 exitpriority 的 Finalize。
+    """
+    from multiprocessing import util
+
+    util.Finalize(None, EXTRACTOR_HISTORY.flush, exitpriority=10)
@@ -2,9 +2,14 @@
 
 import logging
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+from .metrics import METRICS
 from .pdf_parser import InvoiceFields
 
+if TYPE_CHECKING:
+    from .catalog import InvoiceCatalog
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,6 +35,15 @@ def get_output_dir(base_dir: Path, date_str: str) -> Path:
     return base_dir / "未归类"
 
 
+def plan_invoice_path(
+    fields: InvoiceFields, category: str, base_dir: Path, ext: str = ".pdf"
+) -> tuple[Path, str]:
+    """按当前命名/归档规则计算 (目标目录, 文件名)，不处理重名"""
+    if not fields.parse_ok:
+        return base_dir / "未归类", f"unknown{ext}"
+    return get_output_dir(base_dir, fields.date), build_filename(fields, category, ext)
+
+
 def save_invoice_file(
     file_bytes: bytes,
     fields: InvoiceFields,
@@ -37,25 +51,36 @@ def save_invoice_file(
     base_dir: Path,
     ext: str = ".pdf",
     dry_run: bool = False,
+    catalog: "InvoiceCatalog | None" = None,
+    source_uid: str = "",
 ) -> Path:
     """
     保存发票文件到目标目录，返回最终写入路径。
     dry_run=True 时只返回路径不写文件。
+    catalog 不为空时同时登记到发票目录（日期、金额、类型、哈希、来源UID、路径）。
     """
-    if not fields.parse_ok:
-        out_dir = base_dir / "未归类"
-        filename = f"unknown{ext}"
-    else:
-        out_dir = get_output_dir(base_dir, fields.date)
-        filename = build_filename(fields, category, ext)
+    out_dir, filename = plan_invoice_path(fields, category, base_dir, ext)
+    if dry_run:
+        return _resolve_conflict(out_dir / filename)
+
+    with METRICS.timer("disk_write"):
+        out_dir.mkdir(parents=True, exist_ok=True)
+        target = _write_new_file(out_dir / filename, file_bytes)
+    METRICS.inc("disk_bytes_written_total", len(file_bytes))
+    if catalog is not None:
+        from .catalog import file_sha256
+        catalog.record(target, fields, category, file_sha256(file_bytes), source_uid)
+    logger.info(f"已保存: {target}")
+    return target
 
-    target = _resolve_conflict(out_dir / filename)
 
+def move_invoice_file(src: Path, out_dir: Path, filename: str, dry_run: bool = False) -> Path:
+    """把已归档文件移动到新的目录/文件名，返回最终路径"""
+    target = _resolve_conflict(out_dir / filename)
     if not dry_run:
         out_dir.mkdir(parents=True, exist_ok=True)
-        target.write_bytes(file_bytes)
-        logger.info(f"已保存: {target}")
-
+        src.rename(target)
+        logger.info(f"已移动: {src} → {target}")
     return target
 
 
@@ -70,16 +95,45 @@ def save_pdf(
     return save_invoice_file(pdf_bytes, fields, category, base_dir, ext=".pdf", dry_run=dry_run)
 
 
+def is_same_slot(path: Path, target: Path) -> bool:
+    """path 是否就是 target 或其重名变体（target_2、target_3 ...）"""
+    if path.parent != target.parent or path.suffix != target.suffix:
+        return False
+    if path.stem == target.stem:
+        return True
+    head, _, counter = path.stem.rpartition("_")
+    return head == target.stem and counter.isdigit()
+
+
 def _resolve_conflict(path: Path) -> Path:
     """同名文件冲突时追加 _2、_3 后缀"""
-    if not path.exists():
-        return path
-    stem = path.stem
-    suffix = path.suffix
-    parent = path.parent
-    counter = 2
-    while True:
-        candidate = parent / f"{stem}_{counter}{suffix}"
+    for candidate in _candidate_paths(path):
         if not candidate.exists():
             return candidate
+
+
+def _write_new_file(path: Path, data: bytes) -> Path:
+    """
+    以独占方式创建文件并写入，返回实际路径。名称已被占用时换下一个 _2、_3 后缀：
+    多个账户线程/浏览器线程可能同时选中同一个名称（同日同金额同类型的两张发票），先检查再写入会互相覆盖。
+    """
+    for candidate in _candidate_paths(path):
+        try:
+            f = open(candidate, "xb")
+        except FileExistsError:
+            continue
+        try:
+            with f:
+                f.write(data)
+        except BaseException:
+            candidate.unlink(missing_ok=True)
+            raise
+        return candidate
+
+
+def _candidate_paths(path: Path):
+    yield path
+    counter = 2
+    while True:
+        yield path.parent / f"{path.stem}_{counter}{path.suffix}"
         counter += 1
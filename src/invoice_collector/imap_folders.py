@@ -0,0 +1,208 @@
+"""IMAP文件夹：LIST 响应解析（修改版UTF-7、SPECIAL-USE）、按规则筛选与 STATUS 预检缓存"""
+
+import base64
+import json
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+from .bodystructure import parse_response_items
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FOLDER_CACHE_PATH = Path("~/invoice-collector/folders.json").expanduser()
+
+# 默认不扫描的 SPECIAL-USE 文件夹（RFC 6154）：已删除、垃圾邮件、草稿，以及Gmail的"所有邮件"等虚拟文件夹
+DEFAULT_SKIP_SPECIAL_USE = ["\\Trash", "\\Junk", "\\Drafts", "\\All", "\\Flagged"]
+
+# 服务器未声明 SPECIAL-USE 时按常见名称识别（QQ/163/Outlook 等）
+_WELL_KNOWN_NAMES = {
+    "\\Trash": ("trash", "deleted messages", "deleted items", "deleted", "已删除", "已删除邮件", "垃圾箱"),
+    "\\Junk": ("junk", "junk e-mail", "junk email", "spam", "bulk mail", "垃圾邮件", "广告邮件"),
+    "\\Drafts": ("drafts", "draft", "草稿箱", "草稿"),
+    "\\Sent": ("sent", "sent messages", "sent items", "sent mail", "已发送", "已发送邮件"),
+}
+_NAME_TO_SPECIAL = {name: flag for flag, names in _WELL_KNOWN_NAMES.items() for name in names}
+_SPECIAL_USE_FLAGS = {"\\all", "\\archive", "\\drafts", "\\flagged", "\\junk", "\\sent", "\\trash"}
+_UNSELECTABLE = {"\\noselect", "\\nonexistent"}
+
+_STATUS_ITEM = re.compile(rb"(MESSAGES|UIDNEXT|UIDVALIDITY|UNSEEN|RECENT)\s+(\d+)", re.IGNORECASE)
+
+
+@dataclass
+class Mailbox:
+    """LIST 返回的一个文件夹"""
+    name: str                # 服务器上的原始名称（修改版UTF-7），用于命令与 state.json 中的ID
+    display: str             # 解码后的名称，用于日志与 include/exclude 规则
+    flags: frozenset[str]    # 小写的属性，如 {"\\hasnochildren", "\\trash"}
+    delimiter: str = "/"
+
+    @property
+    def selectable(self) -> bool:
+        return not (self.flags & _UNSELECTABLE)
+
+    @property
+    def special_use(self) -> str:
+        """SPECIAL-USE 属性（如 "\\Trash"）；服务器未声明时按常见名称推断，都没有时为空串"""
+        for flag in self.flags & _SPECIAL_USE_FLAGS:
+            return "\\" + flag[1:].capitalize()
+        leaf = self.display.rsplit(self.delimiter, 1)[-1] if self.delimiter else self.display
+        return _NAME_TO_SPECIAL.get(leaf.strip().lower(), "")
+
+
+def decode_mutf7(name: str) -> str:
+    """RFC 3501 修改版UTF-7：&...- 为 base64（"," 代替 "/"）编码的 UTF-16BE，"&-" 为 "&" """
+    def replace(m: re.Match) -> str:
+        encoded = m.group(1)
+        if not encoded:
+            return "&"
+        data = encoded.replace(",", "/")
+        try:
+            return base64.b64decode(data + "=" * (-len(data) % 4)).decode("utf-16-be")
+        except (ValueError, UnicodeDecodeError):
+            return m.group(0)
+
+    return re.sub(r"&([A-Za-z0-9+,]*)-", replace, name)
+
+
+def encode_mutf7(name: str) -> str:
+    out, pending = [], []
+
+    def flush():
+        if pending:
+            data = base64.b64encode("".join(pending).encode("utf-16-be")).decode("ascii")
+            out.append("&" + data.rstrip("=").replace("/", ",") + "-")
+            pending.clear()
+
+    for ch in name:
+        if 0x20 <= ord(ch) <= 0x7E:
+            flush()
+            out.append("&-" if ch == "&" else ch)
+        else:
+            pending.append(ch)
+    flush()
+    return "".join(out)
+
+
+def quote_mailbox(name: str) -> str:
+    """imaplib 不会给参数加引号：含空格、引号等的文件夹名需手动加"""
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def parse_list_response(data: list) -> list[Mailbox]:
+    """
+    解析 LIST 响应：每项为 (属性列表) 分隔符 名称，名称可为原子、带转义的引号串或字面量。
+    """
+    nodes = parse_response_items(data)
+    mailboxes = []
+    i = 0
+    while i + 2 < len(nodes):
+        flags, delimiter, raw = nodes[i], nodes[i + 1], nodes[i + 2]
+        if not isinstance(flags, list):
+            i += 1
+            continue
+        i += 3
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8", errors="replace")
+        if not isinstance(raw, str):
+            continue
+        mailboxes.append(Mailbox(
+            name=raw,
+            display=decode_mutf7(raw),
+            flags=frozenset(str(f).lower() for f in flags if f),
+            delimiter=delimiter if isinstance(delimiter, str) else "",
+        ))
+    return mailboxes
+
+
+def select_mailboxes(
+    mailboxes: list[Mailbox],
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    skip_special_use: list[str] | None = None,
+) -> list[Mailbox]:
+    """
+    筛选要扫描的文件夹。规则（通配符，匹配解码后或原始名称，不区分大小写）：
+    不可选中的文件夹总是跳过；设置了 include 时只保留匹配的文件夹（显式包含的特殊文件夹也保留），
+    否则跳过 skip_special_use 中的特殊文件夹；最后去掉匹配 exclude 的文件夹。
+    """
+    # 允许写成 "Trash" 或 "\\Trash"
+    if skip_special_use is None:
+        skip_special_use = DEFAULT_SKIP_SPECIAL_USE
+    skip = {s.lower().lstrip("\\") for s in skip_special_use}
+    result = []
+    for mailbox in mailboxes:
+        if not mailbox.selectable:
+            continue
+        if include:
+            if not _matches(mailbox, include):
+                continue
+        elif mailbox.special_use and mailbox.special_use.lower().lstrip("\\") in skip:
+            logger.debug(f"跳过特殊文件夹 {mailbox.display} ({mailbox.special_use})")
+            continue
+        if exclude and _matches(mailbox, exclude):
+            continue
+        result.append(mailbox)
+    return result
+
+
+def _matches(mailbox: Mailbox, patterns: list[str]) -> bool:
+    names = (mailbox.display.casefold(), mailbox.name.casefold())
+    return any(fnmatchcase(name, pattern.casefold()) for pattern in patterns for name in names)
+
+
+def parse_status_response(data: list) -> dict[str, int]:
+    """STATUS 响应 → {"MESSAGES": n, "UIDNEXT": n, ...}"""
+    result = {}
+    for item in data:
+        text = item[0] if isinstance(item, tuple) else item
+        if isinstance(text, bytes):
+            for key, value in _STATUS_ITEM.findall(text):
+                result[key.decode().upper()] = int(value)
+    return result
+
+
+class FolderStatusCache:
+    """
+    各账户文件夹上次完整扫描时的 STATUS（UIDVALIDITY、UIDNEXT、MESSAGES）与扫描起始日期。
+    三者与筛选条件都未变化、且本次起始日期不早于上次时，文件夹中没有新邮件，可以不 SELECT/SEARCH。
+    保存在 ~/invoice-collector/folders.json。
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or DEFAULT_FOLDER_CACHE_PATH
+        self._lock = threading.Lock()
+        self._data: dict[str, dict[str, dict]] | None = None
+
+    def unchanged(self, account: str, folder: str, status: dict[str, int], since: str, filters: str) -> bool:
+        """filters: 主题关键词等筛选条件的摘要，变化后之前未命中的邮件可能需要处理"""
+        with self._lock:
+            entry = self._loaded().get(account, {}).get(folder)
+        if not entry or entry.get("since", "") > since or entry.get("filters") != filters:
+            return False
+        return all(entry.get(key) == status.get(key) for key in ("UIDVALIDITY", "UIDNEXT", "MESSAGES"))
+
+    def update(self, account: str, statuses: dict[str, dict]):
+        """statuses: {folder: {"UIDVALIDITY", "UIDNEXT", "MESSAGES", "since", "filters"}}"""
+        if not statuses:
+            return
+        with self._lock:
+            self._loaded().setdefault(account, {}).update(statuses)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".json.tmp")
+                tmp.write_text(json.dumps(self._data, ensure_ascii=False, indent=2), encoding="utf-8")
+                tmp.replace(self.path)
+            except OSError as e:
+                logger.warning(f"写入文件夹状态缓存失败: {e}")
+
+    def _loaded(self) -> dict:
+        if self._data is None:
+            try:
+                self._data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._data = {}
+        return self._data
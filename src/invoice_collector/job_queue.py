@@ -0,0 +1,213 @@
+"""
+服务模式的持久化作业队列（SQLite）。
+库中只保存去掉密码的请求；邮箱授权码只在内存中保留到作业结束，
+所以服务重启时上次未完成的作业无法继续，标记为失败，需要重新提交。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    namespace    TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    request      TEXT NOT NULL,      -- JSON，不含密码
+    result       TEXT,               -- JSON：统计信息、归档目录、事件日志路径
+    error        TEXT NOT NULL DEFAULT '',
+    submitted_at TEXT NOT NULL,
+    started_at   TEXT NOT NULL DEFAULT '',
+    finished_at  TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, submitted_at);
+"""
+
+
+@dataclass
+class Job:
+    id: str
+    namespace: str
+    status: str
+    request: dict
+    result: dict | None = None
+    error: str = ""
+    submitted_at: str = ""
+    started_at: str = ""
+    finished_at: str = ""
+
+    def to_dict(self) -> dict:
+        """对外展示：请求中的密码始终隐去"""
+        return {
+            "id": self.id,
+            "namespace": self.namespace,
+            "status": self.status,
+            "request": redact(self.request),
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def redact(request: dict) -> dict:
+    """去掉 accounts/email 中的密码"""
+    result = dict(request)
+    for key in ("accounts", "email"):
+        value = request.get(key)
+        accounts = value if isinstance(value, list) else [value]
+        cleaned = [
+            {k: ("***" if k == "password" else v) for k, v in a.items()} if isinstance(a, dict) else a
+            for a in accounts
+        ]
+        if key in request:
+            result[key] = cleaned if isinstance(value, list) else cleaned[0]
+    return result
+
+
+def _chmod(path: Path, mode: int):
+    try:
+        os.chmod(path, mode)
+    except OSError:  # 文件尚未创建，或文件系统不支持（如 Windows）
+        pass
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobQueue:
+    """线程安全（单连接 + 锁）；库所在目录权限为 0700，库文件与 WAL 文件为 0600"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _chmod(self.path.parent, 0o700)
+        self._lock = threading.Lock()
+        # 作业ID → 含密码的完整请求，只在内存中
+        self._requests: dict[str, dict] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        for suffix in ("", "-wal", "-shm"):
+            _chmod(self.path.with_name(self.path.name + suffix), 0o600)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def recover(self) -> int:
+        """上次退出时排队或运行中的作业没有授权码，无法继续：标记为失败，返回作业数"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+                (FAILED, "服务重启，作业的邮箱授权码未保存，请重新提交", _now(), QUEUED, RUNNING),
+            )
+            return cur.rowcount
+
+    def submit(self, namespace: str, request: dict) -> Job:
+        job = Job(uuid.uuid4().hex[:16], namespace, QUEUED, request, submitted_at=_now())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, namespace, status, request, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, namespace, QUEUED, json.dumps(redact(request), ensure_ascii=False), job.submitted_at),
+            )
+            self._requests[job.id] = request
+        return job
+
+    def claim(self, busy_namespaces: set[str]) -> Job | None:
+        """取出最早提交、且所在命名空间没有作业在运行的排队作业，标记为运行中"""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY submitted_at, rowid", (QUEUED,)
+            ).fetchall()
+            for row in rows:
+                if row["namespace"] in busy_namespaces:
+                    continue
+                started = _now()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, started, row["id"])
+                )
+                job = self._to_job(row)
+                job.status, job.started_at = RUNNING, started
+                job.request = self._requests.get(job.id, job.request)
+                return job
+        return None
+
+    def finish(self, job_id: str, result: dict):
+        self._close_job(job_id, SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str):
+        self._close_job(job_id, FAILED, error=error)
+
+    def cancel(self, job_id: str) -> bool:
+        """只能取消排队中的作业"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, _now(), job_id, QUEUED),
+            )
+            if not cur.rowcount:
+                return False
+            self._requests.pop(job_id, None)
+            return True
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def list(self, status: str | None = None, limit: int = 50) -> list[Job]:
+        sql, params = "SELECT * FROM jobs", []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY submitted_at DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _close_job(self, job_id: str, status: str, result: dict | None = None, error: str = ""):
+        """作业结束：写入结果，丢弃内存中的授权码"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, _now(),
+                 job_id),
+            )
+            self._requests.pop(job_id, None)
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            namespace=row["namespace"],
+            status=row["status"],
+            request=json.loads(row["request"]),
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            submitted_at=row["submitted_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+        )
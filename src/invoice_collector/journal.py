@@ -0,0 +1,66 @@
+"""运行事件日志：每个处理结果即时追加一行JSON（JSONL），可用 tail -f 观察长时间运行的进度"""
+
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = Path("~/invoice-collector").expanduser()
+
+
+def default_journal_path(now: datetime | None = None) -> Path:
+    """按天分文件：~/invoice-collector/events_YYYYMMDD.jsonl"""
+    return DEFAULT_JOURNAL_DIR / (now or datetime.now()).strftime("events_%Y%m%d.jsonl")
+
+
+class EventJournal:
+    """
+    追加写入的事件日志，每条事件写完立即flush，进程崩溃也不会丢失已发生的记录。
+    每行格式: {"ts", "run", "event", "level", ...事件字段}。path 为 None 时不写入。
+    多线程共享同一实例时由内部锁串行化。
+    """
+
+    def __init__(self, path: Path | None = None, run_id: str | None = None):
+        self.path = path
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(path, "a", encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"无法打开事件日志 {path}: {e}")
+
+    def emit(self, event: str, level: str = "info", **fields):
+        if self._file is None:
+            return
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "run": self.run_id,
+            "event": event,
+            "level": level,
+            **fields,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                self._file.write(line)
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                logger.warning(f"写入事件日志失败: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
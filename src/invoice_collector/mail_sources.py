@@ -0,0 +1,269 @@
+"""邮件来源：IMAP 之外的本地导出（mbox / Maildir / .eml 目录），接口与 IMAPClient 一致"""
+
+import email.policy
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from email.feedparser import BytesFeedParser
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Generator, Protocol
+
+from .bodystructure import MessageStructure, structure_from_parsed
+from .config import LOCAL_PROVIDERS
+from .email_client import IMAPClient, decode_subject
+from .imap_folders import FolderStatusCache
+from .mime_parser import ParsedMessage, parse_message_bytes
+
+logger = logging.getLogger(__name__)
+
+# Maildir/.eml 每个扫描任务包含的文件数
+_FILES_PER_UNIT = 256
+
+
+class MessageSource(Protocol):
+    """
+    邮件来源接口。run_pipeline 依赖以下方法：
+    connect() / disconnect() / iter_invoice_messages(since, known_uids)，
+    后者产出 (key, ParsedMessage, subject) 三元组，key 写入 state.json 去重；
+    locate(key) / fetch_located(locator) 用于失败重试时直接取回单封邮件；
+    iter_invoice_structures() 供 plan 模式估算工作量；
+    commit_scan() 在一次扫描完整结束、结果都已写入状态后调用。
+    IMAPClient 按结构满足本接口（不继承，避免 email_client 反向导入）；
+    本地来源显式继承，沿用下面的默认实现。
+    """
+
+    description: str
+
+    @abstractmethod
+    def connect(self):
+        ...
+
+    def disconnect(self):
+        pass
+
+    @abstractmethod
+    def iter_invoice_messages(
+        self, since: datetime | None = None, known_uids: set[str] | None = None
+    ) -> Generator[tuple[str, ParsedMessage, str], None, None]:
+        ...
+
+    def iter_invoice_structures(
+        self, since: datetime | None = None, known_uids: set[str] | None = None
+    ) -> Generator[MessageStructure, None, None]:
+        """只需结构时的迭代；默认仍读取整封邮件（本地读取代价低），IMAP 改用 BODYSTRUCTURE"""
+        for key, msg, subject in self.iter_invoice_messages(since=since, known_uids=known_uids):
+            yield structure_from_parsed(key, subject, msg)
+
+    def commit_scan(self):
+        """记录扫描检查点（IMAP：各文件夹的 STATUS）；本地导出源无需记录"""
+
+    def locate(self, key: str):
+        """返回可写入 state.json 的定位信息（JSON可序列化），无法定位时返回None"""
+        return None
+
+    def fetch_located(self, locator) -> tuple[ParsedMessage, str] | None:
+        return None
+
+
+def create_source(
+    cfg: dict, account: dict, key_prefix: str = "", folder_cache: FolderStatusCache | None = None
+) -> MessageSource:
+    """按账户 provider 创建邮件来源：mbox/maildir/eml 为本地导出，其余走IMAP"""
+    if account.get("provider", "").lower() in LOCAL_PROVIDERS:
+        return LocalMailSource(cfg, account, key_prefix)
+    return IMAPClient(cfg, account, key_prefix=key_prefix, folder_cache=folder_cache)
+
+
+class LocalMailSource(MessageSource):
+    """
+    本地邮件导出来源。先在进程池中并行扫描各文件的头部（按日期、主题关键词过滤），
+    再在主进程中按偏移读取并解析命中的邮件；mbox 通过 mmap 流式切分，不整体读入内存。
+    key 格式: "{provider}::{Message-ID}"（无 Message-ID 时用内容哈希）。
+    """
+
+    description = "本地邮件源"
+
+    def __init__(self, cfg: dict, account: dict, key_prefix: str = ""):
+        raw_paths = account["path"] if isinstance(account["path"], list) else [account["path"]]
+        self.paths = [Path(p).expanduser() for p in raw_paths]
+        self.kind = account["provider"].lower()
+        self.keywords = cfg["filters"]["subject_keywords"]
+        self.lookback_days = cfg["filters"]["lookback_days"]
+        self.workers = account.get("workers") or os.cpu_count() or 1
+        self.key_prefix = key_prefix
+        self._maps: dict[str, tuple] = {}
+        self._locations: dict[str, list] = {}
+
+    def connect(self):
+        missing = [str(p) for p in self.paths if not p.exists()]
+        if missing:
+            raise RuntimeError(f"本地邮件源不存在: {', '.join(missing)}")
+
+    def disconnect(self):
+        for f, mm in self._maps.values():
+            mm.close()
+            f.close()
+        self._maps.clear()
+
+    def iter_invoice_messages(
+        self, since: datetime | None = None, known_uids: set[str] | None = None
+    ) -> Generator[tuple[str, ParsedMessage, str], None, None]:
+        if since is None:
+            since = datetime.now() - timedelta(days=self.lookback_days)
+        known = known_uids or set()
+        units = [(self.kind, files, since.timestamp(), self.keywords) for files in self._work_units()]
+
+        # spawn：账户线程并发运行时 fork 可能复制到被持有的锁
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(self.workers, len(units) or 1)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            for entries in executor.map(_scan_unit, units):
+                for path, start, end, message_id, subject in entries:
+                    key = f"{self.key_prefix}{self.kind}::{message_id}"
+                    if key in known:
+                        continue
+                    self._locations[key] = [path, start, end]
+                    yield key, parse_message_bytes(self._read(path, start, end)), subject
+
+    def locate(self, key: str) -> list | None:
+        """[path, start, end]：mbox 为邮件在文件中的字节区间，其余为整个文件"""
+        return self._locations.get(key)
+
+    def fetch_located(self, locator: list) -> tuple[ParsedMessage, str] | None:
+        path, start, end = locator
+        try:
+            if end > os.path.getsize(path):
+                return None  # 文件已被截断或改写
+            data = self._read(path, start, end)
+        except OSError:
+            return None
+        msg = parse_message_bytes(data)
+        return msg, decode_subject(str(msg.get("Subject", "")))
+
+    def _work_units(self) -> list[list[str]]:
+        if self.kind == "mbox":
+            files = [p for path in self.paths for p in _expand(path, ("*.mbox", "*.mbx", "*"))]
+            return [[str(f)] for f in files]
+        if self.kind == "maildir":
+            # 含 Maildir++ 子文件夹：所有 cur/ 与 new/ 下的文件
+            files = [
+                f for path in self.paths for f in sorted(path.rglob("*"))
+                if f.is_file() and f.parent.name in ("cur", "new") and not f.name.startswith(".")
+            ]
+        else:
+            files = [f for path in self.paths for f in _expand(path, ("*.eml",), recursive=True)]
+        names = [str(f) for f in files]
+        return [names[i:i + _FILES_PER_UNIT] for i in range(0, len(names), _FILES_PER_UNIT)]
+
+    def _read(self, path: str, start: int, end: int) -> bytes:
+        if self.kind != "mbox":
+            return Path(path).read_bytes()
+        if path not in self._maps:
+            f = open(path, "rb")
+            self._maps[path] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[path][1][start:end]
+
+
+def _expand(path: Path, patterns: tuple[str, ...], recursive: bool = False) -> list[Path]:
+    """单个文件直接返回；目录则按模式列出"""
+    if path.is_file():
+        return [path]
+    found: set[Path] = set()
+    for pattern in patterns:
+        matches = path.rglob(pattern) if recursive else path.glob(pattern)
+        found.update(p for p in matches if p.is_file() and not p.name.startswith("."))
+    return sorted(found)
+
+
+def _scan_unit(unit: tuple[str, list[str], float, list[str]]) -> list[tuple[str, int, int, str, str]]:
+    """子进程：扫描一组文件的邮件头，返回命中的 (path, start, end, message_id, subject)"""
+    kind, files, since_ts, keywords = unit
+    lowered = [kw.lower() for kw in keywords]
+    results = []
+    for path in files:
+        try:
+            spans = _scan_mbox(path) if kind == "mbox" else [_scan_file(path)]
+            for span_path, start, end, header, read_full in spans:
+                entry = _match_headers(header, since_ts, lowered, read_full)
+                if entry:
+                    message_id, subject = entry
+                    results.append((span_path, start, end, message_id, subject))
+        except (OSError, ValueError) as e:
+            logger.warning(f"本地邮件扫描失败 {path}: {e}")
+    return results
+
+
+def _scan_file(path: str) -> tuple[str, int, int, bytes, Callable[[], bytes]]:
+    """单封邮件文件：只读到头部结束的空行为止，整封内容按需读取"""
+    header = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(64 * 1024):
+            header += chunk
+            if _header_end(header) != -1:
+                break
+        size = os.fstat(f.fileno()).st_size
+    return path, 0, size, header, lambda: Path(path).read_bytes()
+
+
+def _scan_mbox(path: str):
+    """
+    按 From_ 分隔行切分mbox，产出 (path, start, end, header_bytes, read_full)。
+    只复制每封邮件的头部块；整封内容仅在需要内容哈希（无 Message-ID）时读取。
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:5] == b"From ":
+                line_start = 0
+            else:
+                nxt = mm.find(b"\nFrom ")
+                line_start = -1 if nxt == -1 else nxt + 1
+            while line_start != -1:
+                body_start = mm.find(b"\n", line_start) + 1
+                if body_start == 0:
+                    return
+                nxt = mm.find(b"\nFrom ", body_start - 1)
+                end = len(mm) if nxt == -1 else nxt
+                header_end = min(
+                    (i for i in (mm.find(b"\n\r\n", body_start, end), mm.find(b"\n\n", body_start, end)) if i != -1),
+                    default=end - 1,
+                )
+                yield (path, body_start, end, mm[body_start:header_end + 1],
+                       lambda s=body_start, e=end: mm[s:e])
+                line_start = -1 if nxt == -1 else nxt + 1
+
+
+def _header_end(data: bytes) -> int:
+    """头部块结束的位置（空行前的换行符），没有空行时返回 -1"""
+    candidates = [i for i in (data.find(b"\n\r\n"), data.find(b"\n\n")) if i != -1]
+    return min(candidates) if candidates else -1
+
+
+def _match_headers(
+    header: bytes, since_ts: float, keywords: list[str], read_full: Callable[[], bytes]
+) -> tuple[str, str] | None:
+    """只解析头部块：日期早于since或主题不含关键词时返回None；无 Message-ID 时才读取整封邮件计算哈希"""
+    end = _header_end(header)
+    parser = BytesFeedParser(policy=email.policy.default)
+    parser.feed(header[: end + 1] if end != -1 else header)
+    headers = parser.close()
+
+    subject = decode_subject(str(headers.get("Subject", "")))
+    if not any(kw in subject.lower() for kw in keywords):
+        return None
+    try:
+        sent = parsedate_to_datetime(str(headers.get("Date", "")))
+        if sent.timestamp() < since_ts:
+            return None
+    except (TypeError, ValueError):
+        pass  # 无法解析日期的邮件保留
+    message_id = str(headers.get("Message-ID", "")).strip().strip("<>")
+    return (message_id or hashlib.sha1(read_full()).hexdigest()), subject
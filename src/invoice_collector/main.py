@@ -19,7 +19,32 @@ def _setup_logging(verbose: bool):
     )
 
 
-@click.command()
+def _run_guarded(func, **kwargs):
+    """统一的错误处理：配置错误/运行错误退出码1，Ctrl-C退出码0"""
+    try:
+        return func(**kwargs)
+    except FileNotFoundError as e:
+        console.print(f"[bold red]配置文件错误:[/bold red] {e}")
+        sys.exit(1)
+    except RuntimeError as e:
+        console.print(f"[bold red]运行错误:[/bold red] {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        console.print("\n[yellow]用户中断[/yellow]")
+        sys.exit(0)
+
+
+_config_option = click.option(
+    "--config",
+    "-c",
+    "config_path",
+    default=None,
+    type=click.Path(exists=True, path_type=Path),
+    help="指定配置文件路径，默认为 ~/invoice-collector/config.yaml。",
+)
+
+
+@click.group(invoke_without_command=True)
 @click.option(
     "--month",
     "-m",
@@ -34,14 +59,7 @@ def _setup_logging(verbose: bool):
     default=False,
     help="预览模式：只打印将要操作的内容，不写入文件。",
 )
-@click.option(
-    "--config",
-    "-c",
-    "config_path",
-    default=None,
-    type=click.Path(exists=True, path_type=Path),
-    help="指定配置文件路径，默认为 ~/invoice-collector/config.yaml。",
-)
+@_config_option
 @click.option(
     "--verbose",
     "-v",
@@ -49,22 +67,176 @@ def _setup_logging(verbose: bool):
     default=False,
     help="显示详细调试日志。",
 )
-def main(month: str | None, dry_run: bool, config_path: Path | None, verbose: bool):
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="运行结束时写出各阶段耗时/字节数报告（JSON + Prometheus textfile）。",
+)
+@click.option(
+    "--profile-hotpaths",
+    is_flag=True,
+    default=False,
+    help="对PDF/OFD解析热点做cProfile采样，额外写出 .pstats 文件（只采样主进程内的解析，见 parsing.isolate）。",
+)
+@click.option(
+    "--retry-only",
+    is_flag=True,
+    default=False,
+    help="只处理已到期的失败重试（下载超时、HTTP 5xx 等），不扫描新邮件。",
+)
+@click.option(
+    "--max-duration",
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="MINUTES",
+    help="运行时长预算（分钟）。先处理附件与直链，再处理需浏览器的链接；用尽后剩余工作留待下次运行。",
+)
+@click.pass_context
+def main(
+    ctx: click.Context,
+    month: str | None,
+    dry_run: bool,
+    config_path: Path | None,
+    verbose: bool,
+    profile: bool,
+    profile_hotpaths: bool,
+    retry_only: bool,
+    max_duration: float | None,
+):
     """发票自动归档工具 - 从邮箱下载并整理发票PDF"""
     _setup_logging(verbose)
+    if ctx.invoked_subcommand is not None:
+        return
 
-    try:
-        from .pipeline import run_pipeline
-        run_pipeline(config_path=config_path, month=month, dry_run=dry_run)
-    except FileNotFoundError as e:
-        console.print(f"[bold red]配置文件错误:[/bold red] {e}")
-        sys.exit(1)
-    except RuntimeError as e:
-        console.print(f"[bold red]运行错误:[/bold red] {e}")
-        sys.exit(1)
-    except KeyboardInterrupt:
-        console.print("\n[yellow]用户中断[/yellow]")
-        sys.exit(0)
+    from .pipeline import run_pipeline
+    _run_guarded(
+        run_pipeline,
+        config_path=config_path,
+        month=month,
+        dry_run=dry_run,
+        profile=profile,
+        profile_hotpaths=profile_hotpaths,
+        retry_only=retry_only,
+        max_duration=max_duration,
+    )
+
+
+@main.command()
+@_config_option
+@click.option(
+    "--workers",
+    "-j",
+    default=None,
+    type=int,
+    help="并行解析进程数，默认为CPU核数。",
+)
+@click.option(
+    "--dry-run",
+    "-n",
+    is_flag=True,
+    default=False,
+    help="预览模式：只列出将要移动/重命名的文件。",
+)
+def reprocess(config_path: Path | None, workers: int | None, dry_run: bool):
+    """按当前规则离线重新解析归档目录中的所有PDF/OFD并重新命名/移动"""
+    from .reprocess import run_reprocess
+    _run_guarded(run_reprocess, config_path=config_path, workers=workers, dry_run=dry_run)
+
+
+@main.command()
+@_config_option
+@click.option(
+    "--month",
+    "-m",
+    default=None,
+    metavar="YYYY-MM",
+    help="指定估算月份，如 2025-01。默认近30天。",
+)
+def plan(config_path: Path | None, month: str | None):
+    """只读取邮件头与结构，估算发票数量、附件大小、需浏览器的链接数与预计耗时"""
+    from .planner import run_plan
+    _run_guarded(run_plan, config_path=config_path, month=month)
+
+
+@main.command()
+@_config_option
+@click.option("--host", default=None, help="监听地址，默认取配置 service.host（127.0.0.1）。")
+@click.option("--port", "-p", default=None, type=click.IntRange(0, 65535), help="监听端口，默认取配置 service.port（8765）。")
+@click.option("--workers", "-j", default=None, type=click.IntRange(min=1), help="同时运行的作业数，默认取配置 service.workers。")
+def serve(config_path: Path | None, host: str | None, port: int | None, workers: int | None):
+    """服务模式：通过本地HTTP接口提交作业、查询状态与下载结果，作业排队持久化"""
+    from .config import load_config
+    from .service import run_service
+
+    def _serve():
+        # 账户由各作业提供，配置文件中的邮箱可以不填
+        cfg = load_config(config_path, require_accounts=False)
+        run_service(cfg, host=host, port=port, workers=workers)
+
+    _run_guarded(_serve)
+
+
+@main.group()
+def catalog():
+    """查询已归档发票目录（~/invoice-collector/catalog.db）"""
+
+
+@catalog.command("summary")
+@click.option("--month", "-m", default=None, metavar="YYYY-MM", help="只汇总指定月份。")
+@click.option("--year", "-y", default=None, metavar="YYYY", help="只汇总指定年份。")
+@click.option("--category", "-t", default=None, help="只汇总指定类型，如 餐饮发票。")
+def catalog_summary(month: str | None, year: str | None, category: str | None):
+    """按 月份×类型 汇总张数与金额"""
+    from rich.table import Table
+    from .catalog import InvoiceCatalog
+
+    rows = InvoiceCatalog().summary(month=month, year=year, category=category)
+    table = Table(title="发票汇总", show_header=True, header_style="bold magenta")
+    table.add_column("月份", style="cyan")
+    table.add_column("类型")
+    table.add_column("张数", justify="right")
+    table.add_column("金额", justify="right")
+    total_count, total_cents = 0, 0
+    for row in rows:
+        table.add_row(row["month"] or "未归类", row["category"], str(row["count"]),
+                      f"{row['amount_cents'] / 100:.2f}")
+        total_count += row["count"]
+        total_cents += row["amount_cents"]
+    table.add_row("[bold]合计[/bold]", "", str(total_count), f"{total_cents / 100:.2f}")
+    console.print(table)
+
+
+@catalog.command("find")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def catalog_find(files: tuple[Path, ...]):
+    """按内容哈希检查文件是否已归档"""
+    from .catalog import InvoiceCatalog, file_sha256
+
+    cat = InvoiceCatalog()
+    for file in files:
+        rows = cat.find_by_hash(file_sha256(file.read_bytes()))
+        if rows:
+            for row in rows:
+                console.print(f"[green]已归档[/green] {file} → {row['path']}（{row['saved_at']}）")
+        else:
+            console.print(f"[yellow]未归档[/yellow] {file}")
+
+
+@catalog.command("rebuild")
+@_config_option
+def catalog_rebuild(config_path: Path | None):
+    """从归档目录的文件名重建发票目录（用于首次启用或目录丢失时）"""
+    from .catalog import InvoiceCatalog
+    from .config import load_config
+
+    def _rebuild():
+        cfg = load_config(config_path)
+        base_dir = Path(cfg["output"]["base_dir"]).expanduser()
+        count = InvoiceCatalog().rebuild_from_archive(base_dir)
+        console.print(f"[green]已登记 {count} 个文件[/green]")
+
+    _run_guarded(_rebuild)
 
 
 if __name__ == "__main__":
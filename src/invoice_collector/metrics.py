@@ -0,0 +1,185 @@
+"""运行指标：阶段计数、耗时直方图、传输字节数，以及可选的cProfile热点采样"""
+
+import cProfile
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+# 直方图桶上限（秒），最后一档为 +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROM_PREFIX = "invoice_collector"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        for i, upper in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """按桶上限估算分位数"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_s": round(self.total, 6),
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            "p50_le_ms": round(1000 * self.quantile(0.5), 3),
+            "p95_le_ms": round(1000 * self.quantile(0.95), 3),
+            "max_ms": round(1000 * self.max, 3),
+            "buckets": {
+                **{str(b): c for b, c in zip(LATENCY_BUCKETS, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+
+class Metrics:
+    """线程安全的指标注册表；全局实例为 METRICS"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.stages: dict[str, Histogram] = {}
+        self._profiler: cProfile.Profile | None = None
+        self._profiler_lock = threading.Lock()
+        self.started_at = time.time()
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.stages.clear()
+            self.started_at = time.time()
+        self._profiler = None
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # ---- cProfile 热点采样（仅解析器路径） ----
+    # 指标与采样都只记录本进程：在解析子进程中执行的解析器（parsing.isolate 或 parse_workers > 0）
+    # 只有父进程侧的端到端耗时，子进程内的 pdf_extractor/xml 等计数与热点不汇总
+
+    def enable_hotpath_profiling(self):
+        self._profiler = cProfile.Profile()
+
+    def run_profiled(self, func, *args, **kwargs):
+        """在共享profiler下执行；profiler同一时刻只能服务一个线程，被占用时直接执行"""
+        profiler = self._profiler
+        if profiler is None or not self._profiler_lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self._profiler_lock.release()
+
+    # ---- 报告输出 ----
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed_s": round(time.time() - self.started_at, 3),
+                "counters": dict(self.counters),
+                "stages": {name: h.to_dict() for name, h in self.stages.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{PROM_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+            metric = f"{PROM_PREFIX}_stage_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for stage, hist in sorted(self.stages.items()):
+                cumulative = 0
+                for upper, n in zip(LATENCY_BUCKETS, hist.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{upper:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {hist.total:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, out_dir: Path, stem: str) -> list[Path]:
+        """写 JSON + Prometheus textfile（以及热点 .pstats），返回写入的路径"""
+        out_dir.mkdir(parents=True, exist_ok=True)
+        json_path = out_dir / f"{stem}.json"
+        prom_path = out_dir / f"{stem}.prom"
+        json_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        # textfile collector 要求原子替换
+        tmp = prom_path.with_suffix(".prom.tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        tmp.replace(prom_path)
+        written = [json_path, prom_path]
+        if self._profiler is not None:
+            pstats_path = out_dir / f"{stem}.pstats"
+            with self._profiler_lock:
+                self._profiler.create_stats()
+                # 本进程内没有执行过解析（解析都在子进程中，或本次没有文件）时没有采样，不写 .pstats
+                if self._profiler.stats:
+                    pstats.Stats(self._profiler).dump_stats(str(pstats_path))
+                    written.append(pstats_path)
+        return written
+
+
+METRICS = Metrics()
+
+
+def timed(stage: str, profile: bool = False):
+    """装饰器：记录阶段耗时与调用次数；profile=True 时纳入热点采样"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(stage):
+                if profile:
+                    return METRICS.run_profiled(func, *args, **kwargs)
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,222 @@
+"""流式MIME解析模块：单次遍历记录各部分头部与正文偏移，正文按需解码"""
+
+import base64
+import email.message
+import email.policy
+import quopri
+from dataclasses import dataclass
+from email.feedparser import BytesFeedParser
+
+
+@dataclass
+class MimePart:
+    """MIME叶子部分：只保存头部与正文在原始字节中的偏移，不预先解码"""
+    headers: email.message.EmailMessage
+    raw: bytes
+    start: int
+    end: int
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get_content_type()
+
+    @property
+    def encoding(self) -> str:
+        return str(self.headers.get("Content-Transfer-Encoding", "")).strip().lower()
+
+    @property
+    def size(self) -> int:
+        """正文编码后的字节数（未解码）"""
+        return self.end - self.start
+
+    def get(self, name: str, default: str = "") -> str:
+        value = self.headers.get(name)
+        return default if value is None else str(value)
+
+    def get_filename(self, default: str = "") -> str:
+        return self.headers.get_filename(default)
+
+    def raw_body(self) -> bytes:
+        return self.raw[self.start:self.end]
+
+    def decode(self) -> bytes:
+        """按 Content-Transfer-Encoding 解码正文"""
+        return _decode_body(self.raw_body(), self.encoding)
+
+    def decode_head(self, n: int) -> bytes:
+        """只解码正文开头的约 n 字节（按魔数判断类型用），不解码整个正文"""
+        encoding = self.encoding
+        if encoding == "base64":
+            need = -(-n // 3) * 4
+            # 每76字符一个换行，多取一倍足以覆盖空白；不够时整段解码
+            window = b"".join(self.raw[self.start:min(self.end, self.start + need * 2 + 64)].split())
+            return _decode_body(window[:need], "base64")[:n]
+        if encoding == "quoted-printable":
+            window = self.raw[self.start:min(self.end, self.start + n * 3 + 64)]
+            cut = window.rfind(b"=", max(0, len(window) - 2))
+            if cut != -1 and self.start + len(window) < self.end:
+                window = window[:cut]  # 不截断 =XX 转义
+            return quopri.decodestring(window)[:n]
+        return self.raw[self.start:min(self.end, self.start + n)]
+
+    def decode_tail(self, n: int) -> bytes:
+        """只解码正文末尾的约 n 字节（读取ZIP中央目录用）"""
+        encoding = self.encoding
+        if encoding == "base64":
+            need = -(-n // 3) * 4
+            begin = max(self.start, self.end - need * 2 - 64)
+            window = b"".join(self.raw[begin:self.end].split())
+            if begin == self.start:
+                return _decode_body(window, "base64")[-n:]  # 窗口已覆盖整个正文
+            if len(window) % 4:
+                return self.decode()[-n:]  # 末尾不规整（缺填充等）：整段解码
+            # 完整的base64正文长度是4的倍数，从末尾按4字符对齐截取即落在分组边界上
+            return _decode_body(window[len(window) % 4:][-need:], "base64")[-n:]
+        if encoding == "quoted-printable":
+            return self.decode()[-n:]
+        return self.raw[max(self.start, self.end - n):self.end]
+
+    def get_text(self) -> str:
+        """解码文本部分，按声明字符集转为str，失败时回落GBK"""
+        payload = self.decode()
+        charset = self.headers.get_content_charset() or "utf-8"
+        try:
+            return payload.decode(charset, errors="replace")
+        except LookupError:
+            return payload.decode("gbk", errors="replace")
+
+
+@dataclass
+class ParsedMessage:
+    """一封邮件的解析结果：顶层头部 + 按遍历顺序排列的叶子部分"""
+    headers: email.message.EmailMessage
+    parts: list[MimePart]
+    raw: bytes
+
+    def get(self, name: str, default: str = "") -> str:
+        value = self.headers.get(name)
+        return default if value is None else str(value)
+
+    def text_parts(self) -> list[MimePart]:
+        return [p for p in self.parts if p.content_type in ("text/plain", "text/html")]
+
+
+def parse_message_bytes(raw: bytes) -> ParsedMessage:
+    """解析原始邮件字节，单次遍历收集所有叶子部分"""
+    header_end, body_start = _find_header_end(raw, 0, len(raw))
+    headers = _parse_headers(raw[:header_end])
+    parts: list[MimePart] = []
+    _collect_parts(raw, headers, body_start, len(raw), parts)
+    return ParsedMessage(headers=headers, parts=parts, raw=raw)
+
+
+def as_parsed(msg) -> ParsedMessage:
+    """兼容入口：接受 ParsedMessage、原始字节或 email.message.Message"""
+    if isinstance(msg, ParsedMessage):
+        return msg
+    if isinstance(msg, (bytes, bytearray)):
+        return parse_message_bytes(bytes(msg))
+    return parse_message_bytes(msg.as_bytes())
+
+
+def _parse_headers(header_bytes: bytes) -> email.message.EmailMessage:
+    """只把头部块喂给 BytesFeedParser，正文不进入对象树"""
+    parser = BytesFeedParser(policy=email.policy.default)
+    parser.feed(header_bytes)
+    parser.feed(b"\r\n")
+    return parser.close()
+
+
+def _collect_parts(
+    raw: bytes,
+    headers: email.message.EmailMessage,
+    start: int,
+    end: int,
+    parts: list[MimePart],
+):
+    """递归展开multipart与message/rfc822，叶子部分记录偏移"""
+    content_type = headers.get_content_type()
+    boundary = headers.get_boundary()
+
+    if headers.get_content_maintype() == "multipart" and boundary:
+        for sub_start, sub_end in _split_multipart(raw, start, end, boundary):
+            header_end, body_start = _find_header_end(raw, sub_start, sub_end)
+            sub_headers = _parse_headers(raw[sub_start:header_end])
+            _collect_parts(raw, sub_headers, body_start, sub_end, parts)
+        return
+
+    encoding = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+    if content_type == "message/rfc822" and encoding in ("", "7bit", "8bit", "binary"):
+        header_end, body_start = _find_header_end(raw, start, end)
+        inner = _parse_headers(raw[start:header_end])
+        _collect_parts(raw, inner, body_start, end, parts)
+        return
+
+    parts.append(MimePart(headers=headers, raw=raw, start=start, end=end))
+
+
+def _find_header_end(raw: bytes, start: int, end: int) -> tuple[int, int]:
+    """返回 (头部结束偏移, 正文起始偏移)"""
+    if raw.startswith(b"\r\n", start):
+        return start, start + 2
+    if raw.startswith(b"\n", start):
+        return start, start + 1
+    candidates = []
+    crlf = raw.find(b"\n\r\n", start, end)
+    if crlf != -1:
+        candidates.append((crlf + 1, crlf + 3))
+    lf = raw.find(b"\n\n", start, end)
+    if lf != -1:
+        candidates.append((lf + 1, lf + 2))
+    if not candidates:
+        return end, end
+    return min(candidates)
+
+
+def _split_multipart(raw: bytes, start: int, end: int, boundary: str) -> list[tuple[int, int]]:
+    """按边界切分multipart正文，返回各子部分的 (起始, 结束) 偏移"""
+    delimiter = b"--" + boundary.encode("ascii", errors="replace")
+    spans: list[tuple[int, int]] = []
+    current: int | None = None
+    pos = raw.find(delimiter, start, end)
+
+    while pos != -1:
+        if pos == start or raw[pos - 1] == 0x0A:
+            if current is not None:
+                # 分隔符前的换行属于分隔符本身
+                stop = pos - 1
+                if stop > current and raw[stop - 1] == 0x0D:
+                    stop -= 1
+                spans.append((current, max(current, stop)))
+                current = None
+            after = pos + len(delimiter)
+            if raw.startswith(b"--", after):
+                return spans
+            line_end = raw.find(b"\n", after, end)
+            if line_end == -1:
+                return spans
+            current = line_end + 1
+        pos = raw.find(delimiter, pos + len(delimiter), end)
+
+    # 缺少结束分隔符时，最后一段延伸到末尾
+    if current is not None and current < end:
+        spans.append((current, end))
+    return spans
+
+
+def decode_body(body: bytes, encoding: str) -> bytes:
+    """按 Content-Transfer-Encoding 解码一段正文（如IMAP单独取回的 BODY[section]）"""
+    return _decode_body(body, encoding.strip().lower())
+
+
+def _decode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "base64":
+        data = b"".join(body.split())
+        try:
+            return base64.b64decode(data + b"=" * (-len(data) % 4))
+        except ValueError:
+            # 残缺尾部：丢弃不足4字节的部分
+            return base64.b64decode(data[: len(data) - len(data) % 4])
+    if encoding == "quoted-printable":
+        return quopri.decodestring(body)
+    return body
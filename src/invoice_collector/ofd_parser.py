@@ -5,13 +5,16 @@ import logging
 import zipfile
 from io import BytesIO
 
-from .pdf_parser import InvoiceFields, DATE_PATTERN, TOTAL_PATTERNS, SERVICE_PATTERN
+from .metrics import METRICS, timed
+from .pdf_parser import InvoiceFields, DATE_PATTERN, TOTAL_PATTERNS, SERVICE_PATTERN, fill_identifiers
 
 logger = logging.getLogger(__name__)
 
 
+@timed("parse_ofd", profile=True)
 def parse_ofd_bytes(ofd_bytes: bytes) -> InvoiceFields:
     """解析OFD字节，提取发票关键字段（与parse_pdf_bytes接口一致）"""
+    METRICS.inc("ofd_bytes_parsed_total", len(ofd_bytes))
     text = _extract_text_from_ofd(ofd_bytes)
     if not text or len(text.strip()) < 20:
         logger.warning("OFD文字提取不足20字符，标记为解析失败")
@@ -21,6 +24,7 @@ def parse_ofd_bytes(ofd_bytes: bytes) -> InvoiceFields:
     fields.date = _parse_date(text)
     fields.amount = _parse_amount(text)
     fields.service = _parse_service(text)
+    fill_identifiers(fields, text)
     fields.parse_ok = bool(fields.date or fields.amount)
     return fields
 
@@ -36,12 +40,16 @@ def _extract_text_from_ofd(ofd_bytes: bytes) -> str:
                         content = zf.read(name).decode("utf-8", errors="replace")
                         text = re.sub(r"<[^>]+>", " ", content)
                         texts.append(text)
+                    except MemoryError:
+                        raise  # 由解析子进程按内存超限处理
                     except Exception as e:
                         logger.debug(f"OFD内部文件解析失败 {name}: {e}")
             return "\n".join(texts)
     except zipfile.BadZipFile as e:
         logger.warning(f"OFD不是有效ZIP文件: {e}")
         return ""
+    except MemoryError:
+        raise  # 由解析子进程按内存超限处理
     except Exception as e:
         logger.error(f"OFD解析异常: {e}")
         return ""
@@ -0,0 +1,297 @@
+"""共享解析池：PDF/OFD解析可在进程池中执行，多账户并发时共用"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .extractor_history import flush_at_exit
+from .metrics import METRICS
+from .ofd_parser import parse_ofd_bytes
+from .pdf_parser import InvoiceFields, parse_pdf_bytes
+
+try:
+    import resource
+except ImportError:  # Windows：没有 setrlimit/getrusage，只保留超时限制
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# 子进程内存超限时的退出码，供监督方区分"内存超限"与其他崩溃
+_RSS_EXIT_CODE = 86
+# 子进程启动（导入 pdfplumber 等）的等待上限，不计入单个文件的解析时间
+_STARTUP_TIMEOUT = 60
+# 每个子进程最多解析的文件数，之后换新进程（回收解析库的内存碎片）
+MAX_JOBS_PER_WORKER = 500
+
+
+def parse_invoice_bytes(file_bytes: bytes, fmt: str) -> InvoiceFields:
+    """按格式分派到对应解析器"""
+    if fmt == "ofd":
+        return parse_ofd_bytes(file_bytes)
+    return parse_pdf_bytes(file_bytes)
+
+
+@dataclass
+class ParseLimits:
+    """隔离解析子进程的单文件上限"""
+    timeout_seconds: float = 60            # 单个文件解析的墙钟时间上限
+    max_rss_bytes: int = 1024 * 1024 * 1024  # 子进程常驻内存上限
+
+    @classmethod
+    def from_config(cls, parsing_cfg: dict) -> "ParseLimits":
+        return cls(
+            timeout_seconds=parsing_cfg["timeout_seconds"],
+            max_rss_bytes=int(parsing_cfg["max_memory_mb"] * 1024 * 1024),
+        )
+
+
+class ParseLimitExceeded(Exception):
+    """解析超时、内存超限或子进程崩溃；子进程已被终止"""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+class ParserPool:
+    """
+    workers <= 0 且未设置 limits 时在调用线程内解析；
+    未设置 limits 时提交到共享进程池，解析是CPU密集型，多账户线程并发时不再受GIL限制；
+    设置 limits 时使用 max(1, workers) 个受监督的隔离子进程：单个文件超时或超内存时终止并替换该进程，
+    该文件返回空字段（failure_reason 记录原因，按未归类保存），不影响其他文件。
+    """
+
+    def __init__(self, workers: int = 0, limits: ParseLimits | None = None):
+        self.workers = workers
+        self.limits = limits
+        # spawn：账户线程并发运行时 fork 可能复制到被持有的锁
+        self._executor = (
+            ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=flush_at_exit
+            )
+            if workers > 0 and limits is None else None
+        )
+        self._supervised: _SupervisedWorkers | None = None
+        self._dispatch: ThreadPoolExecutor | None = None
+        if limits is not None:
+            self._supervised = _SupervisedWorkers(max(1, workers), limits)
+            self._dispatch = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="parse")
+
+    def parse(self, file_bytes: bytes, fmt: str) -> InvoiceFields:
+        if self._supervised is not None:
+            with METRICS.timer(f"parse_{fmt}"):
+                return self._parse_isolated(file_bytes, fmt)
+        if self._executor is None:
+            return parse_invoice_bytes(file_bytes, fmt)
+        # 子进程内的指标不回传，这里按阶段记录含排队的端到端耗时
+        with METRICS.timer(f"parse_{fmt}"):
+            return self._executor.submit(parse_invoice_bytes, file_bytes, fmt).result()
+
+    def parse_many(self, items: list[tuple[bytes, str]]) -> list[InvoiceFields | Exception]:
+        """
+        批量解析 [(file_bytes, fmt), ...]，有进程池时并行执行。
+        返回值与输入一一对应；单个文件解析抛出的异常作为返回值，不影响其他文件。
+        """
+        if self._dispatch is not None and len(items) >= 2:
+            with METRICS.timer("parse_batch"):
+                futures = [self._dispatch.submit(self.parse, b, fmt) for b, fmt in items]
+                return [_capture(f.result) for f in futures]
+        if self._executor is None or len(items) < 2:
+            return [_capture(self.parse, b, fmt) for b, fmt in items]
+        with METRICS.timer("parse_batch"):
+            futures = [self._executor.submit(parse_invoice_bytes, b, fmt) for b, fmt in items]
+            return [_capture(f.result) for f in futures]
+
+    def _parse_isolated(self, file_bytes: bytes, fmt: str) -> InvoiceFields:
+        try:
+            return self._supervised.run(file_bytes, fmt)
+        except ParseLimitExceeded as e:
+            METRICS.inc("parse_workers_killed_total")
+            logger.warning(f"{fmt.upper()}解析被终止（{e}），按未归类保存")
+            return InvoiceFields(failure_reason=e.reason)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._dispatch is not None:
+            self._dispatch.shutdown(wait=True, cancel_futures=True)
+            self._dispatch = None
+        if self._supervised is not None:
+            self._supervised.close()
+            self._supervised = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+class _SupervisedWorkers:
+    """固定数量的解析子进程；空闲进程放在队列中，调用线程独占一个进程完成一次解析"""
+
+    def __init__(self, size: int, limits: ParseLimits):
+        self.limits = limits
+        # spawn：账户线程并发运行时 fork 可能复制到被持有的锁
+        self._mp = multiprocessing.get_context("spawn")
+        self._idle: queue.Queue[_Worker | None] = queue.Queue()
+        self._all: set[_Worker] = set()
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(None)  # 按需启动
+
+    def run(self, file_bytes: bytes, fmt: str) -> InvoiceFields:
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                worker = self._spawn()
+            result = worker.run(file_bytes, fmt, self.limits.timeout_seconds)
+        except ParseLimitExceeded:
+            self._retire(worker)
+            worker = None
+            raise
+        finally:
+            if worker is not None and worker.jobs >= MAX_JOBS_PER_WORKER:
+                self._retire(worker, graceful=True)
+                worker = None
+            self._idle.put(worker)
+        return result
+
+    def close(self):
+        with self._lock:
+            workers = list(self._all)
+        for worker in workers:
+            self._retire(worker, graceful=True)
+
+    def _spawn(self) -> "_Worker":
+        worker = _Worker(self._mp, self.limits.max_rss_bytes)
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def _retire(self, worker: "_Worker | None", graceful: bool = False):
+        if worker is None:
+            return
+        with self._lock:
+            self._all.discard(worker)
+        worker.stop(graceful)
+
+
+class _Worker:
+    def __init__(self, mp, max_rss_bytes: int):
+        self.conn, child = mp.Pipe()
+        self.process = mp.Process(target=_worker_main, args=(child, max_rss_bytes), daemon=True)
+        self.process.start()
+        child.close()
+        self.max_rss_bytes = max_rss_bytes
+        self.jobs = 0
+        self._ready = False
+
+    def run(self, file_bytes: bytes, fmt: str, timeout: float) -> InvoiceFields:
+        if not self._ready:
+            self._receive(_STARTUP_TIMEOUT, "解析进程启动超时")
+            self._ready = True
+        self.jobs += 1
+        try:
+            self.conn.send((file_bytes, fmt))
+        except (OSError, ValueError) as e:
+            raise ParseLimitExceeded(*self._death()) from e
+        ok, value = self._receive(timeout, "解析超时", f"超过 {timeout:g} 秒")
+        if ok:
+            return value
+        raise RuntimeError(value)
+
+    def _receive(self, timeout: float, reason: str, detail: str = ""):
+        if not self.conn.poll(timeout):
+            raise ParseLimitExceeded(reason, detail)
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise ParseLimitExceeded(*self._death()) from e
+
+    def _death(self) -> tuple[str, str]:
+        """子进程已退出：返回 (原因, 详情)"""
+        self.process.join(1)
+        if self.process.exitcode == _RSS_EXIT_CODE:
+            return "解析内存超限", f"超过 {self.max_rss_bytes // 1024 // 1024} MB"
+        return "解析进程异常退出", f"退出码 {self.process.exitcode}"
+
+    def stop(self, graceful: bool = False):
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send(None)  # 让子进程写回提取器历史后退出
+                self.process.join(5)
+            except (OSError, ValueError):
+                pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+
+def _worker_main(conn, max_rss_bytes: int):
+    """子进程：逐个接收 (file_bytes, fmt) 解析并回传 (ok, fields | 错误信息)，收到 None 时退出"""
+    from .extractor_history import EXTRACTOR_HISTORY
+
+    _limit_memory(max_rss_bytes)
+    threading.Thread(target=_watch_rss, args=(max_rss_bytes,), daemon=True).start()
+    conn.send((True, None))  # 就绪
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break  # 父进程已退出
+        if job is None:
+            break
+        try:
+            fields = parse_invoice_bytes(*job)
+            conn.send((True, fields))
+        except MemoryError:
+            # 分配超过内核限制：按内存超限退出，由监督方替换进程
+            os._exit(_RSS_EXIT_CODE)
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    EXTRACTOR_HISTORY.flush()
+
+
+def _limit_memory(max_bytes: int):
+    """
+    由内核强制的内存上限：单次大分配（如巨大的 Flate 流）在分配时即失败（MemoryError），
+    不会在轮询间隔内耗尽主机内存。Linux 限制数据段（含匿名 mmap），不计共享库映射；其他平台限制地址空间。
+    """
+    if resource is None:
+        return
+    limit = resource.RLIMIT_DATA if sys.platform.startswith("linux") else resource.RLIMIT_AS
+    try:
+        _, hard = resource.getrlimit(limit)
+        resource.setrlimit(limit, (max_bytes if hard == resource.RLIM_INFINITY else min(max_bytes, hard), hard))
+    except (ValueError, OSError) as e:
+        sys.stderr.write(f"无法设置解析进程内存上限: {e}\n")
+
+
+def _watch_rss(max_rss_bytes: int):
+    """
+    每0.1秒检查本进程的峰值常驻内存，超限立即退出（ru_maxrss 在 macOS 为字节，Linux 为KB）。
+    硬上限由 _limit_memory 保证；这里只是让逐步增长、未触发分配失败的超限也以内存超限的退出码结束。
+    """
+    if resource is None:
+        return
+    scale = 1 if sys.platform == "darwin" else 1024
+    while True:
+        if resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale > max_rss_bytes:
+            os._exit(_RSS_EXIT_CODE)
+        time.sleep(0.1)
+
+
+def _capture(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
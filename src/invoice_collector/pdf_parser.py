@@ -2,9 +2,13 @@
 
 import re
 import logging
+import time
 from dataclasses import dataclass, field
 from io import BytesIO
 
+from .extractor_history import EXTRACTOR_HISTORY, pdf_fingerprint
+from .metrics import METRICS, timed
+
 logger = logging.getLogger(__name__)
 
 # 开票日期正则：支持 年月日 / - 等分隔符
@@ -20,6 +24,13 @@ TOTAL_PATTERNS = [
 ]
 # 货物或服务名称（表格首行，去除税目前缀*）
 SERVICE_PATTERN = re.compile(r"\*[^*]+\*(.+)")
+# 发票号码：传统发票8位，全电发票20位；发票代码：10或12位（全电发票没有）
+NUMBER_PATTERN = re.compile(r"发票号码[：:]?\s*(\d{20}|\d{8})(?!\d)")
+CODE_PATTERN = re.compile(r"发票代码[：:]?\s*(\d{12}|\d{10})(?!\d)")
+# 纳税人识别号 / 统一社会信用代码：购买方在前、销售方在后，取最后一个
+TAX_ID_PATTERN = re.compile(r"(?:纳税人识别号|统一社会信用代码)[：:]?\s*([0-9A-Z]{15,20})(?![0-9A-Z])")
+# 邮件主题/正文中不带标签的全电发票号码
+_BARE_NUMBER_PATTERN = re.compile(r"(?<!\d)\d{20}(?!\d)")
 
 
 @dataclass
@@ -27,32 +38,91 @@ class InvoiceFields:
     date: str = ""          # YYYYMMDD
     amount: str = ""        # "1200.00"
     service: str = ""       # 货物/服务名称
+    invoice_number: str = ""  # 发票号码
+    invoice_code: str = ""    # 发票代码（全电发票为空）
+    seller_tax_id: str = ""   # 销售方纳税人识别号
     raw_text: str = ""
     parse_ok: bool = False  # 是否成功解析到关键字段
+    failure_reason: str = ""  # 解析被终止的原因（超时/内存超限），见 parser_pool
 
 
+@timed("parse_pdf", profile=True)
 def parse_pdf_bytes(pdf_bytes: bytes) -> InvoiceFields:
-    """解析PDF字节，提取发票关键字段"""
-    text = _extract_text(pdf_bytes)
-    if not text or len(text.strip()) < 50:
+    """
+    解析PDF字节，提取发票关键字段。
+    按PDF生成工具指纹选择提取器顺序（见 extractor_history）；归档必需的日期与金额
+    未能解析时换下一个提取器，最终取解析出字段最多的结果。
+    服务名称不作要求：部分版式没有带税目前缀的项目行，分类时会回退到全文匹配。
+    先用哪个提取器取决于历史记录（试用期内轮流），两者的文本排版不同，项目名称可能随之不同。
+    """
+    METRICS.inc("pdf_bytes_parsed_total", len(pdf_bytes))
+    fingerprint = pdf_fingerprint(pdf_bytes)
+    best: InvoiceFields | None = None
+    for name in EXTRACTOR_HISTORY.order(fingerprint, tuple(_EXTRACTORS)):
+        start = time.perf_counter()
+        fields = _fields_from_text(_EXTRACTORS[name](pdf_bytes))
+        complete = bool(fields.date and fields.amount)
+        EXTRACTOR_HISTORY.record(fingerprint, name, complete, time.perf_counter() - start)
+        METRICS.inc(f"pdf_extractor_{name}_total")
+        if complete:
+            return fields
+        if best is None or (_completeness(fields), len(fields.raw_text.strip())) > (
+            _completeness(best), len(best.raw_text.strip())
+        ):
+            best = fields
+        logger.debug(f"{name}未解析出日期或金额，切换下一个提取器")
+
+    if len(best.raw_text.strip()) < 50:
         logger.warning("PDF文字提取不足50字符，标记为解析失败")
-        return InvoiceFields(raw_text=text)
+    return best
+
+
+def _completeness(fields: InvoiceFields) -> int:
+    return bool(fields.date) + bool(fields.amount) + bool(fields.service)
 
+
+def _fields_from_text(text: str) -> InvoiceFields:
     fields = InvoiceFields(raw_text=text)
+    if not text or len(text.strip()) < 50:
+        return fields
     fields.date = _parse_date(text)
     fields.amount = _parse_amount(text)
     fields.service = _parse_service(text)
+    fill_identifiers(fields, text)
     fields.parse_ok = bool(fields.date or fields.amount)
     return fields
 
 
-def _extract_text(pdf_bytes: bytes) -> str:
-    """先用pdfplumber，字符数<50时切换pypdf"""
-    text = _extract_with_pdfplumber(pdf_bytes)
-    if len(text.strip()) >= 50:
-        return text
-    logger.debug("pdfplumber提取字符不足，切换pypdf")
-    return _extract_with_pypdf(pdf_bytes)
+def fill_identifiers(fields: InvoiceFields, text: str):
+    """解析发票号码、发票代码与销售方纳税人识别号（PDF与OFD共用）"""
+    m = NUMBER_PATTERN.search(text)
+    fields.invoice_number = m.group(1) if m else ""
+    m = CODE_PATTERN.search(text)
+    fields.invoice_code = m.group(1) if m else ""
+    tax_ids = TAX_ID_PATTERN.findall(text)
+    fields.seller_tax_id = tax_ids[-1] if tax_ids else ""
+
+
+def find_invoice_numbers(text: str) -> list[str]:
+    """
+    邮件主题/正文中出现的发票号码：带"发票号码"标签的8位或20位数字，
+    以及不带标签的20位数字（全电发票号码），按出现顺序去重。
+    """
+    found = NUMBER_PATTERN.findall(text) + _BARE_NUMBER_PATTERN.findall(text)
+    return list(dict.fromkeys(found))
+
+
+def find_invoice_codes(text: str) -> list[str]:
+    """邮件主题/正文中带"发票代码"标签的10位或12位数字，按出现顺序去重"""
+    return list(dict.fromkeys(CODE_PATTERN.findall(text)))
+
+
+def _reraise_memory_error(e: BaseException):
+    """分配失败不当作普通提取失败：交给解析子进程按内存超限处理（pdfplumber 会把它包装成 PdfminerException）"""
+    while e is not None:
+        if isinstance(e, MemoryError):
+            raise e
+        e = e.__cause__ or e.__context__
 
 
 def _extract_with_pdfplumber(pdf_bytes: bytes) -> str:
@@ -65,6 +135,7 @@ def _extract_with_pdfplumber(pdf_bytes: bytes) -> str:
                 parts.append(t)
             return "\n".join(parts)
     except Exception as e:
+        _reraise_memory_error(e)
         logger.debug(f"pdfplumber失败: {e}")
         return ""
 
@@ -79,10 +150,18 @@ def _extract_with_pypdf(pdf_bytes: bytes) -> str:
             parts.append(t)
         return "\n".join(parts)
     except Exception as e:
+        _reraise_memory_error(e)
         logger.debug(f"pypdf失败: {e}")
         return ""
 
 
+# 默认顺序：pdfplumber（保留版面，字段更完整）在前，pypdf（更快）在后
+_EXTRACTORS = {
+    "pdfplumber": _extract_with_pdfplumber,
+    "pypdf": _extract_with_pypdf,
+}
+
+
 def _parse_date(text: str) -> str:
     m = DATE_PATTERN.search(text)
     if m:
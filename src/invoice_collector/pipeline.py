@@ -1,181 +1,642 @@
 """主流程编排模块"""
 
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 from rich.progress import Progress, SpinnerColumn, TextColumn
 
 from .config import load_config
-from .email_client import IMAPClient
-from .attachment_handler import extract_invoice_attachments
-from .web_handler import extract_urls_from_message, download_invoice_from_url
-from .pdf_parser import parse_pdf_bytes
-from .ofd_parser import parse_ofd_bytes
+from .mail_sources import create_source
+from .attachment_handler import extract_invoice_attachments, pair_xml_fields
+from .bundle_handler import BundleLimits
+from .web_handler import (
+    TRANSIENT, PERMANENT, DownloadError,
+    extract_urls_from_message, fetch_invoice_direct, fetch_invoice_with_browser, message_text,
+    configure_pools, close_pools,
+)
+from .parser_pool import ParseLimits, ParserPool, parse_invoice_bytes
+from .pdf_parser import InvoiceFields, find_invoice_codes, find_invoice_numbers
 from .classifier import classify_invoice
 from .file_manager import save_invoice_file
 from .state_manager import StateManager
+from .catalog import InvoiceCatalog
+from .extractor_history import EXTRACTOR_HISTORY
+from .imap_folders import FolderStatusCache
+from .journal import EventJournal, default_journal_path
+from .metrics import METRICS
+from .scheduler import BrowserCostModel, Deadline
 
 logger = logging.getLogger(__name__)
 console = Console()
 
+# 第二阶段多个浏览器线程会同时更新同一账户的计数
+_stats_lock = threading.Lock()
+
+
+@dataclass
+class RunContext:
+    """一次运行中各账户线程共享的配置与资源"""
+    base_dir: Path
+    playwright_cfg: dict
+    dry_run: bool
+    state: StateManager
+    parser: ParserPool | None = None
+    catalog: InvoiceCatalog | None = None
+    retry_cfg: dict = field(default_factory=dict)
+    retry_only: bool = False
+    bundle_limits: BundleLimits | None = None
+    deadline: Deadline = field(default_factory=Deadline)
+    costs: BrowserCostModel | None = None
+    journal: EventJournal = field(default_factory=EventJournal)
+    folder_cache: FolderStatusCache | None = None
+    # 扫描完整结束的邮件来源的 commit_scan：浏览器阶段结束、结果都写入状态后再调用
+    scan_checkpoints: list = field(default_factory=list)
+
+
+@dataclass
+class MessageOutcome:
+    """单封邮件的处理结果"""
+    output_files: list[Path] = field(default_factory=list)
+    # 下载失败的URL及失败类型（TRANSIENT / PERMANENT），用于安排重试
+    failed_urls: list[tuple[str, str]] = field(default_factory=list)
+    # 直链下载未成功、待第二阶段用浏览器处理的URL及直链阶段的失败类型
+    browser_urls: list[tuple[str, list[str]]] = field(default_factory=list)
+
+
+@dataclass
+class MessageJob:
+    """一封邮件在两阶段处理中的上下文；全部阶段结束后才写入状态"""
+    uid: str
+    subject: str
+    account: str
+    locator: object
+    stats: dict
+    reason: str = "URL无法下载"
+    previous: dict | None = None  # 重试/延后时 state.json 中的原记录
+    outcome: MessageOutcome = field(default_factory=MessageOutcome)
+
+
+@dataclass
+class SharedResources:
+    """
+    可跨多次运行复用的资源：解析进程池、HTTP连接池与浏览器并发上限、浏览器耗时模型。
+    单次运行时由 run_pipeline 自行创建和关闭；服务模式下启动时创建一次，所有作业共用。
+    """
+    parser: ParserPool
+    costs: BrowserCostModel
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "SharedResources":
+        concurrency = cfg["concurrency"]
+        configure_pools(concurrency["http_connections"], concurrency["browsers"])
+        return cls(
+            parser=ParserPool(
+                concurrency["parse_workers"],
+                ParseLimits.from_config(cfg["parsing"]) if cfg["parsing"]["isolate"] else None,
+            ),
+            costs=BrowserCostModel(),
+        )
+
+    def close(self):
+        self.costs.save()
+        self.parser.shutdown()
+        EXTRACTOR_HISTORY.flush()
+        close_pools()
+
 
 def run_pipeline(
     config_path: Path | None = None,
     month: str | None = None,
     dry_run: bool = False,
+    profile: bool = False,
+    profile_hotpaths: bool = False,
+    retry_only: bool = False,
+    max_duration: float | None = None,
+    cfg: dict | None = None,
+    shared: SharedResources | None = None,
+    workspace: Path | None = None,
+    journal_path: Path | None = None,
 ) -> dict:
     """
-    执行完整流程。
+    执行完整流程，分两个阶段：
+    第一阶段各账户并发处理附件与可直链下载的网页发票（先处理到期重试，再扫描新邮件）；
+    第二阶段统一用浏览器处理剩余URL，按预计耗时从低到高排队。
     month: "YYYY-MM" 格式，None表示近lookback_days天。
+    retry_only: 只处理到期重试，不扫描文件夹。
+    max_duration: 运行时长预算（分钟）。用尽后未开始的邮件留待下次扫描，
+        未处理的浏览器URL记为延后，下次运行优先处理。
+    处理过程中的每个结果即时追加到 ~/invoice-collector/events_YYYYMMDD.jsonl（预览模式不写）。
+    profile: 结束时写出阶段耗时报告（JSON + Prometheus textfile）。
+    profile_hotpaths: 额外对PDF/OFD解析器做cProfile采样（写出 .pstats）。
+    以下参数供服务模式使用：
+    cfg: 已校验的配置，给出时不再读取 config_path。
+    shared: 复用的解析/下载资源，运行结束时不关闭；此时也不重置进程级指标（多个作业并发累计）。
+    workspace: state.json、catalog.db、folders.json 所在目录，默认 ~/invoice-collector/。
+    journal_path: 事件日志路径，默认按天写在 ~/invoice-collector/。
     返回统计信息字典。
     """
-    cfg = load_config(config_path)
+    deadline = Deadline(max_duration * 60 if max_duration else None)
+    owns_resources = shared is None
+    if owns_resources:
+        METRICS.reset()
+    if profile_hotpaths:
+        METRICS.enable_hotpath_profiling()
+
+    if cfg is None:
+        cfg = load_config(config_path)
     base_dir = Path(cfg["output"]["base_dir"]).expanduser()
     playwright_cfg = cfg["playwright"]
+    concurrency = cfg["concurrency"]
+    accounts = cfg["accounts"]
 
     since = _parse_month_since(month, cfg["filters"]["lookback_days"])
 
-    state = StateManager()
+    # 所有账户共享同一个状态存储（内部加锁）
+    state = StateManager(workspace / "state.json" if workspace else None)
     known_uids = state.get_processed_uids()
 
-    client = IMAPClient(cfg)
-    stats = {"processed": 0, "skipped": 0, "failed": 0, "files": [], "errors": []}
+    stats = _new_stats()
+    stats["accounts"] = {}
 
     console.print(f"\n[bold cyan]发票自动归档工具[/bold cyan]")
     if dry_run:
         console.print("[yellow]-- DRY RUN 模式，不写入文件 --[/yellow]")
     console.print(f"输出目录: {base_dir}")
+    if len(accounts) > 1:
+        console.print(f"账户数: {len(accounts)}")
     console.print(f"查找范围: {since.strftime('%Y-%m-%d')} 至今\n")
 
+    if owns_resources:
+        shared = SharedResources.from_config(cfg)
+    ctx = RunContext(
+        base_dir=base_dir,
+        playwright_cfg=playwright_cfg,
+        dry_run=dry_run,
+        state=state,
+        parser=shared.parser,
+        catalog=None if dry_run else InvoiceCatalog(workspace / "catalog.db" if workspace else None),
+        retry_cfg=cfg["retry"],
+        retry_only=retry_only,
+        bundle_limits=BundleLimits.from_config(cfg["bundles"]),
+        deadline=deadline,
+        costs=shared.costs,
+        journal=EventJournal(None if dry_run else journal_path or default_journal_path()),
+        folder_cache=FolderStatusCache(workspace / "folders.json" if workspace else None),
+    )
+    ctx.journal.emit(
+        "run_started", accounts=[a["name"] for a in accounts], since=since.strftime("%Y-%m-%d"),
+        retry_only=retry_only, max_duration=max_duration,
+    )
+
+    browser_jobs: list[MessageJob] = []
     try:
-        client.connect()
-        console.print("[green]IMAP连接成功[/green]")
-
-        all_entries = list(client.iter_invoice_messages(since=since, known_uids=known_uids))
-        console.print(f"找到 {len(all_entries)} 封待处理邮件\n")
-
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             console=console,
         ) as progress:
-            task = progress.add_task("处理中...", total=len(all_entries))
-
-            for uid, msg, subject in all_entries:
-                progress.update(task, description=f"处理: {subject[:40]}")
-                output_files = _process_message(
-                    uid, msg, subject, base_dir, playwright_cfg, dry_run, stats
-                )
-                if output_files is not None:
-                    if not dry_run:
-                        state.mark_done(uid, subject, [str(p) for p in output_files])
-                    stats["processed"] += 1
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(len(accounts), concurrency["accounts"]))
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        _run_account, cfg, account,
+                        # 第一个账户沿用旧ID格式，保证从单账户配置迁移时不会重复处理
+                        "" if i == 0 else f"{account['name']}/",
+                        since, known_uids, ctx, progress, len(accounts) > 1,
+                    ): account["name"]
+                    for i, account in enumerate(accounts)
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        account_stats, jobs = future.result()
+                    except Exception as e:
+                        # 连接被拒、域名无法解析等是 OSError；多账户时只记该账户失败，不影响其他账户
+                        error = str(e) if isinstance(e, RuntimeError) else f"{type(e).__name__}: {e}"
+                        console.print(f"[bold red]错误: {escape(error)}[/bold red]")
+                        if len(accounts) == 1:
+                            raise
+                        if not isinstance(e, (RuntimeError, OSError)):
+                            logger.exception(f"账户 {name} 处理异常")
+                        account_stats, jobs = _new_stats(), []
+                        account_stats["error"] = error
+                        ctx.journal.emit("account_failed", level="error", account=name, error=error)
+                    stats["accounts"][name] = account_stats
+                    browser_jobs.extend(jobs)
+
+            # 第二阶段：所有账户的廉价工作完成后，再集中处理需要浏览器的URL
+            if browser_jobs:
+                _run_browser_phase(browser_jobs, ctx, concurrency["browsers"], progress)
+        for commit_scan in ctx.scan_checkpoints:
+            commit_scan()
+        for account_stats in stats["accounts"].values():
+            _merge_stats(stats, account_stats)
+        ctx.journal.emit("run_finished", **{k: v for k, v in stats.items() if k != "accounts"})
+    finally:
+        ctx.journal.close()
+        if ctx.catalog is not None:
+            ctx.catalog.close()
+        if owns_resources:
+            shared.close()
+        else:
+            ctx.costs.save()
+            EXTRACTOR_HISTORY.flush()
+
+    if accounts and all("error" in a for a in stats["accounts"].values()):
+        raise RuntimeError("所有账户均处理失败")
+
+    _print_summary(stats, ctx.journal.path)
+    if profile or profile_hotpaths:
+        _write_profile_report()
+    return stats
+
+
+def _new_stats() -> dict:
+    return {
+        "processed": 0, "skipped": 0, "failed": 0, "retrying": 0, "deferred": 0,
+        "files_saved": 0,
+        "issues": {},  # 问题类型 → 次数（明细见事件日志）
+    }
+
+
+def _merge_stats(total: dict, part: dict):
+    for key in ("processed", "skipped", "failed", "retrying", "deferred", "files_saved"):
+        total[key] += part[key]
+    for reason, count in part["issues"].items():
+        total["issues"][reason] = total["issues"].get(reason, 0) + count
+
+
+def _bump(stats: dict, key: str, n: int = 1):
+    with _stats_lock:
+        stats[key] += n
+
+
+def _report_issue(job: MessageJob, ctx: RunContext, event: str, reason: str, detail: str, **fields):
+    """问题只计数并写入事件日志，不在内存中累积明细"""
+    with _stats_lock:
+        job.stats["issues"][reason] = job.stats["issues"].get(reason, 0) + 1
+    ctx.journal.emit(
+        event, level="warning", account=job.account, uid=job.uid, subject=job.subject,
+        reason=reason, detail=detail, **fields,
+    )
+
+
+def _record_saved(job: MessageJob, ctx: RunContext, saved: Path, event: str, fmt: str,
+                  parse_failure: str = "", **fields):
+    """parse_failure: 解析被终止的原因（超时/内存超限），文件按未归类保存"""
+    if parse_failure:
+        fields["parse_failure"] = parse_failure
+    job.outcome.output_files.append(saved)
+    _bump(job.stats, "files_saved")
+    ctx.journal.emit(event, account=job.account, uid=job.uid, path=str(saved), fmt=fmt, **fields)
+    if "未归类" in str(saved):
+        reason = f"{parse_failure}→未归类" if parse_failure else "解析失败→未归类"
+        _report_issue(job, ctx, "invoice_unclassified", reason, saved.name, **fields)
+
+
+def _run_account(
+    cfg: dict,
+    account: dict,
+    key_prefix: str,
+    since: datetime,
+    known_uids: set[str],
+    ctx: RunContext,
+    progress: Progress,
+    multi_account: bool,
+) -> tuple[dict, list[MessageJob]]:
+    """
+    在独立线程中完成单个账户的第一阶段（独立IMAP连接或本地邮件源），
+    返回该账户的统计信息与仍需浏览器处理的邮件。
+    """
+    stats = _new_stats()
+    browser_jobs: list[MessageJob] = []
+    label = escape(f"[{account['name']}] ") if multi_account else ""
+    client = create_source(cfg, account, key_prefix=key_prefix, folder_cache=ctx.folder_cache)
+
+    try:
+        client.connect()
+        console.print(f"[green]{label}{client.description}连接成功[/green]")
+        ctx.journal.emit("account_connected", account=account["name"], source=client.description)
+
+        # 1. 到期重试与上次延后的邮件：按记录的定位信息直接取回，只重新下载未完成的URL
+        retries = ctx.state.due_retries(account["name"])
+        if retries:
+            console.print(f"{label}到期重试 {len(retries)} 封邮件")
+        task = progress.add_task("重试中...", total=len(retries))
+        for uid, entry in retries:
+            if ctx.deadline.expired():
+                break
+            progress.update(task, description=f"{label}重试: {entry['subject'][:40]}")
+            job = MessageJob(uid, entry["subject"], account["name"], entry.get("locator"), stats,
+                             previous=entry)
+            ctx.journal.emit("retry_started", account=job.account, uid=uid, subject=job.subject,
+                             attempts=entry.get("attempts", 0), pending_urls=entry["pending_urls"])
+            with METRICS.timer("message"):
+                fetched = client.fetch_located(job.locator) if job.locator else None
+                if fetched is None:
+                    job.reason = "邮件获取失败"
+                    job.outcome.failed_urls = [(u, TRANSIENT) for u in entry["pending_urls"]]
+                    if not job.outcome.failed_urls:
+                        job.outcome.failed_urls.append(("", PERMANENT))  # 无可重试的URL，直接放弃
                 else:
-                    if not dry_run:
-                        state.mark_failed(uid, subject, "处理失败")
-                    stats["failed"] += 1
-                progress.advance(task)
-
-    except RuntimeError as e:
-        console.print(f"[bold red]错误: {e}[/bold red]")
-        raise
+                    _process_message(job, fetched[0], ctx, only_urls=entry["pending_urls"])
+            _settle(job, ctx, browser_jobs)
+            progress.advance(task)
+
+        if ctx.retry_only:
+            return stats, browser_jobs
+
+        # 2. 扫描新邮件：逐封获取处理，时长预算用尽即停止；
+        #    未处理的邮件不写入状态，下次扫描仍会取到（等待重试的邮件已在 known_uids 中）
+        task = progress.add_task("处理中...", total=None)
+        count = 0
+        for uid, msg, subject in client.iter_invoice_messages(since=since, known_uids=known_uids):
+            if ctx.deadline.expired():
+                console.print(f"[yellow]{label}已达运行时长上限，剩余邮件留待下次运行[/yellow]")
+                break
+            progress.update(task, description=f"{label}处理: {subject[:40]}")
+            job = MessageJob(uid, subject, account["name"], client.locate(uid), stats)
+            ctx.journal.emit("message_fetched", account=job.account, uid=uid, subject=subject)
+            with METRICS.timer("message"):
+                _process_message(job, msg, ctx)
+            _settle(job, ctx, browser_jobs)
+            count += 1
+            progress.advance(task)
+        else:
+            if not ctx.dry_run:
+                ctx.scan_checkpoints.append(client.commit_scan)
+        console.print(f"{label}处理 {count} 封新邮件\n")
     finally:
         client.disconnect()
 
-    _print_summary(stats, base_dir, dry_run)
-    return stats
+    return stats, browser_jobs
+
+
+def _settle(job: MessageJob, ctx: RunContext, browser_jobs: list[MessageJob]):
+    """第一阶段结束：仍有浏览器URL的邮件进入第二阶段队列，其余立即写入状态"""
+    if job.outcome.browser_urls:
+        browser_jobs.append(job)
+    else:
+        _record_outcome(job, ctx)
+
+
+def _run_browser_phase(jobs: list[MessageJob], ctx: RunContext, browsers: int, progress: Progress):
+    """
+    第二阶段：汇总所有邮件的浏览器URL，按域名历史耗时从低到高排队，由 browsers 个线程并发处理。
+    剩余时长不足以完成某个URL时不再启动，连同所在邮件一起记为延后。
+    """
+    queue = sorted(
+        (
+            (ctx.costs.estimate(url), job, url, failures)
+            for job in jobs for url, failures in job.outcome.browser_urls
+        ),
+        key=lambda item: item[0],
+    )
+    for job in jobs:
+        job.outcome.browser_urls = []
+
+    console.print(f"\n浏览器处理 {len(queue)} 个网页链接（按预计耗时排序）")
+    ctx.journal.emit("browser_phase_started", urls=len(queue), messages=len(jobs))
+    task = progress.add_task("浏览器下载...", total=len(queue))
+    with ThreadPoolExecutor(max_workers=max(1, browsers)) as executor:
+        futures = [
+            executor.submit(_browser_download, job, url, failures, expected, ctx)
+            for expected, job, url, failures in queue
+        ]
+        for future in as_completed(futures):
+            future.result()
+            progress.advance(task)
+
+    deferred = sum(1 for job in jobs if job.outcome.browser_urls)
+    if deferred:
+        console.print(f"[yellow]运行时长用尽，{deferred} 封邮件的网页链接留待下次运行[/yellow]")
+    for job in jobs:
+        _record_outcome(job, ctx)
+
+
+def _browser_download(job: MessageJob, url: str, failures: list[str], expected: float, ctx: RunContext):
+    if not ctx.deadline.allows(expected):
+        job.outcome.browser_urls.append((url, failures))
+        return
+    start = time.perf_counter()
+    try:
+        file_bytes, fmt = fetch_invoice_with_browser(url, ctx.playwright_cfg, failures)
+    except DownloadError as e:
+        ctx.costs.observe(url, time.perf_counter() - start)
+        _note_url_failure(job, url, e.failure_class, ctx)
+        return
+    ctx.costs.observe(url, time.perf_counter() - start)
+    _save_url_invoice(job, url, file_bytes, fmt, ctx)
+
+
+def _record_outcome(job: MessageJob, ctx: RunContext):
+    """
+    写入处理结果：全部成功记为done；时长用尽时未完成的URL记为延后；
+    有暂时性下载失败时安排重试（只重试这些URL），永久性失败或超过重试次数上限时记为failed。
+    """
+    outcome, stats = job.outcome, job.stats
+    output_files = (job.previous or {}).get("output_files", []) + [str(p) for p in outcome.output_files]
+    event = {"account": job.account, "uid": job.uid, "files": len(outcome.output_files)}
+    METRICS.inc("files_saved_total", len(outcome.output_files))
+    retryable = [url for url, failure_class in outcome.failed_urls if failure_class == TRANSIENT]
+
+    if outcome.browser_urls:
+        if not ctx.dry_run:
+            ctx.state.mark_deferred(
+                job.uid, job.subject,
+                account=job.account,
+                locator=job.locator,
+                pending_urls=[url for url, _ in outcome.browser_urls] + retryable,
+                output_files=output_files,
+            )
+        stats["deferred"] += 1
+        METRICS.inc("messages_deferred_total")
+        ctx.journal.emit("message_deferred", pending_urls=len(outcome.browser_urls), **event)
+        return
+
+    if not outcome.failed_urls:
+        if not ctx.dry_run:
+            ctx.state.mark_done(job.uid, job.subject, output_files)
+        stats["processed"] += 1
+        METRICS.inc("messages_processed_total")
+        ctx.journal.emit("message_done", **event)
+        return
+
+    failure_class = TRANSIENT if retryable else PERMANENT
+    max_attempts = ctx.retry_cfg.get("max_attempts", 5)
+    if ctx.dry_run:
+        will_retry = bool(retryable) and (job.previous or {}).get("attempts", 0) + 1 < max_attempts
+    else:
+        will_retry = ctx.state.schedule_retry(
+            job.uid, job.subject, job.reason, failure_class,
+            account=job.account,
+            locator=job.locator,
+            pending_urls=retryable,
+            output_files=output_files,
+            max_attempts=max_attempts,
+            backoff_seconds=ctx.retry_cfg.get("backoff_minutes", 30) * 60,
+        )
+    attempts = (job.previous or {}).get("attempts", 0) + 1
+    if will_retry:
+        stats["retrying"] += 1
+        METRICS.inc("messages_retry_scheduled_total")
+        ctx.journal.emit("message_retry_scheduled", level="warning", attempts=attempts,
+                         pending_urls=len(retryable), **event)
+    else:
+        stats["failed"] += 1
+        METRICS.inc("messages_failed_total")
+        ctx.journal.emit("message_failed", level="error", attempts=attempts,
+                         reason=job.reason, **event)
 
 
 def _process_message(
-    uid: str,
+    job: MessageJob,
     msg,
-    subject: str,
-    base_dir: Path,
-    playwright_cfg: dict,
-    dry_run: bool,
-    stats: dict,
-) -> list[Path] | None:
-    """处理单封邮件，返回已保存文件路径列表，失败返回None"""
-    output_files: list[Path] = []
-
-    # 1. 提取发票附件（PDF优先，无PDF时提取OFD）
-    attachments = extract_invoice_attachments(msg)
+    ctx: RunContext,
+    only_urls: list[str] | None = None,
+):
+    """
+    第一阶段处理单封邮件：保存附件，网页链接只尝试直链下载，
+    需要浏览器的URL记入 job.outcome.browser_urls 留给第二阶段。
+    only_urls: 重试时只下载这些URL，不再处理附件（首次处理时已保存）。
+    """
+    uid = job.uid
+
+    if only_urls is not None:
+        if not _skip_archived_urls(job, only_urls, msg, ctx):
+            _download_urls_direct(job, only_urls, ctx)
+        return
+
+    # 1. 提取发票附件（PDF优先，无PDF时提取OFD；含ZIP压缩包内的发票）。
+    #    附带全电XML数据文件的直接用XML字段，不再提取PDF/OFD文字；
+    #    其余附件一起提交解析（配置了解析进程时并行）
+    xml_files: list[tuple[str, bytes]] = []
+    attachments = extract_invoice_attachments(msg, ctx.bundle_limits, xml_files)
     has_pdf_attachment = any(fmt == "pdf" for _, _, fmt in attachments)
-
-    for orig_name, file_bytes, fmt in attachments:
+    parsed = pair_xml_fields(attachments, xml_files)
+    from_xml = [fields is not None for fields in parsed]
+    if any(from_xml):
+        METRICS.inc("xml_fast_path_total", sum(from_xml))
+    pending = [i for i, done in enumerate(from_xml) if not done]
+    for i, fields in zip(pending, _parse_many([attachments[i][1:] for i in pending], ctx)):
+        parsed[i] = fields
+
+    for (orig_name, file_bytes, fmt), fields, xml in zip(attachments, parsed, from_xml):
         try:
-            saved = _route_and_save(file_bytes, fmt, base_dir, dry_run)
-            output_files.append(saved)
-            stats["files"].append(str(saved))
-            console.print(f"  [green]附件({fmt.upper()})[/green] → {saved.name}")
-            if "未归类" in str(saved):
-                stats["errors"].append({
-                    "subject": subject, "uid": uid,
-                    "reason": "解析失败→未归类", "detail": saved.name,
-                })
+            if isinstance(fields, Exception):
+                raise fields
+            saved = _classify_and_save(file_bytes, fmt, fields, ctx, uid)
+            console.print(f"  [green]附件({fmt.upper()}{'+XML' if xml else ''})[/green] → {saved.name}")
+            _record_saved(job, ctx, saved, "attachment_saved", fmt, fields.failure_reason,
+                          attachment=orig_name, from_xml=xml)
         except Exception as e:
             logger.error(f"附件保存失败 ({orig_name}): {e}")
-            stats["errors"].append({
-                "subject": subject, "uid": uid,
-                "reason": "附件保存异常", "detail": str(e),
-            })
+            _report_issue(job, ctx, "attachment_failed", "附件保存异常", str(e), attachment=orig_name)
 
     # 2. 若已有PDF附件，跳过网页URL（PDF优先策略）
     if has_pdf_attachment:
-        return output_files
+        return
 
     # 3. 提取网页链接（仅在无PDF附件时处理）
     urls = extract_urls_from_message(msg)
-    for url in urls:
-        try:
-            result = download_invoice_from_url(url, playwright_cfg)
-            if result:
-                file_bytes, fmt = result
-                saved = _route_and_save(file_bytes, fmt, base_dir, dry_run)
-                output_files.append(saved)
-                stats["files"].append(str(saved))
-                console.print(f"  [blue]网页({fmt.upper()})[/blue] → {saved.name}")
-                if "未归类" in str(saved):
-                    stats["errors"].append({
-                        "subject": subject, "uid": uid,
-                        "reason": "解析失败→未归类",
-                        "detail": f"{saved.name} ({url[:60]})",
-                    })
-            else:
-                console.print(f"  [yellow]跳过URL（无法下载）[/yellow]: {url[:60]}")
-                stats["errors"].append({
-                    "subject": subject, "uid": uid,
-                    "reason": "URL无法下载", "detail": url[:80],
-                })
-        except Exception as e:
-            logger.error(f"URL处理失败 ({url}): {e}")
-            stats["errors"].append({
-                "subject": subject, "uid": uid,
-                "reason": "URL处理异常", "detail": str(e),
-            })
+    if urls and _skip_archived_urls(job, urls, msg, ctx):
+        return
+    _download_urls_direct(job, urls, ctx)
 
     if not attachments and not urls:
         console.print(f"  [dim]无发票附件/链接，跳过[/dim]")
-        stats["skipped"] += 1
-        stats["errors"].append({
-            "subject": subject, "uid": uid,
-            "reason": "无发票内容", "detail": "无附件也无识别到的URL",
-        })
+        job.stats["skipped"] += 1
+        _report_issue(job, ctx, "message_skipped", "无发票内容", "无附件也无识别到的URL")
 
-    return output_files
+
+def _skip_archived_urls(job: MessageJob, urls: list[str], msg, ctx: RunContext) -> bool:
+    """
+    主题与正文给出的发票号码均已在发票目录中（同一张发票已以附件或另一种格式归档）时，
+    不再发起这些URL的直链/浏览器下载。没有发票目录（预览模式）或未找到号码时不跳过；
+    8位号码须与邮件中的某个发票代码一起匹配，否则可能是另一张同号码的发票。
+    """
+    if ctx.catalog is None:
+        return False
+    text = f"{job.subject}\n{message_text(msg)}"
+    codes = find_invoice_codes(text) or [""]
+    numbers = find_invoice_numbers(text)
+    archived = [
+        next((row for code in codes if (row := ctx.catalog.find_by_number(n, code)) is not None), None)
+        for n in numbers
+    ]
+    if not archived or any(row is None for row in archived):
+        return False
+    names = "、".join(Path(row["path"]).name for row in archived)
+    console.print(f"  [dim]发票已归档（{names}），跳过 {len(urls)} 个网页链接[/dim]")
+    METRICS.inc("urls_skipped_archived_total", len(urls))
+    ctx.journal.emit(
+        "urls_skipped_archived", account=job.account, uid=job.uid,
+        invoice_numbers=numbers, archived=[row["path"] for row in archived], urls=urls,
+    )
+    return True
+
+
+def _download_urls_direct(job: MessageJob, urls: list[str], ctx: RunContext):
+    """逐个直链下载网页发票并保存；直链拿不到文件的URL交给第二阶段的浏览器处理"""
+    for url in urls:
+        failures: list[str] = []
+        result = fetch_invoice_direct(url, failures)
+        if result is None:
+            job.outcome.browser_urls.append((url, failures))
+            ctx.journal.emit("url_queued_for_browser", account=job.account, uid=job.uid, url=url)
+            continue
+        _save_url_invoice(job, url, *result, ctx)
 
 
-def _route_and_save(file_bytes: bytes, fmt: str, base_dir: Path, dry_run: bool) -> Path:
-    """根据格式解析→分类→保存"""
-    if fmt == "ofd":
-        fields = parse_ofd_bytes(file_bytes)
+def _save_url_invoice(job: MessageJob, url: str, file_bytes: bytes, fmt: str, ctx: RunContext):
+    try:
+        saved, fields = _route_and_save(file_bytes, fmt, ctx, job.uid)
+    except Exception as e:
+        logger.error(f"URL处理失败 ({url}): {e}")
+        job.outcome.failed_urls.append((url, PERMANENT))
+        _report_issue(job, ctx, "url_failed", "URL处理异常", str(e), url=url, failure_class=PERMANENT)
+        return
+    console.print(f"  [blue]网页({fmt.upper()})[/blue] → {saved.name}")
+    _record_saved(job, ctx, saved, "url_saved", fmt, fields.failure_reason, url=url)
+
+
+def _note_url_failure(job: MessageJob, url: str, failure_class: str, ctx: RunContext):
+    retry_note = "，稍后重试" if failure_class == TRANSIENT else ""
+    console.print(f"  [yellow]跳过URL（无法下载{retry_note}）[/yellow]: {url[:60]}")
+    job.outcome.failed_urls.append((url, failure_class))
+    _report_issue(job, ctx, "url_failed", "URL无法下载", url[:80], url=url, failure_class=failure_class)
+
+
+def _route_and_save(file_bytes: bytes, fmt: str, ctx: RunContext, uid: str = "") -> tuple[Path, InvoiceFields]:
+    """根据格式解析→分类→保存（并登记到发票目录），返回 (保存路径, 解析字段)"""
+    if ctx.parser:
+        fields = ctx.parser.parse(file_bytes, fmt)
     else:
-        fields = parse_pdf_bytes(file_bytes)
+        fields = parse_invoice_bytes(file_bytes, fmt)
+    return _classify_and_save(file_bytes, fmt, fields, ctx, uid), fields
+
+
+def _parse_many(items: list[tuple[bytes, str]], ctx: RunContext) -> list:
+    if ctx.parser:
+        return ctx.parser.parse_many(items)
+    return ParserPool(0).parse_many(items)
+
+
+def _classify_and_save(file_bytes: bytes, fmt: str, fields, ctx: RunContext, uid: str = "") -> Path:
     category = classify_invoice(fields.service, fields.raw_text)
-    return save_invoice_file(file_bytes, fields, category, base_dir, ext=f".{fmt}", dry_run=dry_run)
+    return save_invoice_file(
+        file_bytes, fields, category, ctx.base_dir, ext=f".{fmt}",
+        dry_run=ctx.dry_run, catalog=ctx.catalog, source_uid=uid,
+    )
 
 
 def _parse_month_since(month: str | None, lookback_days: int = 30) -> datetime:
@@ -187,45 +648,53 @@ def _parse_month_since(month: str | None, lookback_days: int = 30) -> datetime:
     return datetime.now() - timedelta(days=lookback_days)
 
 
-def _print_summary(stats: dict, base_dir: Path, dry_run: bool):
+def _write_profile_report():
+    """写出本次运行的指标报告到 ~/invoice-collector/"""
+    log_dir = Path("~/invoice-collector").expanduser()
+    stem = datetime.now().strftime("profile_%Y%m%d_%H%M%S")
+    try:
+        for path in METRICS.write_report(log_dir, stem):
+            console.print(f"[dim]性能报告已写入: {path}[/dim]")
+    except OSError as ex:
+        logger.warning(f"写入性能报告失败: {ex}")
+
+
+def _print_summary(stats: dict, journal_path: Path | None = None):
     table = Table(title="处理汇总", show_header=True, header_style="bold magenta")
     table.add_column("项目", style="cyan")
     table.add_column("数量", justify="right")
     table.add_row("成功处理邮件", str(stats["processed"]))
     table.add_row("跳过（无发票）", str(stats["skipped"]))
     table.add_row("处理失败", str(stats["failed"]))
-    table.add_row("保存文件总数", str(len(stats["files"])))
+    table.add_row("等待重试", str(stats["retrying"]))
+    table.add_row("延后至下次运行", str(stats["deferred"]))
+    table.add_row("保存文件总数", str(stats["files_saved"]))
     console.print("\n")
     console.print(table)
-    for f in stats["files"]:
-        console.print(f"  [dim]{f}[/dim]")
-
-    errors = stats.get("errors", [])
-    if errors:
-        err_table = Table(title="问题邮件明细", show_header=True, header_style="bold red")
-        err_table.add_column("邮件主题", style="white", max_width=30)
-        err_table.add_column("问题类型", style="yellow", max_width=16)
-        err_table.add_column("详情", style="dim", max_width=40)
-        for e in errors:
-            err_table.add_row(
-                e["subject"][:30],
-                e["reason"],
-                e["detail"][:40],
+
+    accounts = stats.get("accounts", {})
+    if len(accounts) > 1:
+        acc_table = Table(title="账户明细", show_header=True, header_style="bold magenta")
+        acc_table.add_column("账户", style="cyan")
+        for col in ("成功", "跳过", "失败", "重试", "文件"):
+            acc_table.add_column(col, justify="right")
+        acc_table.add_column("状态", style="dim", max_width=40)
+        for name, a in accounts.items():
+            acc_table.add_row(
+                name, str(a["processed"]), str(a["skipped"]), str(a["failed"]),
+                str(a["retrying"]), str(a["files_saved"]), a.get("error", "OK")[:40],
             )
+        console.print(acc_table)
+
+    issues = stats.get("issues", {})
+    if issues:
+        issue_table = Table(title="问题统计", show_header=True, header_style="bold red")
+        issue_table.add_column("问题类型", style="yellow")
+        issue_table.add_column("次数", justify="right")
+        for reason, count in sorted(issues.items(), key=lambda item: -item[1]):
+            issue_table.add_row(reason, str(count))
         console.print("\n")
-        console.print(err_table)
-
-        if not dry_run:
-            log_dir = Path("~/invoice-collector").expanduser()
-            date_str = datetime.now().strftime("%Y%m%d")
-            log_path = log_dir / f"errors_{date_str}.log"
-            try:
-                log_dir.mkdir(parents=True, exist_ok=True)
-                lines = [
-                    f"[{e['reason']}] {e['subject']}\n  详情: {e['detail']}\n  UID: {e['uid']}\n"
-                    for e in errors
-                ]
-                log_path.write_text("\n".join(lines), encoding="utf-8")
-                console.print(f"\n[dim]问题邮件已写入: {log_path}[/dim]")
-            except Exception as ex:
-                logger.warning(f"写入错误日志失败: {ex}")
+        console.print(issue_table)
+
+    if journal_path is not None:
+        console.print(f"\n[dim]事件日志（含每个文件与问题明细）: {journal_path}[/dim]")
@@ -0,0 +1,253 @@
+"""plan 模式：只凭邮件头与结构估算一次运行的工作量（发票数、附件大小、需浏览器的URL、预计耗时）"""
+
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+from .attachment_handler import classify_attachment
+from .bodystructure import MessageStructure
+from .config import load_config
+from .email_client import IMAPClient
+from .extractor_history import EXTRACTOR_HISTORY
+from .mail_sources import create_source
+from .pipeline import _parse_month_since
+from .scheduler import BrowserCostModel
+from .state_manager import StateManager
+from .web_handler import extract_invoice_urls, resolve_direct_urls
+
+logger = logging.getLogger(__name__)
+console = Console()
+
+# 没有测量数据时的估算参数
+IMAP_BYTES_PER_SECOND = 2 * 1024 * 1024  # 取回整封邮件的带宽
+DEFAULT_ROUND_TRIP = 0.05                # 每封邮件一次 UID FETCH 的往返
+DEFAULT_PDF_SECONDS = 0.3                # 单个PDF文字提取
+OFD_SECONDS = 0.05                       # OFD为XML，解析很快
+DIRECT_DOWNLOAD_SECONDS = 1.0            # 一次直链HTTP下载
+
+# 看起来直接指向文件的URL：直链下载大概率成功，无需浏览器
+_DIRECT_URL = re.compile(r"\.(pdf|ofd)(\?|#|$)|[Ww]jgs=(PDF|OFD)", re.IGNORECASE)
+
+
+@dataclass
+class MessagePlan:
+    """单封邮件的预计工作量"""
+    key: str
+    subject: str
+    size: int
+    pdfs: int = 0
+    ofds: int = 0
+    bundles: int = 0
+    xml_files: int = 0  # 全电XML数据文件：对应的PDF/OFD无需提取文字
+    attachment_bytes: int = 0
+    urls: list[str] = field(default_factory=list)
+
+
+@dataclass
+class AccountPlan:
+    name: str
+    remote: bool
+    messages: list[MessagePlan] = field(default_factory=list)
+    retry_urls: list[str] = field(default_factory=list)
+    retry_messages: int = 0
+    round_trip: float = DEFAULT_ROUND_TRIP
+    error: str = ""
+
+    @property
+    def invoices(self) -> int:
+        return sum(m.pdfs + m.ofds for m in self.messages)
+
+    @property
+    def bundles(self) -> int:
+        return sum(m.bundles for m in self.messages)
+
+    @property
+    def attachment_bytes(self) -> int:
+        return sum(m.attachment_bytes for m in self.messages)
+
+    @property
+    def urls(self) -> list[str]:
+        return [u for m in self.messages for u in m.urls] + self.retry_urls
+
+
+def plan_message(structure: MessageStructure) -> MessagePlan:
+    """
+    与 extract_invoice_attachments / 网页发票下载 相同的取舍规则：
+    有PDF则只取PDF，否则取OFD；压缩包内容未知，按含PDF计（不再提取URL）；
+    没有PDF附件时才读取文本部分提取发票URL。
+    """
+    plan = MessagePlan(structure.key, structure.subject, structure.size)
+    by_kind: dict[str, list] = {}
+    for part in structure.parts:
+        kind = classify_attachment(part.content_type, part.filename, part.disposition)
+        if kind is not None:
+            by_kind.setdefault(kind, []).append(part)
+
+    pdfs, ofds, bundles = by_kind.get("pdf", []), by_kind.get("ofd", []), by_kind.get("bundle", [])
+    chosen = pdfs or ofds
+    plan.pdfs = len(pdfs)
+    plan.ofds = 0 if pdfs else len(ofds)
+    plan.bundles = len(bundles)
+    plan.xml_files = len(by_kind.get("xml", []))
+    plan.attachment_bytes = sum(p.decoded_size for p in chosen + bundles)
+
+    if not pdfs and not bundles:
+        text_parts = [p for p in structure.parts if p.content_type in ("text/plain", "text/html")]
+        if text_parts:
+            plan.urls = extract_invoice_urls("\n".join(structure.read_text(text_parts)))
+    return plan
+
+
+def needs_browser(url: str, costs: BrowserCostModel) -> bool:
+    """曾用浏览器下载过的域名、或不像文件链接且无平台直链规则的URL，按需要浏览器估算"""
+    return costs.has_history(url) or not (_DIRECT_URL.search(url) or resolve_direct_urls(url))
+
+
+def plan_account(cfg: dict, account: dict, key_prefix: str, since, known_uids: set[str],
+                 state: StateManager) -> AccountPlan:
+    client = create_source(cfg, account, key_prefix=key_prefix)
+    result = AccountPlan(account["name"], remote=isinstance(client, IMAPClient))
+    for _, entry in state.due_retries(account["name"]):
+        result.retry_messages += 1
+        result.retry_urls.extend(entry.get("pending_urls", []))
+
+    text_seconds, text_reads = 0.0, 0
+    try:
+        client.connect()
+        for structure in client.iter_invoice_structures(since=since, known_uids=known_uids):
+            read_text = structure.read_text
+
+            def timed_read(parts, read_text=read_text):
+                nonlocal text_seconds, text_reads
+                start = time.perf_counter()
+                try:
+                    return read_text(parts)
+                finally:
+                    text_seconds += time.perf_counter() - start
+                    text_reads += 1
+
+            structure.read_text = timed_read
+            result.messages.append(plan_message(structure))
+    except RuntimeError as e:
+        result.error = str(e)
+    finally:
+        client.disconnect()
+
+    if result.remote and text_reads:
+        result.round_trip = text_seconds / text_reads
+    return result
+
+
+def estimate_seconds(plan: AccountPlan, costs: BrowserCostModel, parse_workers: int) -> tuple[float, float]:
+    """返回 (第一阶段耗时, 浏览器阶段串行总耗时)"""
+    pdf_seconds = EXTRACTOR_HISTORY.mean_seconds() or DEFAULT_PDF_SECONDS
+    fetch = 0.0
+    if plan.remote:
+        fetch = sum(plan.round_trip + m.size / IMAP_BYTES_PER_SECOND for m in plan.messages)
+    # 有XML数据文件的附件不需要提取文字（ofds 只在没有PDF时非零）
+    pdfs = sum(max(0, m.pdfs + m.bundles - m.xml_files) for m in plan.messages)
+    ofds = sum(max(0, m.ofds - m.xml_files) for m in plan.messages)
+    parse = (pdfs * pdf_seconds + ofds * OFD_SECONDS) / max(1, parse_workers)
+    direct = len(plan.urls) * DIRECT_DOWNLOAD_SECONDS  # 需浏览器的URL也会先尝试直链
+    browser = sum(costs.estimate(u) for u in plan.urls if needs_browser(u, costs))
+    return fetch + parse + direct, browser
+
+
+def run_plan(config_path: Path | None = None, month: str | None = None) -> dict:
+    """
+    估算一次运行的工作量，不下载附件、不写入任何文件或状态。
+    IMAP账户只取 BODYSTRUCTURE、主题与（无PDF附件时的）文本部分；本地导出源读取邮件但不解码附件。
+    返回 {账户名: {...}, "total": {...}}。
+    """
+    cfg = load_config(config_path)
+    concurrency = cfg["concurrency"]
+    accounts = cfg["accounts"]
+    since = _parse_month_since(month, cfg["filters"]["lookback_days"])
+    state = StateManager()
+    known_uids = state.get_processed_uids()
+    costs = BrowserCostModel()
+
+    console.print(f"\n[bold cyan]工作量估算[/bold cyan]（{since.strftime('%Y-%m-%d')} 至今，不下载附件）\n")
+
+    table = Table(title="预计工作量", show_header=True, header_style="bold magenta")
+    table.add_column("账户", style="cyan")
+    for col in ("邮件", "附件发票", "压缩包", "附件大小", "直链URL", "浏览器URL", "预计耗时"):
+        table.add_column(col, justify="right")
+
+    report: dict = {}
+    phase1, browser_total = [], 0.0
+    for i, account in enumerate(accounts):
+        with console.status(f"[{account['name']}] 读取邮件结构..."):
+            plan = plan_account(
+                cfg, account, "" if i == 0 else f"{account['name']}/", since, known_uids, state
+            )
+        if plan.error:
+            console.print(f"[bold red][{account['name']}] 错误: {plan.error}[/bold red]")
+        first, browser = estimate_seconds(plan, costs, concurrency["parse_workers"])
+        phase1.append(first)
+        browser_total += browser
+        browser_urls = [u for u in plan.urls if needs_browser(u, costs)]
+        report[account["name"]] = {
+            "messages": len(plan.messages),
+            "retry_messages": plan.retry_messages,
+            "invoice_attachments": plan.invoices,
+            "bundles": plan.bundles,
+            "attachment_bytes": plan.attachment_bytes,
+            "direct_urls": len(plan.urls) - len(browser_urls),
+            "browser_urls": len(browser_urls),
+            "estimated_seconds": round(first + browser / max(1, concurrency["browsers"]), 1),
+        }
+        if plan.error:
+            report[account["name"]]["error"] = plan.error
+        row = report[account["name"]]
+        messages = str(row["messages"]) + (f" (+{plan.retry_messages}重试)" if plan.retry_messages else "")
+        table.add_row(
+            account["name"], messages, str(row["invoice_attachments"]), str(row["bundles"]),
+            _format_bytes(row["attachment_bytes"]), str(row["direct_urls"]), str(row["browser_urls"]),
+            _format_seconds(row["estimated_seconds"]),
+        )
+
+    # 账户并发执行第一阶段，浏览器阶段由 browsers 个线程共享
+    slots = max(1, min(len(accounts), concurrency["accounts"]))
+    first_phase = max(max(phase1, default=0.0), sum(phase1) / slots)
+    browser_phase = browser_total / max(1, concurrency["browsers"])
+    total = {
+        key: sum(r[key] for r in report.values())
+        for key in ("messages", "retry_messages", "invoice_attachments", "bundles",
+                    "attachment_bytes", "direct_urls", "browser_urls")
+    }
+    total["estimated_seconds"] = round(first_phase + browser_phase, 1)
+    report["total"] = total
+
+    if len(accounts) > 1:
+        table.add_row(
+            "[bold]合计[/bold]", str(total["messages"]), str(total["invoice_attachments"]),
+            str(total["bundles"]), _format_bytes(total["attachment_bytes"]), str(total["direct_urls"]),
+            str(total["browser_urls"]), _format_seconds(total["estimated_seconds"]),
+        )
+    console.print(table)
+    console.print(
+        f"\n预计总耗时: [bold]{_format_seconds(total['estimated_seconds'])}[/bold]"
+        f"（附件与直链 {_format_seconds(first_phase)}，浏览器阶段 {_format_seconds(browser_phase)}）"
+    )
+    console.print("[dim]压缩包按含PDF估算；浏览器耗时按各域名历史记录，无记录时按默认值。[/dim]")
+    return report
+
+
+def _format_bytes(n: int) -> str:
+    if n >= 1024 * 1024:
+        return f"{n / 1024 / 1024:.1f} MB"
+    return f"{n / 1024:.0f} KB"
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} 小时"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f} 分钟"
+    return f"{seconds:.0f} 秒"
@@ -0,0 +1,193 @@
+"""离线重新归档：按当前解析/分类/命名规则并行重新处理 base_dir 下的已有文件"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+from .catalog import InvoiceCatalog
+from .classifier import CATEGORY_RULES, DEFAULT_CATEGORY
+from .config import load_config
+from .extractor_history import EXTRACTOR_HISTORY, flush_at_exit
+from .file_manager import is_same_slot, move_invoice_file, plan_invoice_path
+from .parser_pool import parse_invoice_bytes
+from .pdf_parser import (
+    CODE_PATTERN, DATE_PATTERN, NUMBER_PATTERN, SERVICE_PATTERN, TAX_ID_PATTERN, TOTAL_PATTERNS,
+)
+from .state_manager import StateManager
+
+logger = logging.getLogger(__name__)
+console = Console()
+
+DEFAULT_CACHE_PATH = Path("~/invoice-collector/reprocess_cache.json").expanduser()
+INVOICE_SUFFIXES = (".pdf", ".ofd")
+
+
+def rules_fingerprint() -> str:
+    """分类规则与字段正则的指纹；规则变化后缓存自动失效"""
+    material = json.dumps(
+        {
+            "categories": CATEGORY_RULES,
+            "default": DEFAULT_CATEGORY,
+            "date": DATE_PATTERN.pattern,
+            "total": [p.pattern for p in TOTAL_PATTERNS],
+            "service": SERVICE_PATTERN.pattern,
+            "identifiers": [NUMBER_PATTERN.pattern, CODE_PATTERN.pattern, TAX_ID_PATTERN.pattern],
+        },
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()[:16]
+
+
+def run_reprocess(
+    config_path: Path | None = None,
+    workers: int | None = None,
+    dry_run: bool = False,
+    cache_path: Path | None = None,
+) -> dict:
+    """
+    遍历 base_dir（含 未归类/），并行重新解析所有PDF/OFD，
+    按当前 build_filename/get_output_dir 结果重命名或移动。
+    内容哈希与规则指纹均未变化的文件直接跳过。返回统计信息字典。
+    """
+    cfg = load_config(config_path)
+    base_dir = Path(cfg["output"]["base_dir"]).expanduser()
+    cache_path = cache_path or DEFAULT_CACHE_PATH
+    fingerprint = rules_fingerprint()
+    cache = _load_cache(cache_path, fingerprint)
+
+    files = sorted(_iter_archive_files(base_dir))
+    stats = {"scanned": len(files), "unchanged": 0, "kept": 0, "moved": [], "errors": []}
+
+    console.print(f"\n[bold cyan]重新归档[/bold cyan] {base_dir}")
+    if dry_run:
+        console.print("[yellow]-- DRY RUN 模式，不移动文件 --[/yellow]")
+    console.print(f"共 {len(files)} 个文件，规则指纹 {fingerprint}\n")
+
+    jobs = [(str(p), cache["files"].get(str(p))) for p in files]
+    moves: dict[str, str] = {}
+    catalog = None if dry_run else InvoiceCatalog()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=flush_at_exit) as executor:
+        for result in executor.map(_analyze_file, jobs, chunksize=16):
+            path = Path(result["path"])
+            if "error" in result:
+                stats["errors"].append((result["path"], result["error"]))
+                continue
+            if result["unchanged"]:
+                stats["unchanged"] += 1
+                continue
+
+            out_dir, filename = plan_invoice_path(
+                result["fields"], result["category"], base_dir, path.suffix.lower()
+            )
+            target = path
+            if is_same_slot(path, out_dir / filename):
+                stats["kept"] += 1
+            else:
+                try:
+                    target = move_invoice_file(path, out_dir, filename, dry_run=dry_run)
+                except OSError as e:
+                    stats["errors"].append((result["path"], str(e)))
+                    continue
+                stats["moved"].append((str(path), str(target)))
+                moves[str(path)] = str(target)
+
+            if catalog is not None:
+                cache["files"].pop(str(path), None)
+                cache["files"][str(target)] = result["hash"]
+                catalog.relocate(path, target, result["fields"], result["category"], result["hash"])
+
+    EXTRACTOR_HISTORY.flush()
+    if catalog is not None:
+        catalog.close()
+        _save_cache(cache_path, cache)
+        StateManager().rename_output_files(moves)
+
+    _print_report(stats, base_dir, dry_run)
+    return stats
+
+
+def _iter_archive_files(base_dir: Path):
+    if not base_dir.exists():
+        return
+    for root, _, names in os.walk(base_dir):
+        for name in names:
+            if name.lower().endswith(INVOICE_SUFFIXES) and not name.startswith("."):
+                yield Path(root) / name
+
+
+def _analyze_file(job: tuple[str, str | None]) -> dict:
+    """子进程：mmap读取→哈希→（哈希变化时）解析+分类"""
+    from .classifier import classify_invoice
+
+    path, cached_hash = job
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {"path": path, "error": "空文件"}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest = hashlib.sha256(mm).hexdigest()
+                if digest == cached_hash:
+                    return {"path": path, "hash": digest, "unchanged": True}
+                fmt = "ofd" if path.lower().endswith(".ofd") else "pdf"
+                fields = parse_invoice_bytes(mm[:], fmt)
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+
+    category = classify_invoice(fields.service, fields.raw_text)
+    fields.raw_text = ""  # 不回传全文，减少进程间传输
+    return {"path": path, "hash": digest, "unchanged": False, "fields": fields, "category": category}
+
+
+def _load_cache(path: Path, fingerprint: str) -> dict:
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+        if cache.get("rules") == fingerprint:
+            return cache
+    except (OSError, json.JSONDecodeError):
+        pass
+    return {"rules": fingerprint, "files": {}}
+
+
+def _save_cache(path: Path, cache: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _print_report(stats: dict, base_dir: Path, dry_run: bool):
+    table = Table(title="重新归档汇总", show_header=True, header_style="bold magenta")
+    table.add_column("项目", style="cyan")
+    table.add_column("数量", justify="right")
+    table.add_row("扫描文件", str(stats["scanned"]))
+    table.add_row("内容与规则未变（跳过）", str(stats["unchanged"]))
+    table.add_row("位置不变", str(stats["kept"]))
+    table.add_row("移动/重命名" + ("（预览）" if dry_run else ""), str(len(stats["moved"])))
+    table.add_row("失败", str(len(stats["errors"])))
+    console.print("\n")
+    console.print(table)
+
+    if stats["moved"]:
+        move_table = Table(title="文件变动明细", show_header=True, header_style="bold blue")
+        move_table.add_column("原路径", style="dim")
+        move_table.add_column("新路径", style="green")
+        for src, dst in stats["moved"]:
+            move_table.add_row(_relative(src, base_dir), _relative(dst, base_dir))
+        console.print(move_table)
+
+    for path, reason in stats["errors"]:
+        console.print(f"  [red]失败[/red] {_relative(path, base_dir)}: {reason}")
+
+
+def _relative(path: str, base_dir: Path) -> str:
+    try:
+        return str(Path(path).relative_to(base_dir))
+    except ValueError:
+        return path
@@ -0,0 +1,84 @@
+"""运行时长预算与浏览器任务排序：先做廉价工作，浏览器工作按预计耗时从低到高排队"""
+
+import json
+import logging
+import math
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COST_PATH = Path("~/invoice-collector/browser_costs.json").expanduser()
+
+# 没有历史记录的域名的预计耗时（秒）：启动Chromium + 页面加载
+DEFAULT_BROWSER_COST = 10.0
+# 指数滑动平均的新样本权重
+_EWMA_ALPHA = 0.3
+
+
+class Deadline:
+    """运行时长预算；seconds 为 None 表示不限"""
+
+    def __init__(self, seconds: float | None = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, cost: float) -> bool:
+        """剩余时间是否足以完成一个预计耗时为 cost 秒的任务"""
+        return self.remaining() >= cost
+
+
+class BrowserCostModel:
+    """
+    按域名记录Playwright下载耗时（指数滑动平均），持久化到 browser_costs.json，
+    用于第二阶段按预计耗时排序浏览器任务。
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or DEFAULT_COST_PATH
+        self._lock = threading.Lock()
+        self._costs: dict[str, float] = {}
+        try:
+            self._costs = {k: float(v) for k, v in json.loads(self.path.read_text(encoding="utf-8")).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).hostname or ""
+
+    def estimate(self, url: str) -> float:
+        with self._lock:
+            return self._costs.get(self._host(url), DEFAULT_BROWSER_COST)
+
+    def has_history(self, url: str) -> bool:
+        """该域名此前是否用浏览器下载过（即直链下载曾经不可用）"""
+        with self._lock:
+            return self._host(url) in self._costs
+
+    def observe(self, url: str, seconds: float):
+        host = self._host(url)
+        with self._lock:
+            prev = self._costs.get(host)
+            self._costs[host] = seconds if prev is None else prev + _EWMA_ALPHA * (seconds - prev)
+
+    def save(self):
+        # 服务模式下多个作业共用同一实例，写文件也在锁内完成
+        with self._lock:
+            data = json.dumps(self._costs, ensure_ascii=False, indent=2)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".json.tmp")
+                tmp.write_text(data, encoding="utf-8")
+                tmp.replace(self.path)
+            except OSError as e:
+                logger.warning(f"写入浏览器耗时记录失败: {e}")
@@ -0,0 +1,415 @@
+"""
+服务模式：本地HTTP作业接口 + 持久化作业队列 + 固定数量的工作线程。
+
+每个作业是一次 run_pipeline，账户由请求提供；解析进程池、HTTP连接池、浏览器并发上限与耗时模型
+在服务启动时创建一次，所有作业共用。作业按命名空间隔离：
+    <data_dir>/namespaces/<ns>/state.json、catalog.db、folders.json   处理记录与文件夹缓存
+    <data_dir>/namespaces/<ns>/archive/                              归档目录
+    <data_dir>/jobs/<id>/events.jsonl                                该作业的事件日志
+同一命名空间的作业依次运行（共享处理记录），不同命名空间并发。
+
+接口（JSON）：
+    POST   /jobs                  提交作业，返回 202 与作业信息
+    GET    /jobs?status=&limit=   作业列表
+    GET    /jobs/<id>             作业状态与统计
+    DELETE /jobs/<id>             取消排队中的作业
+    GET    /jobs/<id>/events      事件日志（ndjson）
+    GET    /jobs/<id>/files       本次保存的文件列表
+    GET    /jobs/<id>/files/<n>   下载第 n 个文件
+    GET    /healthz、/metrics     存活检查、Prometheus 指标
+"""
+
+import copy
+import json
+import logging
+import re
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlsplit
+
+from .config import IMAP_PRESETS, LOCAL_PROVIDERS, normalize_config
+from .job_queue import FINISHED, Job, JobQueue
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUEST_BYTES = 1024 * 1024
+_NAMESPACE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+_JOB_OPTIONS = ("namespace", "accounts", "email", "filters", "month", "retry_only", "max_duration", "dry_run")
+_LIST_FILTERS = ("subject_keywords", "include_folders", "exclude_folders", "skip_special_use")
+
+
+def validate_request(request: dict) -> str:
+    """校验作业请求，返回命名空间；不合法时抛出 ValueError"""
+    if not isinstance(request, dict):
+        raise ValueError("请求体必须是JSON对象")
+    unknown = set(request) - set(_JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+    namespace = request.get("namespace", "default")
+    if not isinstance(namespace, str) or not _NAMESPACE.match(namespace):
+        raise ValueError("namespace 只能包含字母、数字、'_'、'-'、'.'，且不超过64个字符")
+    if not request.get("accounts") and not request.get("email"):
+        raise ValueError("缺少 accounts 或 email")
+    accounts = request.get("accounts") or [request["email"]]
+    if not isinstance(accounts, list):
+        raise ValueError("accounts 必须是列表")
+    for account in accounts:
+        _validate_account(account)
+    _validate_filters(request.get("filters", {}))
+    for flag in ("dry_run", "retry_only"):
+        if not isinstance(request.get(flag, False), bool):
+            raise ValueError(f"{flag} 必须是布尔值")
+    month = request.get("month")
+    if month is not None and (not isinstance(month, str) or not _MONTH.match(month)):
+        raise ValueError("month 格式应为 YYYY-MM")
+    max_duration = request.get("max_duration")
+    if max_duration is not None and (
+        isinstance(max_duration, bool) or not isinstance(max_duration, (int, float)) or max_duration <= 0
+    ):
+        raise ValueError("max_duration 必须是正数（分钟）")
+    return namespace
+
+
+def _validate_account(account) -> None:
+    if not isinstance(account, dict):
+        raise ValueError("accounts 的每一项必须是映射")
+    provider = account.get("provider", "custom")
+    if not isinstance(provider, str):
+        raise ValueError("provider 必须是字符串")
+    # 本地邮件源会读取服务所在机器的文件，不接受
+    if provider.lower() in LOCAL_PROVIDERS:
+        raise ValueError(f"服务模式不支持本地邮件源: {provider}")
+    if provider.lower() != "custom" and provider.lower() not in IMAP_PRESETS:
+        raise ValueError(f"未知的 provider: {provider}")
+    for key in ("username", "password"):
+        if not isinstance(account.get(key), str) or not account[key]:
+            raise ValueError(f"账户缺少 {key}")
+    if provider.lower() == "custom" and not isinstance(account.get("host"), str):
+        raise ValueError("provider: custom 时必须填写 host")
+    port = account.get("port")
+    if port is not None and (isinstance(port, bool) or not isinstance(port, int) or not 0 < port < 65536):
+        raise ValueError("port 必须是 1-65535 的整数")
+    if not isinstance(account.get("name", ""), str):
+        raise ValueError("name 必须是字符串")
+    if not isinstance(account.get("ssl", True), bool):
+        raise ValueError("ssl 必须是布尔值")
+
+
+def _validate_filters(filters) -> None:
+    if not isinstance(filters, dict):
+        raise ValueError("filters 必须是映射")
+    unknown = set(filters) - {"lookback_days", *_LIST_FILTERS}
+    if unknown:
+        raise ValueError(f"filters 中的未知字段: {', '.join(sorted(unknown))}")
+    days = filters.get("lookback_days", 1)
+    if isinstance(days, bool) or not isinstance(days, int) or days <= 0:
+        raise ValueError("filters.lookback_days 必须是正整数")
+    for key in _LIST_FILTERS:
+        value = filters.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f"filters.{key} 必须是字符串列表")
+
+
+def build_job_config(base_cfg: dict, request: dict, data_dir: Path) -> dict:
+    """
+    在服务配置的基础上换成作业的账户与筛选条件，归档目录指向命名空间目录。
+    密码中的 ${ENV_VAR} 不展开：外部请求不应读取服务所在机器的环境变量。
+    """
+    cfg = copy.deepcopy(base_cfg)
+    cfg.pop("email", None)
+    cfg["accounts"] = copy.deepcopy(request.get("accounts") or [request["email"]])
+    cfg["filters"] = {**cfg.get("filters", {}), **copy.deepcopy(request.get("filters", {}))}
+    cfg = normalize_config(cfg, resolve_env=False)
+    cfg["output"]["base_dir"] = str(namespace_dir(data_dir, request.get("namespace", "default")) / "archive")
+    return cfg
+
+
+def namespace_dir(data_dir: Path, namespace: str) -> Path:
+    return data_dir / "namespaces" / namespace
+
+
+def job_dir(data_dir: Path, job_id: str) -> Path:
+    return data_dir / "jobs" / job_id
+
+
+class InvoiceService:
+    """作业队列与固定数量的工作线程；HTTP处理器只与本类交互"""
+
+    def __init__(self, cfg: dict):
+        from .pipeline import SharedResources
+
+        self.cfg = cfg
+        self.data_dir = Path(cfg["service"]["data_dir"]).expanduser()
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.queue = JobQueue(self.data_dir / "jobs.db")
+        recovered = self.queue.recover()
+        if recovered:
+            logger.warning(f"{recovered} 个作业在上次退出时未完成，已标记为失败（授权码不落盘），需要重新提交")
+        self.shared = SharedResources.from_config(cfg)
+        self.workers = max(1, int(cfg["service"]["workers"]))
+        self._cond = threading.Condition()
+        self._busy: set[str] = set()   # 正在运行作业的命名空间
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        from . import pipeline
+
+        # 多个作业并发运行，进度输出交错无意义；结果见作业状态与事件日志
+        pipeline.console.quiet = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """不再领取新作业，等待运行中的作业结束后释放共享资源"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self.shared.close()
+        self.queue.close()
+
+    def submit(self, request: dict) -> Job:
+        namespace = validate_request(request)
+        try:
+            build_job_config(self.cfg, request, self.data_dir)  # 提交时即报告配置错误
+        except (TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"作业配置无效: {type(e).__name__}: {e}") from e
+        job = self.queue.submit(namespace, request)
+        METRICS.inc("service_jobs_submitted_total")
+        with self._cond:
+            self._cond.notify()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        return self.queue.cancel(job_id)
+
+    def saved_files(self, job: Job) -> list[Path]:
+        """从事件日志中取本次保存的文件（只返回仍在该命名空间归档目录内的文件）"""
+        archive = (namespace_dir(self.data_dir, job.namespace) / "archive").resolve()
+        events = job_dir(self.data_dir, job.id) / "events.jsonl"
+        files: list[Path] = []
+        try:
+            lines = events.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return files
+        for line in lines:
+            try:
+                path = json.loads(line).get("path")
+            except json.JSONDecodeError:
+                continue
+            if not path:
+                continue
+            resolved = Path(path).resolve()
+            if resolved.is_relative_to(archive) and resolved.is_file() and resolved not in files:
+                files.append(resolved)
+        return files
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    job = self.queue.claim(self._busy)
+                    if job is not None:
+                        self._busy.add(job.namespace)
+                        break
+                    # 超时后重新检查：其他线程结束作业、释放命名空间时也会唤醒
+                    self._cond.wait(5)
+                if job is None:
+                    return
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._busy.discard(job.namespace)
+                    self._cond.notify_all()
+
+    def _run(self, job: Job):
+        from .pipeline import run_pipeline
+
+        request = job.request
+        workspace = namespace_dir(self.data_dir, job.namespace)
+        journal_path = job_dir(self.data_dir, job.id) / "events.jsonl"
+        logger.info(f"作业 {job.id} 开始（命名空间 {job.namespace}）")
+        try:
+            cfg = build_job_config(self.cfg, request, self.data_dir)
+            stats = run_pipeline(
+                cfg=cfg,
+                shared=self.shared,
+                workspace=workspace,
+                journal_path=journal_path,
+                month=request.get("month"),
+                dry_run=bool(request.get("dry_run")),
+                retry_only=bool(request.get("retry_only")),
+                max_duration=request.get("max_duration"),
+            )
+        except (RuntimeError, ValueError, OSError) as e:
+            self.queue.fail(job.id, str(e))
+            METRICS.inc("service_jobs_failed_total")
+            logger.warning(f"作业 {job.id} 失败: {e}")
+            return
+        except Exception as e:
+            self.queue.fail(job.id, f"{type(e).__name__}: {e}")
+            METRICS.inc("service_jobs_failed_total")
+            logger.exception(f"作业 {job.id} 异常")
+            return
+        self.queue.finish(job.id, {
+            "stats": stats,
+            "archive_dir": cfg["output"]["base_dir"],
+            "events": str(journal_path) if journal_path.exists() else None,
+        })
+        METRICS.inc("service_jobs_succeeded_total")
+        logger.info(f"作业 {job.id} 完成")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "invoice-collector"
+    service: InvoiceService
+    token: str
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["healthz"]:
+            return self._json({"status": "ok", "jobs": self.service.queue.counts()})
+        if self.token and self.headers.get("Authorization", "") != f"Bearer {self.token}":
+            return self._error(HTTPStatus.UNAUTHORIZED, "需要 Authorization: Bearer <token>")
+        try:
+            if parts == ["metrics"] and method == "GET":
+                return self._send(HTTPStatus.OK, METRICS.to_prometheus().encode("utf-8"),
+                                  "text/plain; version=0.0.4; charset=utf-8")
+            if parts == ["jobs"]:
+                if method == "POST":
+                    return self._submit()
+                if method == "GET":
+                    return self._list(parse_qs(url.query))
+            if len(parts) >= 2 and parts[0] == "jobs":
+                job = self.service.queue.get(parts[1])
+                if job is None:
+                    return self._error(HTTPStatus.NOT_FOUND, "作业不存在")
+                return self._job_route(method, job, parts[2:])
+        except BrokenPipeError:
+            return
+        self._error(HTTPStatus.NOT_FOUND, "未知接口")
+
+    def _job_route(self, method: str, job: Job, rest: list[str]):
+        if not rest and method == "GET":
+            return self._json(job.to_dict())
+        if not rest and method == "DELETE":
+            if not self.service.cancel(job.id):
+                return self._error(HTTPStatus.CONFLICT, f"只能取消排队中的作业（当前 {job.status}）")
+            return self._json(self.service.queue.get(job.id).to_dict())
+        if rest == ["events"] and method == "GET":
+            path = job_dir(self.service.data_dir, job.id) / "events.jsonl"
+            data = path.read_bytes() if path.exists() else b""
+            return self._send(HTTPStatus.OK, data, "application/x-ndjson; charset=utf-8")
+        if rest and rest[0] == "files" and method == "GET":
+            files = self.service.saved_files(job)
+            if len(rest) == 1:
+                return self._json({
+                    "id": job.id,
+                    "complete": job.status in FINISHED,
+                    "files": [{"index": i, "name": f.name, "size": f.stat().st_size} for i, f in enumerate(files)],
+                })
+            if len(rest) == 2 and rest[1].isdigit() and int(rest[1]) < len(files):
+                file = files[int(rest[1])]
+                return self._send(HTTPStatus.OK, file.read_bytes(), "application/octet-stream",
+                                  {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(file.name, safe='')}"})
+            return self._error(HTTPStatus.NOT_FOUND, "文件不存在")
+        self._error(HTTPStatus.NOT_FOUND, "未知接口")
+
+    def _submit(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._error(HTTPStatus.BAD_REQUEST, "Content-Length 无效")
+        if length < 0:
+            return self._error(HTTPStatus.BAD_REQUEST, "Content-Length 无效")
+        if length > MAX_REQUEST_BYTES:
+            return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大")
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.service.submit(request)
+        except json.JSONDecodeError as e:
+            return self._error(HTTPStatus.BAD_REQUEST, f"JSON格式错误: {e}")
+        except ValueError as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        self._json(job.to_dict(), HTTPStatus.ACCEPTED, {"Location": f"/jobs/{job.id}"})
+
+    def _list(self, query: dict):
+        status = query.get("status", [None])[0]
+        try:
+            limit = min(500, max(1, int(query.get("limit", ["50"])[0])))
+        except ValueError:
+            return self._error(HTTPStatus.BAD_REQUEST, "limit 必须是整数")
+        jobs = self.service.queue.list(status=status, limit=limit)
+        self._json({"jobs": [job.to_dict() for job in jobs]})
+
+    def _json(self, body, status: HTTPStatus = HTTPStatus.OK, headers: dict | None = None):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self._send(status, data, "application/json; charset=utf-8", headers)
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._json({"error": message}, status)
+
+    def _send(self, status: HTTPStatus, data: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(service: InvoiceService, host: str, port: int, token: str = "") -> ThreadingHTTPServer:
+    """每个服务实例一个处理器子类，避免在类属性上共享状态"""
+    handler = type("Handler", (_Handler,), {"service": service, "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def run_service(cfg: dict, host: str | None = None, port: int | None = None, workers: int | None = None):
+    """启动服务并阻塞，Ctrl-C 时等待运行中的作业结束后退出"""
+    from rich.console import Console
+
+    console = Console()
+    if workers is not None:
+        cfg["service"]["workers"] = workers
+    host = host or cfg["service"]["host"]
+    port = cfg["service"]["port"] if port is None else port
+    service = InvoiceService(cfg)
+    server = create_server(service, host, port, cfg["service"]["token"])
+    service.start()
+    console.print(f"[bold cyan]发票归档服务[/bold cyan] http://{host}:{server.server_address[1]}"
+                  f"  工作线程 {service.workers}  数据目录 {service.data_dir}")
+    if not cfg["service"]["token"] and host not in ("127.0.0.1", "localhost", "::1"):
+        console.print("[yellow]警告: 监听非本机地址且未设置 service.token，任何人都可提交作业[/yellow]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        console.print("\n[yellow]正在停止，等待运行中的作业结束...[/yellow]")
+    finally:
+        server.server_close()
+        service.stop()
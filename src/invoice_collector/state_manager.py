@@ -2,63 +2,204 @@
 
 import json
 import logging
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows：仅保留进程内互斥
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_STATE_PATH = Path("~/invoice-collector/state.json").expanduser()
 
+# 指数退避的最长间隔
+MAX_BACKOFF_SECONDS = 24 * 3600
+
 
 class StateManager:
+    """
+    state.json 的读写封装。多线程共享同一实例时由内部锁串行化；
+    多个进程写同一文件时，保存前在文件锁内重新读取磁盘内容并合并本进程的改动。
+    """
+
     def __init__(self, state_path: Path | None = None):
         self.path = state_path or DEFAULT_STATE_PATH
         self._state: dict = {}
+        self._dirty: set[str] = set()
+        self._lock = threading.RLock()
         self._load()
 
     def _load(self):
+        self._state = self._read_disk()
+
+    def _read_disk(self) -> dict:
         if self.path.exists():
             try:
                 with open(self.path, encoding="utf-8") as f:
-                    self._state = json.load(f)
+                    return json.load(f)
             except (json.JSONDecodeError, OSError) as e:
                 logger.warning(f"state.json读取失败，从空状态开始: {e}")
-                self._state = {}
+        return {}
 
-    def _save(self):
-        """原子写：先写.tmp再rename"""
-        tmp = self.path.with_suffix(".json.tmp")
+    @contextmanager
+    def _file_lock(self):
+        """跨进程互斥：对 state.json.lock 加排他锁"""
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(self._state, f, ensure_ascii=False, indent=2)
-        tmp.rename(self.path)
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_suffix(".json.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        """原子写：先写.tmp再rename；写前合并其他进程已落盘的记录"""
+        with self._file_lock():
+            merged = self._read_disk()
+            for uid in self._dirty:
+                merged[uid] = self._state[uid]
+            for uid, entry in merged.items():
+                self._state.setdefault(uid, entry)
+            tmp = self.path.with_suffix(".json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(merged, f, ensure_ascii=False, indent=2)
+            tmp.replace(self.path)
+            self._dirty.clear()
+
+    def _set(self, uid: str, entry: dict):
+        with self._lock:
+            self._state[uid] = entry
+            self._dirty.add(uid)
+            self._save()
 
     def is_processed(self, uid: str) -> bool:
         return uid in self._state
 
     def get_processed_uids(self) -> set[str]:
-        return set(self._state.keys())
+        """扫描时应跳过的ID：已完成、已放弃，以及等待重试的（重试由 due_retries 单独处理）"""
+        with self._lock:
+            return set(self._state.keys())
 
     def mark_done(self, uid: str, subject: str, output_files: list[str]):
-        self._state[uid] = {
+        self._set(uid, {
             "subject": subject,
             "processed_at": datetime.now().isoformat(),
             "output_files": output_files,
             "status": "done",
-        }
-        self._save()
+        })
 
     def mark_failed(self, uid: str, subject: str, reason: str):
-        self._state[uid] = {
+        self._set(uid, {
             "subject": subject,
             "processed_at": datetime.now().isoformat(),
             "output_files": [],
             "status": "failed",
             "reason": reason,
-        }
-        self._save()
+        })
+
+    def schedule_retry(
+        self,
+        uid: str,
+        subject: str,
+        reason: str,
+        failure_class: str,
+        *,
+        account: str = "",
+        locator=None,
+        pending_urls: list[str] | None = None,
+        output_files: list[str] | None = None,
+        max_attempts: int = 5,
+        backoff_seconds: float = 1800,
+    ) -> bool:
+        """
+        记录一次处理失败。暂时性故障（failure_class="transient"）按指数退避安排下次重试，
+        状态为 "retry"，返回True；永久性故障或累计尝试达到 max_attempts 时转为 "failed"，返回False。
+        locator: 邮件来源给出的定位信息，重试时据此直接取回邮件而无需重新扫描文件夹。
+        pending_urls: 重试时只需重新下载的URL（已保存的文件记录在 output_files 中）。
+        """
+        with self._lock:
+            attempts = self._state.get(uid, {}).get("attempts", 0) + 1
+            now = datetime.now()
+            entry = {
+                "subject": subject,
+                "processed_at": now.isoformat(),
+                "output_files": output_files or [],
+                "status": "failed",
+                "reason": reason,
+                "failure_class": failure_class,
+                "attempts": attempts,
+                "account": account,
+                "locator": locator,
+                "pending_urls": pending_urls or [],
+            }
+            if failure_class == "transient" and attempts < max_attempts:
+                delay = min(backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+                entry["status"] = "retry"
+                entry["next_attempt_at"] = (now + timedelta(seconds=delay)).isoformat(timespec="seconds")
+            self._set(uid, entry)
+            return entry["status"] == "retry"
+
+    def mark_deferred(
+        self,
+        uid: str,
+        subject: str,
+        *,
+        account: str = "",
+        locator=None,
+        pending_urls: list[str] | None = None,
+        output_files: list[str] | None = None,
+    ):
+        """运行时长用尽时记录未完成的URL，下次运行优先处理（不计入重试次数）"""
+        with self._lock:
+            prev = self._state.get(uid, {})
+            self._set(uid, {
+                "subject": subject,
+                "processed_at": datetime.now().isoformat(),
+                "output_files": output_files or [],
+                "status": "deferred",
+                "reason": "运行时长用尽",
+                "attempts": prev.get("attempts", 0),
+                "account": account,
+                "locator": locator,
+                "pending_urls": pending_urls or [],
+                "next_attempt_at": datetime.now().isoformat(timespec="seconds"),
+            })
+
+    def due_retries(self, account: str, now: datetime | None = None) -> list[tuple[str, dict]]:
+        """返回指定账户已到重试时间（含上次延后）的记录 [(uid, entry), ...]，按到期时间排序"""
+        now_str = (now or datetime.now()).isoformat(timespec="seconds")
+        with self._lock:
+            due = [
+                (uid, dict(entry)) for uid, entry in self._state.items()
+                if entry.get("status") in ("retry", "deferred")
+                and entry.get("account") == account
+                and entry.get("next_attempt_at", "") <= now_str
+            ]
+        return sorted(due, key=lambda item: item[1].get("next_attempt_at", ""))
+
+    def rename_output_files(self, moves: dict[str, str]):
+        """文件被重新归档后，同步更新记录中的输出路径"""
+        if not moves:
+            return
+        with self._lock:
+            for uid, entry in self._state.items():
+                files = entry.get("output_files", [])
+                if any(f in moves for f in files):
+                    entry["output_files"] = [moves.get(f, f) for f in files]
+                    self._dirty.add(uid)
+            if self._dirty:
+                self._save()
 
     def summary(self) -> dict:
-        done = sum(1 for v in self._state.values() if v["status"] == "done")
-        failed = sum(1 for v in self._state.values() if v["status"] == "failed")
-        return {"total": len(self._state), "done": done, "failed": failed}
+        with self._lock:
+            done = sum(1 for v in self._state.values() if v["status"] == "done")
+            failed = sum(1 for v in self._state.values() if v["status"] == "failed")
+            retry = sum(1 for v in self._state.values() if v["status"] in ("retry", "deferred"))
+            return {"total": len(self._state), "done": done, "failed": failed, "retry": retry}
@@ -1,12 +1,19 @@
 """网页发票下载模块（百望云 / 诺诺 / 通用PDF链接）"""
 
+import html
 import re
 import logging
 import tempfile
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import httpx
 
+from .metrics import METRICS, timed
+from .mime_parser import as_parsed
+
 logger = logging.getLogger(__name__)
 
 # 图片/无效内容过滤（匹配URL任意位置，包含查询参数中的文件名）
@@ -44,8 +51,35 @@ INVOICE_URL_PATTERNS = [
     re.compile(r"https?://[^\s\"'<>]*[Ww]jgs=OFD[^\s\"'<>]*", re.IGNORECASE),
 ]
 
+# 纯文本正文中紧跟在URL后的中文标点（URL中不会出现未编码的全角标点），截断于此
+_URL_TERMINATORS = re.compile(r"[，。；、！？（）《》「」【】]")
+
 LOGIN_INDICATORS = re.compile(r"/(login|sso|auth|signin|oauth)", re.IGNORECASE)
 
+# 下载按钮（优先PDF，其次OFD）；出现任意一个即认为页面可操作，不再等待 networkidle
+DOWNLOAD_SELECTORS = [
+    "button:has-text('下载PDF')",
+    "a:has-text('下载PDF')",
+    "button:has-text('下载发票')",
+    "a:has-text('下载发票')",
+    "button:has-text('下载')",
+    "a:has-text('下载')",
+    "[class*='download-pdf']",
+    "[class*='downloadPdf']",
+    "[class*='download']",
+    "button:has-text('打印')",
+]
+_READY_SELECTOR = ", ".join(DOWNLOAD_SELECTORS)
+READY_POLL_MS = 100
+
+# 发票平台页面的统计/埋点/广告请求，与下载无关，直接拦截
+_TRACKER_HOSTS = re.compile(
+    r"^https?://[^/]*(?:google-analytics\.com|googletagmanager\.com|doubleclick\.net"
+    r"|hm\.baidu\.com|cnzz\.com|umeng\.com|growingio\.com|sensorsdata\.cn|51\.la"
+    r"|tajs\.qq\.com|pingjs\.qq\.com|arms-retcode[\w.-]*\.aliyuncs\.com|mmstat\.com)(?::\d+)?/",
+    re.IGNORECASE,
+)
+
 
 def _is_image_url(url: str) -> bool:
     """判断URL是否为图片链接（含查询参数中的图片文件名）"""
@@ -63,12 +97,12 @@ def _is_ofd_bytes(data: bytes) -> bool:
 
 
 def extract_invoice_urls(msg_text: str) -> list[str]:
-    """从邮件文本/HTML中提取发票URL（过滤图片URL）"""
+    """从邮件文本/HTML中提取发票URL（过滤图片URL）；HTML属性中的 &amp; 等实体还原为原字符"""
     found: list[str] = []
     seen: set[str] = set()
     for pattern in INVOICE_URL_PATTERNS:
         for url in pattern.findall(msg_text):
-            url = url.rstrip(".,;)")
+            url = _URL_TERMINATORS.split(html.unescape(url), 1)[0].rstrip(".,;)")
             if url in seen:
                 continue
             if _is_image_url(url):
@@ -82,34 +116,78 @@ def extract_invoice_urls(msg_text: str) -> list[str]:
     return found
 
 
+def message_text(msg) -> str:
+    """邮件正文文本：只解码 text/plain 与 text/html 部分"""
+    texts = [part.get_text() for part in as_parsed(msg).text_parts()]
+    return "\n".join(t for t in texts if t)
+
+
 def extract_urls_from_message(msg) -> list[str]:
     """从邮件对象提取所有发票URL"""
-    texts: list[str] = []
-    for part in msg.walk():
-        ct = part.get_content_type()
-        if ct in ("text/plain", "text/html"):
-            payload = part.get_payload(decode=True)
-            if payload:
-                try:
-                    texts.append(payload.decode("utf-8", errors="replace"))
-                except Exception:
-                    texts.append(payload.decode("gbk", errors="replace"))
-    return extract_invoice_urls("\n".join(texts))
+    return extract_invoice_urls(message_text(msg))
 
 
-def download_invoice_from_url(url: str, playwright_cfg: dict) -> tuple[bytes, str] | None:
+# 下载失败分类：transient 可稍后重试（超时/5xx/网络错误），permanent 重试无意义（登录页/无下载按钮/4xx）
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+
+class DownloadError(Exception):
+    """URL下载失败，failure_class 为 TRANSIENT 或 PERMANENT"""
+
+    def __init__(self, message: str, failure_class: str = PERMANENT):
+        super().__init__(message)
+        self.failure_class = failure_class
+
+
+def fetch_invoice_from_url(url: str, playwright_cfg: dict) -> tuple[bytes, str]:
     """
-    从URL下载发票。
-    返回 (file_bytes, fmt)，fmt 为 "pdf" 或 "ofd"。
-    失败返回 None。
+    从URL下载发票，返回 (file_bytes, fmt)。
+    失败时抛出 DownloadError；直链与Playwright任一环节是暂时性故障即视为可重试。
     """
+    failures: list[str] = []
     # 先尝试 httpx 直接下载（快速路径，覆盖税局/直链等直接返回文件的URL）
-    result = _try_direct_download(url)
+    result = fetch_invoice_direct(url, failures)
     if result:
         return result
 
     # httpx 失败则回落 Playwright（处理动态渲染页面）
-    return _try_playwright(url, playwright_cfg)
+    return fetch_invoice_with_browser(url, playwright_cfg, failures)
+
+
+def fetch_invoice_direct(url: str, failures: list[str] | None = None) -> tuple[bytes, str] | None:
+    """
+    只走 httpx 直链下载（已知平台的预览页先改写为文件直链）；
+    返回None表示需要浏览器处理，直链阶段的失败类型追加到 failures
+    """
+    return _try_direct_download(url, failures)
+
+
+def fetch_invoice_with_browser(
+    url: str, playwright_cfg: dict, failures: list[str] | None = None
+) -> tuple[bytes, str]:
+    """
+    用Playwright下载发票，失败时抛出 DownloadError。
+    failures: 此前直链阶段记录的失败类型，参与判断是否可重试。
+    """
+    failures = list(failures or [])
+    result = _try_playwright(url, playwright_cfg, failures)
+    if result:
+        return result
+    failure_class = TRANSIENT if TRANSIENT in failures else PERMANENT
+    raise DownloadError("无法下载", failure_class)
+
+
+def download_invoice_from_url(url: str, playwright_cfg: dict) -> tuple[bytes, str] | None:
+    """
+    从URL下载发票。
+    返回 (file_bytes, fmt)，fmt 为 "pdf" 或 "ofd"。
+    失败返回 None。
+    """
+    try:
+        return fetch_invoice_from_url(url, playwright_cfg)
+    except DownloadError:
+        return None
 
 
 def download_pdf_from_url(url: str, playwright_cfg: dict) -> bytes | None:
@@ -118,83 +196,198 @@ def download_pdf_from_url(url: str, playwright_cfg: dict) -> bytes | None:
     return result[0] if result else None
 
 
+@dataclass
+class DirectResolver:
+    """
+    平台预览页 → 文件直链：域名匹配 host、path?query 匹配 pattern 时，
+    按 templates 依次生成候选URL（PDF 在前）。模板可用 {scheme}、{host}（含端口）与 pattern 的命名分组。
+    """
+    platform: str
+    host: re.Pattern
+    pattern: re.Pattern
+    templates: list[str]
+
+    def resolve(self, url: str) -> list[str]:
+        parts = urlsplit(url)
+        if not self.host.search(parts.hostname or ""):
+            return []
+        m = self.pattern.search(f"{parts.path}?{parts.query}")
+        if not m:
+            return []
+        values = m.groupdict(default="")
+        return [t.format(scheme=parts.scheme, host=parts.netloc, **values) for t in self.templates]
+
+
+def _resolver(platform: str, host: str, pattern: str, *templates: str) -> DirectResolver:
+    return DirectResolver(platform, re.compile(host, re.IGNORECASE), re.compile(pattern, re.IGNORECASE),
+                          list(templates))
+
+
+# 预览页链接与其文件下载接口的对应关系；已经是文件直链的URL（Wjgs=PDF 等）不匹配，按原URL下载。
+# 只收录下载接口与参数来自真实通知链接的规则：税局导出接口 exportDzfpwjEwm 以 Wjgs 指定文件格式
+# （PDF/OFD/XML，见上方 URL 过滤规则），缺少该参数时返回预览页。其他平台的下载接口未知，交给浏览器；
+# 确认了某个平台的真实下载接口后，可用 register_resolver 注册
+DIRECT_RESOLVERS: list[DirectResolver] = [
+    _resolver(
+        "国家税务总局", r"(^|\.)chinatax\.gov\.cn$",
+        r"/exportDzfpwjEwm\?(?P<query>(?![^#]*\bWjgs=)[^#]+)",
+        "{scheme}://{host}/kpfw/fpjfzz/v1/exportDzfpwjEwm?{query}&Wjgs=PDF",
+        "{scheme}://{host}/kpfw/fpjfzz/v1/exportDzfpwjEwm?{query}&Wjgs=OFD",
+    ),
+]
+
+
+def register_resolver(resolver: DirectResolver):
+    """注册自定义平台的直链规则（先于内置规则匹配）"""
+    DIRECT_RESOLVERS.insert(0, resolver)
+
+
+def resolve_direct_urls(url: str) -> list[str]:
+    """已知平台预览页对应的文件直链候选；未知平台或已是直链时返回空列表"""
+    for resolver in DIRECT_RESOLVERS:
+        candidates = resolver.resolve(url)
+        if candidates:
+            return candidates
+    return []
+
+
 _BROWSER_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Accept": "application/pdf,application/octet-stream,*/*",
 }
 
 
-def _try_direct_download(url: str) -> tuple[bytes, str] | None:
-    """直接HTTP GET下载，自动识别PDF或OFD"""
+# 共享资源池：所有账户/线程共用一个httpx连接池；同时运行的Chromium实例数受信号量限制
+_http_client: httpx.Client | None = None
+_http_lock = threading.Lock()
+_http_max_connections = 10
+_browser_slots = threading.BoundedSemaphore(2)
+
+
+def configure_pools(http_connections: int = 10, browsers: int = 2):
+    """设置HTTP连接池大小与浏览器并发上限（在处理开始前调用）"""
+    global _http_max_connections, _browser_slots
+    close_pools()
+    _http_max_connections = max(1, http_connections)
+    _browser_slots = threading.BoundedSemaphore(max(1, browsers))
+
+
+def close_pools():
+    global _http_client
+    with _http_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def _get_http_client() -> httpx.Client:
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                timeout=30,
+                follow_redirects=True,
+                headers=_BROWSER_HEADERS,
+                limits=httpx.Limits(max_connections=_http_max_connections),
+            )
+        return _http_client
+
+
+@timed("http_download")
+def _try_direct_download(url: str, failures: list[str] | None = None) -> tuple[bytes, str] | None:
+    """
+    直接HTTP GET下载，自动识别PDF或OFD；已知平台的预览页先依次尝试改写后的文件直链，
+    都不可用时再请求原URL。失败类型追加到 failures（只记原URL的失败：
+    改写出的候选URL是推导的，其超时或5xx不代表原链接值得重试）
+    """
+    failures = failures if failures is not None else []
+    for candidate in resolve_direct_urls(url):
+        result = _http_get_invoice(candidate, [])
+        if result:
+            METRICS.inc("url_resolved_total")
+            return result
+    return _http_get_invoice(url, failures)
+
+
+def _http_get_invoice(url: str, failures: list[str]) -> tuple[bytes, str] | None:
     try:
-        with httpx.Client(timeout=30, follow_redirects=True, headers=_BROWSER_HEADERS) as client:
-            resp = client.get(url)
-            resp.raise_for_status()
-            content_type = resp.headers.get("content-type", "").lower()
-            # OFD判断：Content-Type 含 ofd，或字节头是ZIP且URL含.ofd
-            if "ofd" in content_type or (
-                _is_ofd_bytes(resp.content) and ".ofd" in url.lower()
-            ):
-                return resp.content, "ofd"
-            if "pdf" in content_type or resp.content[:4] == b"%PDF":
-                return resp.content, "pdf"
+        resp = _get_http_client().get(url)
+        resp.raise_for_status()
+        METRICS.inc("http_bytes_total", len(resp.content))
+        content_type = resp.headers.get("content-type", "").lower()
+        # OFD判断：Content-Type 含 ofd，或字节头是ZIP且URL含.ofd
+        if "ofd" in content_type or (
+            _is_ofd_bytes(resp.content) and ".ofd" in url.lower()
+        ):
+            return resp.content, "ofd"
+        if "pdf" in content_type or resp.content[:4] == b"%PDF":
+            return resp.content, "pdf"
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        failures.append(TRANSIENT if status >= 500 or status == 429 else PERMANENT)
+        logger.debug(f"直接下载失败 {url}: HTTP {status}")
+    except (httpx.TimeoutException, httpx.TransportError) as e:
+        failures.append(TRANSIENT)
+        logger.debug(f"直接下载失败 {url}: {e}")
     except Exception as e:
         logger.debug(f"直接下载失败 {url}: {e}")
     return None
 
 
-def _try_playwright(url: str, playwright_cfg: dict) -> tuple[bytes, str] | None:
-    """使用Playwright下载动态网页发票（不使用page.pdf()兜底）"""
+@timed("playwright")
+def _try_playwright(
+    url: str, playwright_cfg: dict, failures: list[str] | None = None
+) -> tuple[bytes, str] | None:
+    """使用Playwright下载动态网页发票（不使用page.pdf()兜底）；失败类型追加到 failures"""
+    failures = failures if failures is not None else []
     try:
-        from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+        from playwright.sync_api import sync_playwright
     except ImportError:
         logger.warning("Playwright未安装，跳过网页发票下载")
+        failures.append(PERMANENT)
         return None
 
     timeout = playwright_cfg.get("timeout_ms", 30000)
     headless = playwright_cfg.get("headless", True)
+    ready_timeout = min(timeout, playwright_cfg.get("ready_timeout_ms", 10000))
+    blocked_types = frozenset(playwright_cfg.get("block_resources", ()))
+    block_trackers = playwright_cfg.get("block_trackers", True)
 
     try:
-        with sync_playwright() as pw:
+        with _browser_slots, sync_playwright() as pw:
             browser = pw.chromium.launch(headless=headless)
             context = browser.new_context(accept_downloads=True)
+            if blocked_types or block_trackers:
+                context.route("**/*", lambda route: _filter_request(route, blocked_types, block_trackers))
             page = context.new_page()
+            # 某些URL直接触发文件下载（如税局链接）：监听下载事件，与下载按钮的出现同时等待
+            downloads = []
+            page.on("download", downloads.append)
 
-            # 某些URL直接触发文件下载（如税局链接），用 page.expect_download() 捕获
             try:
-                with page.expect_download(timeout=8000) as dl_info:
-                    page.goto(url, timeout=timeout)
-                download = dl_info.value
-                suggested_name = download.suggested_filename.lower()
-                fmt = "ofd" if suggested_name.endswith(".ofd") else "pdf"
-                with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
-                    tmp_path = tmp.name
-                download.save_as(tmp_path)
-                file_bytes = Path(tmp_path).read_bytes()
-                Path(tmp_path).unlink(missing_ok=True)
-                browser.close()
-                return file_bytes, fmt
-            except PWTimeout:
-                pass  # 无下载事件，继续正常页面流程
+                page.goto(url, timeout=timeout, wait_until="domcontentloaded")
             except Exception as nav_err:
-                err_msg = str(nav_err)
-                if "Download is starting" in err_msg:
+                if "Download is starting" not in str(nav_err):
+                    raise
+                if not downloads:
                     logger.debug(f"URL触发下载但无法捕获（可能需要登录）: {url}")
+                    failures.append(PERMANENT)
                     browser.close()
                     return None
-                raise
+
+            _wait_until_ready(page, downloads, ready_timeout)
+            if downloads:
+                result = _save_download(downloads[0])
+                browser.close()
+                return result
 
             # 检查是否跳转到登录页
             if LOGIN_INDICATORS.search(page.url):
                 logger.warning(f"跳转到登录页，跳过: {url}")
+                failures.append(PERMANENT)
                 browser.close()
                 return None
 
-            try:
-                page.wait_for_load_state("networkidle", timeout=timeout)
-            except PWTimeout:
-                pass
-
             # 查找下载按钮（优先PDF，其次OFD）
             result = _click_download_button(page, timeout)
             browser.close()
@@ -204,31 +397,62 @@ def _try_playwright(url: str, playwright_cfg: dict) -> tuple[bytes, str] | None:
 
             # 放弃 page.pdf() 兜底：不产生无意义的垃圾PDF
             logger.info(f"未找到下载按钮，跳过: {url}")
+            failures.append(PERMANENT)
             return None
 
     except Exception as e:
+        # 导航超时、net::ERR_* 等网络层错误与浏览器崩溃均按暂时性故障处理
         logger.error(f"Playwright处理失败 {url}: {e}")
+        failures.append(TRANSIENT)
         return None
 
 
+def _filter_request(route, blocked_types: frozenset[str], block_trackers: bool):
+    """拦截图片/字体/样式等与下载无关的资源及统计埋点请求，其余放行"""
+    request = route.request
+    if request.resource_type in blocked_types or (block_trackers and _TRACKER_HOSTS.search(request.url)):
+        METRICS.inc("playwright_blocked_requests_total")
+        route.abort()
+    else:
+        route.continue_()
+
+
+def _wait_until_ready(page, downloads: list, timeout: int):
+    """
+    等到页面可操作：已触发下载、出现任一下载按钮或跳转到登录页，最长 timeout 毫秒。
+    超时不报错，由后续按钮查找判定失败。
+    """
+    ready = page.locator(_READY_SELECTOR)
+    waited = 0
+    while waited < timeout:
+        if downloads or LOGIN_INDICATORS.search(page.url):
+            return
+        try:
+            if ready.count() > 0:
+                return
+        except Exception as e:
+            logger.debug(f"等待下载按钮时页面出错: {e}")  # 页面仍在跳转
+        page.wait_for_timeout(READY_POLL_MS)
+        waited += READY_POLL_MS
+
+
+def _save_download(download) -> tuple[bytes, str]:
+    suggested_name = download.suggested_filename.lower()
+    fmt = "ofd" if suggested_name.endswith(".ofd") else "pdf"
+    with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
+        tmp_path = tmp.name
+    download.save_as(tmp_path)
+    file_bytes = Path(tmp_path).read_bytes()
+    Path(tmp_path).unlink(missing_ok=True)
+    METRICS.inc("playwright_bytes_total", len(file_bytes))
+    return file_bytes, fmt
+
+
 def _click_download_button(page, timeout: int) -> tuple[bytes, str] | None:
     """查找并点击下载按钮，优先PDF其次OFD"""
     from playwright.sync_api import TimeoutError as PWTimeout
 
-    download_selectors = [
-        "button:has-text('下载PDF')",
-        "a:has-text('下载PDF')",
-        "button:has-text('下载发票')",
-        "a:has-text('下载发票')",
-        "button:has-text('下载')",
-        "a:has-text('下载')",
-        "[class*='download-pdf']",
-        "[class*='downloadPdf']",
-        "[class*='download']",
-        "button:has-text('打印')",
-    ]
-
-    for selector in download_selectors:
+    for selector in DOWNLOAD_SELECTORS:
         try:
             btn = page.locator(selector).first
             if btn.count() == 0:
@@ -236,18 +460,7 @@ def _click_download_button(page, timeout: int) -> tuple[bytes, str] | None:
 
             with page.expect_download(timeout=timeout) as dl_info:
                 btn.click(timeout=5000)
-            download = dl_info.value
-
-            suggested_name = download.suggested_filename.lower()
-            fmt = "ofd" if suggested_name.endswith(".ofd") else "pdf"
-
-            with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
-                tmp_path = tmp.name
-            download.save_as(tmp_path)
-
-            file_bytes = Path(tmp_path).read_bytes()
-            Path(tmp_path).unlink(missing_ok=True)
-            return file_bytes, fmt
+            return _save_download(dl_info.value)
 
         except PWTimeout:
             continue
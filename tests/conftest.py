@@ -0,0 +1,11 @@
+"""
+测试公共设置。各模块在导入时就计算 ~/invoice-collector 下的默认路径，
+所以在导入 invoice_collector 之前把 HOME 指向临时目录，测试不会写入真实的数据目录。
+"""
+
+import os
+import tempfile
+
+_HOME = tempfile.mkdtemp(prefix="invoice-collector-test-")
+os.environ["HOME"] = _HOME
+os.environ["USERPROFILE"] = _HOME
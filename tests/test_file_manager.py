@@ -0,0 +1,52 @@
+"""文件命名与写入"""
+
+import threading
+
+from invoice_collector.catalog import InvoiceCatalog
+from invoice_collector.file_manager import is_same_slot, save_invoice_file
+from invoice_collector.pdf_parser import InvoiceFields
+
+FIELDS = InvoiceFields(date="20250105", amount="35.00", service="*餐饮服务*餐费", parse_ok=True)
+
+
+def test_saves_into_month_dir(tmp_path):
+    path = save_invoice_file(b"%PDF-1", FIELDS, "餐饮发票", tmp_path)
+    assert path == tmp_path / "2025年01月" / "20250105_35.00_餐饮发票.pdf"
+    assert path.read_bytes() == b"%PDF-1"
+
+
+def test_dry_run_does_not_write(tmp_path):
+    path = save_invoice_file(b"%PDF-1", FIELDS, "餐饮发票", tmp_path, dry_run=True)
+    assert path.name == "20250105_35.00_餐饮发票.pdf"
+    assert not path.exists()
+
+
+def test_same_name_gets_counter_suffix(tmp_path):
+    first = save_invoice_file(b"a", FIELDS, "餐饮发票", tmp_path)
+    second = save_invoice_file(b"b", FIELDS, "餐饮发票", tmp_path)
+    assert second.name == "20250105_35.00_餐饮发票_2.pdf"
+    assert is_same_slot(second, first)
+    assert first.read_bytes() == b"a" and second.read_bytes() == b"b"
+
+
+def test_concurrent_saves_never_overwrite(tmp_path):
+    catalog = InvoiceCatalog(tmp_path / "catalog.db")
+    barrier = threading.Barrier(8)
+    paths = []
+
+    def save(i: int):
+        barrier.wait()
+        paths.append(save_invoice_file(f"invoice-{i}".encode(), FIELDS, "餐饮发票", tmp_path / "archive",
+                                       catalog=catalog, source_uid=str(i)))
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    try:
+        assert len(set(paths)) == 8
+        assert sorted(p.read_bytes() for p in paths) == sorted(f"invoice-{i}".encode() for i in range(8))
+        assert catalog.summary()[0]["count"] == 8
+    finally:
+        catalog.close()
@@ -0,0 +1,79 @@
+"""服务模式的作业队列：授权码不落盘"""
+
+import stat
+import sys
+
+import pytest
+
+from invoice_collector.job_queue import CANCELLED, FAILED, RUNNING, SUCCEEDED, JobQueue
+
+REQUEST = {
+    "namespace": "alice",
+    "email": {"provider": "qq", "username": "alice@qq.com", "password": "secret-code"},
+}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(tmp_path / "service" / "jobs.db")
+    yield q
+    q.close()
+
+
+def _disk_bytes(q: JobQueue) -> bytes:
+    return b"".join(p.read_bytes() for p in q.path.parent.glob("jobs.db*"))
+
+
+def test_password_stays_in_memory(queue):
+    job = queue.submit("alice", REQUEST)
+    assert b"secret-code" not in _disk_bytes(queue)
+    assert queue.get(job.id).request["email"]["password"] == "***"
+    claimed = queue.claim(set())
+    assert claimed.id == job.id and claimed.status == RUNNING
+    assert claimed.request["email"]["password"] == "secret-code"
+    queue.finish(job.id, {"stats": {}})
+    assert queue.get(job.id).status == SUCCEEDED
+    assert not queue._requests
+
+
+def test_claim_skips_busy_namespace(queue):
+    queue.submit("alice", REQUEST)
+    bob = queue.submit("bob", {**REQUEST, "namespace": "bob"})
+    assert queue.claim({"alice"}).id == bob.id
+    assert queue.claim({"alice", "bob"}) is None
+
+
+def test_cancel_only_queued(queue):
+    job = queue.submit("alice", REQUEST)
+    assert queue.cancel(job.id)
+    assert queue.get(job.id).status == CANCELLED
+    assert not queue.cancel(job.id)
+    assert queue.claim(set()) is None
+
+
+def test_restart_fails_unfinished_jobs(tmp_path):
+    path = tmp_path / "jobs.db"
+    first = JobQueue(path)
+    queued = first.submit("alice", REQUEST)
+    running = first.submit("bob", REQUEST)
+    first.claim({"alice"})
+    first.close()
+
+    second = JobQueue(path)
+    try:
+        assert second.recover() == 2
+        for job_id in (queued.id, running.id):
+            job = second.get(job_id)
+            assert job.status == FAILED
+            assert "重新提交" in job.error
+        assert second.claim(set()) is None
+    finally:
+        second.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX 权限")
+def test_database_files_are_private(queue):
+    queue.submit("alice", REQUEST)
+    assert stat.S_IMODE(queue.path.parent.stat().st_mode) == 0o700
+    for path in queue.path.parent.glob("jobs.db*"):
+        assert stat.S_IMODE(path.stat().st_mode) == 0o600, path
@@ -0,0 +1,61 @@
+"""本地邮件导出来源（mbox / maildir / eml）"""
+
+import mailbox
+from datetime import datetime
+from email.message import EmailMessage
+
+import pytest
+
+from invoice_collector.mail_sources import LocalMailSource
+
+CFG = {"filters": {"subject_keywords": ["发票"], "lookback_days": 30}}
+
+
+def _message(subject: str, message_id: str | None, date: str = "Mon, 06 Jan 2025 10:00:00 +0800") -> bytes:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["Date"] = date
+    if message_id:
+        msg["Message-ID"] = message_id
+    msg.set_content("请查收\n")
+    return msg.as_bytes()
+
+
+MESSAGES = [
+    _message("您的电子发票", "<a@example.com>"),
+    _message("周报", "<b@example.com>"),
+    _message("电子发票 旧邮件", "<c@example.com>", date="Mon, 01 Jan 2024 10:00:00 +0800"),
+    _message("发票通知", None),
+]
+
+
+def _scan(kind: str, path) -> dict[str, str]:
+    source = LocalMailSource(CFG, {"provider": kind, "path": str(path), "workers": 2})
+    source.connect()
+    try:
+        found = {key: subject for key, _, subject in source.iter_invoice_messages(since=datetime(2025, 1, 1))}
+        for key in found:
+            assert source.fetch_located(source.locate(key)) is not None
+        return found
+    finally:
+        source.disconnect()
+
+
+@pytest.mark.parametrize("kind", ["mbox", "maildir"])
+def test_filters_by_subject_and_date(tmp_path, kind):
+    path = tmp_path / kind
+    box = mailbox.mbox(str(path)) if kind == "mbox" else mailbox.Maildir(str(path))
+    for raw in MESSAGES:
+        box.add(raw)
+    box.flush()
+    found = _scan(kind, path)
+    assert sorted(found.values()) == ["发票通知", "您的电子发票"]
+    assert f"{kind}::a@example.com" in found
+    # 无 Message-ID 时以内容哈希作 key
+    assert any("@" not in key for key in found)
+
+
+def test_eml_directory(tmp_path):
+    for i, raw in enumerate(MESSAGES):
+        (tmp_path / f"{i}.eml").write_bytes(raw)
+    assert sorted(_scan("eml", tmp_path).values()) == ["发票通知", "您的电子发票"]
@@ -0,0 +1,20 @@
+"""运行指标报告"""
+
+from invoice_collector.metrics import Metrics
+
+
+def test_report_without_profiled_calls_skips_pstats(tmp_path):
+    metrics = Metrics()
+    metrics.enable_hotpath_profiling()
+    metrics.inc("messages_total")
+    written = metrics.write_report(tmp_path, "profile")
+    assert [p.suffix for p in written] == [".json", ".prom"]
+    assert not (tmp_path / "profile.pstats").exists()
+
+
+def test_report_with_profiled_calls_writes_pstats(tmp_path):
+    metrics = Metrics()
+    metrics.enable_hotpath_profiling()
+    assert metrics.run_profiled(sum, [1, 2, 3]) == 6
+    written = metrics.write_report(tmp_path, "profile")
+    assert (tmp_path / "profile.pstats") in written
@@ -0,0 +1,94 @@
+"""
+PDF/OFD 字段解析与分类的回归测试。
+tests/data/ 中的样本是固定文件（文本层按发票版式逐行写入），期望字段按样本文本手工填写；
+修改解析规则后这些断言不应改变，新增版式时同时加入样本与期望值。
+"""
+
+from dataclasses import asdict
+from pathlib import Path
+
+import pytest
+
+from invoice_collector.classifier import DEFAULT_CATEGORY, classify_invoice
+from invoice_collector.ofd_parser import parse_ofd_bytes
+from invoice_collector.pdf_parser import parse_pdf_bytes
+
+DATA = Path(__file__).parent / "data"
+
+EXPECTED = {
+    # 增值税电子普通发票：发票代码 + 8位号码，日期用横线分隔，金额带千分位
+    "vat_legacy.pdf": {
+        "date": "20241231", "amount": "1280.00", "service": "住宿费",
+        "invoice_number": "12345678", "invoice_code": "044031900111",
+        "seller_tax_id": "91310115MA1K4QXY7N", "category": "住宿发票",
+    },
+    # 全电发票：20位号码，没有发票代码
+    "full_electronic.pdf": {
+        "date": "20250308", "amount": "268.50", "service": "餐费",
+        "invoice_number": "25312000000034567890", "invoice_code": "",
+        "seller_tax_id": "92310000MA1FL6T03C", "category": "餐饮发票",
+    },
+    # 全电发票 OFD，日期不补零、价税合计行没有货币符号
+    "taxi_compact.ofd": {
+        "date": "20250105", "amount": "35.00", "service": "客运服务费",
+        "invoice_number": "25117000000001234567", "invoice_code": "",
+        "seller_tax_id": "91120116MA06C2RB5W", "category": "打车发票",
+    },
+}
+
+
+def _parse(name: str):
+    data = (DATA / name).read_bytes()
+    return parse_ofd_bytes(data) if name.endswith(".ofd") else parse_pdf_bytes(data)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_fields(name):
+    fields = _parse(name)
+    expected = dict(EXPECTED[name])
+    category = expected.pop("category")
+    assert fields.parse_ok
+    assert fields.failure_reason == ""
+    assert {k: v for k, v in asdict(fields).items() if k in expected} == expected
+    assert classify_invoice(fields.service, fields.raw_text) == category
+
+
+def test_pdf_without_text_layer():
+    fields = _parse("no_text_layer.pdf")
+    assert not fields.parse_ok
+    assert (fields.date, fields.amount) == ("", "")
+
+
+def test_ofd_not_a_zip():
+    fields = parse_ofd_bytes(b"%PDF-1.4 not an ofd")
+    assert not fields.parse_ok
+    assert fields.raw_text == ""
+
+
+@pytest.mark.parametrize("service, raw_text, category", [
+    ("住宿费", "", "住宿发票"),
+    ("餐费", "", "餐饮发票"),
+    ("经济舱", "*航空运输服务*机票", "飞机火车发票"),
+    ("客运服务费", "网约车", "打车发票"),
+    # 先匹配先得：酒店内的餐饮按住宿归类
+    ("酒店餐饮服务", "", "住宿发票"),
+    ("软件服务费", "信息技术服务", DEFAULT_CATEGORY),
+    ("", "", DEFAULT_CATEGORY),
+])
+def test_classify_invoice(service, raw_text, category):
+    assert classify_invoice(service, raw_text) == category
+
+
+@pytest.mark.parametrize("name", ["vat_legacy.pdf", "full_electronic.pdf"])
+def test_pdf_fields_do_not_depend_on_extractor_order(name, monkeypatch):
+    # 提取器顺序由历史记录决定（试用期内轮流先试），两种顺序下关键字段应一致
+    from invoice_collector import pdf_parser
+
+    results = []
+    for order in (["pdfplumber", "pypdf"], ["pypdf", "pdfplumber"]):
+        monkeypatch.setattr(pdf_parser.EXTRACTOR_HISTORY, "order", lambda fingerprint, names, o=order: o)
+        fields = _parse(name)
+        results.append((fields.date, fields.amount, fields.invoice_number, fields.invoice_code))
+    assert results[0] == results[1]
+    expected = EXPECTED[name]
+    assert results[0] == (expected["date"], expected["amount"], expected["invoice_number"], expected["invoice_code"])
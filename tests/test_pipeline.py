@@ -0,0 +1,73 @@
+"""pipeline 中不依赖邮箱与浏览器的处理步骤"""
+
+from email.message import EmailMessage
+
+import pytest
+
+from invoice_collector.catalog import InvoiceCatalog
+from invoice_collector.journal import EventJournal
+from invoice_collector.pdf_parser import InvoiceFields
+from invoice_collector.pipeline import MessageJob, RunContext, _skip_archived_urls
+from invoice_collector.state_manager import StateManager
+
+NUMBER_20 = "25442000000123456789"
+URLS = ["https://example.com/invoice/preview?id=1"]
+
+
+@pytest.fixture
+def ctx(tmp_path):
+    catalog = InvoiceCatalog(tmp_path / "catalog.db")
+    context = RunContext(
+        base_dir=tmp_path / "archive",
+        playwright_cfg={},
+        dry_run=False,
+        state=StateManager(tmp_path / "state.json"),
+        catalog=catalog,
+        journal=EventJournal(tmp_path / "events.jsonl"),
+    )
+    yield context
+    context.journal.close()
+    catalog.close()
+
+
+def _job(subject: str) -> MessageJob:
+    return MessageJob(uid="1", subject=subject, account="a@example.com", locator=None, stats={})
+
+
+def _message(body: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = "电子发票"
+    msg.set_content(body)
+    return msg
+
+
+def _archive(ctx: RunContext, name: str, number: str, code: str = ""):
+    fields = InvoiceFields(date="20250105", amount="12.00", invoice_number=number, invoice_code=code, parse_ok=True)
+    ctx.catalog.record(ctx.base_dir / name, fields, "餐饮发票", "0" * 64)
+
+
+def test_skips_urls_when_20_digit_number_archived(ctx):
+    _archive(ctx, "a.pdf", NUMBER_20)
+    assert _skip_archived_urls(_job(f"您的电子发票 发票号码：{NUMBER_20}"), URLS, _message("请点击链接下载"), ctx)
+    events = ctx.journal.path.read_text(encoding="utf-8")
+    assert "urls_skipped_archived" in events
+    assert NUMBER_20 in events
+
+
+def test_keeps_urls_when_number_not_archived(ctx):
+    _archive(ctx, "a.pdf", NUMBER_20)
+    other = "25442000000987654321"
+    assert not _skip_archived_urls(_job(f"发票号码：{other}"), URLS, _message("请点击链接下载"), ctx)
+
+
+def test_8_digit_number_requires_matching_code(ctx):
+    _archive(ctx, "a.pdf", "01234567", code="044002100111")
+    msg = _message("发票号码：01234567")
+    assert not _skip_archived_urls(_job("电子发票"), URLS, msg, ctx)
+    assert not _skip_archived_urls(_job("电子发票 发票代码：044002100222"), URLS, msg, ctx)
+    assert _skip_archived_urls(_job("电子发票 发票代码：044002100111"), URLS, msg, ctx)
+
+
+def test_no_catalog_never_skips(ctx):
+    ctx.catalog = None
+    assert not _skip_archived_urls(_job(f"发票号码：{NUMBER_20}"), URLS, _message(""), ctx)
@@ -0,0 +1,73 @@
+"""通知邮件中的发票链接提取与预览页直链改写"""
+
+import pytest
+
+from invoice_collector.web_handler import extract_invoice_urls, resolve_direct_urls
+
+# 全电发票开具通知：PDF/OFD/XML 三种格式的下载链接与二维码图片（HTML 属性中的 & 写作 &amp;）
+CHINATAX_HTML = """
+<html><body>
+<p>尊敬的客户：您好！您的电子发票（发票号码：25442000000123456789）已开具。</p>
+<p><a href="https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm?Wjgs=PDF&amp;Jym=8A3F&amp;Fphm=25442000000123456789&amp;Kprq=20250105120000&amp;Czsj=1736050000000">下载PDF文件</a></p>
+<p><a href="https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm?Wjgs=OFD&amp;Jym=8A3F&amp;Fphm=25442000000123456789&amp;Kprq=20250105120000&amp;Czsj=1736050000000">下载OFD文件</a></p>
+<p><a href="https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm?Wjgs=XML&amp;Jym=8A3F&amp;Fphm=25442000000123456789&amp;Kprq=20250105120000&amp;Czsj=1736050000000">下载XML文件</a></p>
+<img src="https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/qrcode.png?Fphm=25442000000123456789">
+</body></html>
+"""
+
+# 开票平台通知：发票预览页、扫码查验页、需登录的诺税通页面与平台首页
+NUONUO_HTML = """
+<div>您收到一张电子发票，金额：35.00，点击
+<a href="https://nnfp.nuonuocs.cn/invoice/scan/ab12cd34.html?paramList=0b1c&amp;v=2">查看发票</a>。
+扫码查验：<a href="https://bmjc.nuonuo.com/scan?id=ab12cd34">bmjc.nuonuo.com</a>
+<a href="https://ntf.nuonuo.com/invoice/list">诺税通</a>
+<a href="https://www.nuonuo.com/">诺诺网</a>
+<img src="https://www.nuonuo.com/static/logo.png"></div>
+"""
+
+PLAIN_TEXT = """您的发票已开具，下载地址：https://fp.baiwang.com/download/7f3e2a.pdf。
+如无法打开，请访问 https://fp.baiwang.com/download/7f3e2a.pdf 或联系客服。"""
+
+
+def test_chinatax_notification_keeps_pdf_and_ofd():
+    urls = extract_invoice_urls(CHINATAX_HTML)
+    assert urls == [
+        "https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm"
+        "?Wjgs=PDF&Jym=8A3F&Fphm=25442000000123456789&Kprq=20250105120000&Czsj=1736050000000",
+        "https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm"
+        "?Wjgs=OFD&Jym=8A3F&Fphm=25442000000123456789&Kprq=20250105120000&Czsj=1736050000000",
+    ]
+    # 已指定文件格式的导出链接本身就是直链
+    assert all(resolve_direct_urls(url) == [] for url in urls)
+
+
+def test_platform_notification_drops_qr_login_and_home_links():
+    assert extract_invoice_urls(NUONUO_HTML) == [
+        "https://nnfp.nuonuocs.cn/invoice/scan/ab12cd34.html?paramList=0b1c&v=2",
+    ]
+
+
+def test_plain_text_strips_trailing_punctuation_and_duplicates():
+    assert extract_invoice_urls(PLAIN_TEXT) == ["https://fp.baiwang.com/download/7f3e2a.pdf"]
+
+
+def test_export_link_without_format_is_rewritten():
+    url = "https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm?Jym=8A3F&Fphm=25442000000123456789"
+    assert resolve_direct_urls(url) == [
+        "https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm"
+        "?Jym=8A3F&Fphm=25442000000123456789&Wjgs=PDF",
+        "https://dppt.guangdong.chinatax.gov.cn:8443/kpfw/fpjfzz/v1/exportDzfpwjEwm"
+        "?Jym=8A3F&Fphm=25442000000123456789&Wjgs=OFD",
+    ]
+
+
+@pytest.mark.parametrize("url", [
+    "https://nnfp.nuonuocs.cn/invoice/scan/ab12cd34.html?paramList=0b1c",
+    "https://fp.baiwang.com/preview/7f3e2a",
+    "https://www.fapiao.com.cn/v/7f3e2a",
+    "https://dppt.chinatax.gov.cn/v/2_25442000000123456789_20250105120000",
+    "https://evil.example.com/kpfw/fpjfzz/v1/exportDzfpwjEwm?Fphm=1",
+])
+def test_unconfirmed_platforms_are_not_rewritten(url):
+    # 下载接口未经真实链接确认的平台交给浏览器，不猜测直链
+    assert resolve_direct_urls(url) == []